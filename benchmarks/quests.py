@@ -0,0 +1,63 @@
+"""Time the task page readers against the saved page.
+
+Compares ``QuestBot.parse`` together with ``done_today`` and ``keys_earned``,
+which is what a run used to do, against the single-pass ``QuestBot.extract``,
+for every installed HTML parser, on tests/fixtures/quests.html.
+
+    python benchmarks/quests.py [--number N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src import wicket  # noqa: E402
+from src.config import Config  # noqa: E402
+from src.modules.auth import Auth  # noqa: E402
+from src.modules.quests import QuestBot  # noqa: E402
+
+PAGE = ROOT / "tests" / "fixtures" / "quests.html"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000, help="calls per measurement")
+    args = parser.parse_args()
+
+    config = Config(username="bench", password="-")
+    bot = QuestBot(Auth(config), config)
+    html = PAGE.read_text(encoding="utf-8")
+
+    for name in wicket.available_parsers():
+        soup = wicket.parse(html, name, "quests")
+        page = bot.extract(soup)
+        separate = (bot.parse(soup), bot.done_today(soup), bot.keys_earned(soup))
+        if separate != (page.quests, (page.completed, page.allowed), page.keys_earned):
+            print(f"{name}: the readers disagree", file=sys.stderr)
+            return 1
+
+        def old():
+            bot.parse(soup)
+            bot.done_today(soup)
+            bot.keys_earned(soup)
+
+        def new():
+            bot.extract(soup)
+
+        old_us = min(timeit.repeat(old, number=args.number, repeat=5)) / args.number * 1e6
+        new_us = min(timeit.repeat(new, number=args.number, repeat=5)) / args.number * 1e6
+        print(
+            f"{name:12} parse+counters {old_us:8.1f} µs   extract {new_us:8.1f} µs"
+            f"   x{old_us / new_us:.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,17 +3,62 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import importlib.util
 import logging
+import sqlite3
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, nullcontext
+from contextvars import ContextVar
+from dataclasses import replace
+from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import urlsplit
 
-from src.bot import NeboBot
-from src.config import Config, ConfigError
+from src.bot import AsyncNeboBot, NeboBot
+from src.config import Config, ConfigError, Delays
 from src import config as config_module
+from src.modules.quests import QuestCache
+from src.scheduler import Scheduler, first_visit_delay, next_visit_delay
+from src.utils import governor, human_like, instrumentation, metrics, profiling
+from src.utils.clock import ScaledClock, get_clock, set_clock
+from src.utils.profiling import AccountProfiler
+from src.utils.state_store import AccountState, StateStore
+from src.utils.transport import SharedTransport, get_transport, set_transport
 
 logger = logging.getLogger(__name__)
 
-_LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+ENGINES = ("threads", "async")
+
+# Hosts a sped-up clock may be pointed at. Against the live site it would
+# fire requests far faster than any person.
+_LOCAL_HOSTS = frozenset({"localhost", "127.0.0.1", "::1"})
+
+_LOG_FORMAT = "%(asctime)s - %(account)s - %(name)s - %(levelname)s - %(message)s"
+
+# The account whose run is producing log lines. With several accounts playing
+# at once their lines interleave, and this is what tells them apart.
+_current_account: ContextVar[str] = ContextVar("account", default="-")
+
+
+# Where each account's time went, kept across every visit of the run.
+_account_stats: dict[str, instrumentation.RunStats] = {}
+
+# Where --metrics-file writes the metrics, if anywhere.
+_metrics_file: Path | None = None
+
+# Set by --profile.
+_profiler: AccountProfiler | None = None
+
+
+class AccountFilter(logging.Filter):
+    """Stamps every record with the account being played."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.account = _current_account.get()
+        return True
 
 
 def force_utf8_output() -> None:
@@ -54,7 +99,99 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         action="store_true",
         help="print the configured accounts and exit",
     )
-    return parser.parse_args(argv)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=positive_int,
+        metavar="N",
+        help="play up to N accounts at once (default: one after another on threads, "
+        "every account at once on the async engine)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="threads",
+        help="run accounts in threads, or as coroutines on one event loop, which "
+        "scales to thousands of accounts and needs aiohttp (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and visit each account when its task cooldown ends",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=positive_float,
+        default=1.0,
+        metavar="FACTOR",
+        help="run the bot's clock FACTOR times faster: pauses, session limits, active "
+        "hours and daemon timers alike; only against a local stand-in",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=positive_int,
+        metavar="PORT",
+        help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="write Prometheus metrics to PATH after every account, for a textfile collector",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="profile each account's CPU use, pauses left out, into a .pstats file in DIR",
+    )
+    parser.add_argument(
+        "--trace-malloc",
+        action="store_true",
+        help="with --profile, also report the lines that allocated the most memory",
+    )
+    archive = parser.add_mutually_exclusive_group()
+    archive.add_argument(
+        "--record",
+        metavar="DIR",
+        help="write each account's HTTP traffic to an archive in DIR; bodies are read whole, "
+        "so maze_stream does not cut pages short while recording",
+    )
+    archive.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="play each account from its archive in DIR instead of the site, without pauses",
+    )
+    args = parser.parse_args(argv)
+    if args.workers is None and args.engine == "threads":
+        args.workers = 1
+    if args.daemon and args.login_only:
+        parser.error("--daemon and --login-only cannot be combined")
+    if args.daemon and args.engine != "threads":
+        parser.error("--daemon runs on the threads engine")
+    if (args.record or args.replay) and (args.daemon or args.engine != "threads"):
+        parser.error("--record and --replay work with single runs on the threads engine")
+    if args.trace_malloc and not args.profile:
+        parser.error("--trace-malloc needs --profile DIR to write its reports to")
+    if args.profile and args.engine != "threads":
+        parser.error("--profile works on the threads engine")
+    if args.profile and args.workers > 1 and not profiling.PER_THREAD:
+        parser.error("--profile needs --workers 1 from Python 3.12, as cProfile sees every thread")
+    return args
+
+
+def positive_int(value: str) -> int:
+    """Argument type for counts that must be at least one."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
+def positive_float(value: str) -> float:
+    """Argument type for factors that must be above zero."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be above 0, got {value}")
+    return number
 
 
 def select_accounts(configs: list[Config], wanted: list[str] | None) -> list[Config]:
@@ -82,32 +219,272 @@ def select_accounts(configs: list[Config], wanted: list[str] | None) -> list[Con
     return [config for config in configs if config.username in set(wanted)]
 
 
-def run_account(config: Config, login_only: bool) -> bool:
+def is_local(base_url: str) -> bool:
+    """Whether a site root is on this machine."""
+    return urlsplit(base_url).hostname in _LOCAL_HOSTS
+
+
+def archive_mode(config: Config, record: str | None, replay: str | None) -> Config:
+    """Apply ``--record`` or ``--replay`` to an account's configuration.
+
+    A replay has to make the same requests the recording did, so neither
+    may resume a saved session or serve the task page from the state store:
+    a recording that skipped the login or the page could not be replayed
+    by a run that does not. A replay also measures the bot's own work, so it
+    runs without pauses, and does not wait for the active hours on the
+    strength of traffic that happened earlier.
+    """
+    if replay:
+        return replace(
+            config,
+            http_replay=replay,
+            delays=Delays(0, 0, 0, 0, long_pause_chance=0, long_pause_min=0, long_pause_max=0),
+            cookie_dir=None,
+            state_db=None,
+            active_hours=None,
+            session_max_minutes=0,
+        )
+    if record:
+        return replace(config, http_record=record, cookie_dir=None, state_db=None)
+    return config
+
+
+def account_stats(username: str) -> instrumentation.RunStats:
+    """The timings collected for an account so far this run."""
+    return _account_stats.setdefault(username, instrumentation.RunStats())
+
+
+def log_timings() -> None:
+    """Log where each account's time went: network, parsing or pauses."""
+    if not _account_stats:
+        return
+    logger.info("--- timings ---")
+    for name, stats in _account_stats.items():
+        logger.info("%-20s %s", name, stats.summary())
+        for line in stats.endpoint_lines():
+            logger.info("%-20s   %s", "", line)
+
+
+def publish_metrics() -> None:
+    """Write the metrics to the --metrics-file, if one was given."""
+    if _metrics_file is None:
+        return
+    try:
+        metrics.write_textfile(_metrics_file)
+    except OSError as exc:
+        logger.warning("Could not write metrics to %s: %s", _metrics_file, exc)
+
+
+def note_run(username: str, seconds: float) -> None:
+    """Record a finished run in the metrics and publish them."""
+    metrics.RUN_SECONDS.set(seconds, username)
+    metrics.RUN_FINISHED.set(get_clock().time(), username)
+    publish_metrics()
+
+
+def profiled(username: str) -> AbstractContextManager[None]:
+    """Profile an account's run when --profile asked for it."""
+    return _profiler.profiling(username) if _profiler is not None else nullcontext()
+
+
+def run_account(config: Config, login_only: bool, bot: NeboBot | None = None) -> bool:
     """Play one account from login to logout.
 
     Failures are contained here: with thirty accounts queued, one broken login
     must not take the rest of the run down with it.
 
+    Args:
+        config: The account to play.
+        login_only: Stop after checking that the login works.
+        bot: Bot to play it with, for callers that read its state afterwards.
+            A fresh one is created when omitted.
+
     Returns:
         True if the account finished what it was asked to do.
     """
+    token = _current_account.set(config.username)
     logger.info("=== %s ===", config.username)
-    bot = NeboBot(config)
-    try:
-        if not bot.start():
-            logger.error("%s: login failed", config.username)
+    started = time.perf_counter()
+    measured = instrumentation.measuring(account_stats(config.username))
+    with measured, profiled(config.username), governor.acting_for(config.username):
+        bot = bot or NeboBot(config)
+        try:
+            if not bot.start():
+                logger.error("%s: login failed", config.username)
+                return False
+            if login_only:
+                logger.info("%s: login check succeeded", config.username)
+                return True
+            return bot.run()
+        except KeyboardInterrupt:
+            raise
+        except Exception:
+            logger.exception("%s: unexpected error", config.username)
             return False
-        if login_only:
-            logger.info("%s: login check succeeded", config.username)
-            return True
-        return bot.run()
+        finally:
+            bot.stop()
+            note_run(config.username, time.perf_counter() - started)
+            _current_account.reset(token)
+
+
+def run_accounts(configs: list[Config], login_only: bool, workers: int) -> dict[str, bool]:
+    """Play every account, up to ``workers`` of them at a time.
+
+    Accounts spend almost all their time in deliberate pauses, so running
+    them side by side costs next to nothing, and the whole run takes about as
+    long as its slowest account rather than the sum of them all.
+
+    Returns:
+        Whether each account succeeded, in configuration order.
+    """
+    if workers == 1 or len(configs) == 1:
+        results: dict[str, bool] = {}
+        for position, config in enumerate(configs, start=1):
+            logger.info("Account %d of %d", position, len(configs))
+            results[config.username] = run_account(config, login_only)
+        return results
+
+    logger.info("Playing up to %d account(s) at once", workers)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="account")
+    try:
+        futures = {
+            config.username: pool.submit(run_account, config, login_only) for config in configs
+        }
+        return {name: future.result() for name, future in futures.items()}
     except KeyboardInterrupt:
+        # Only this thread saw Ctrl-C. Wake the workers out of their pauses
+        # and drop the accounts that have not started yet.
+        human_like.interrupt()
         raise
-    except Exception:
-        logger.exception("%s: unexpected error", config.username)
-        return False
     finally:
-        bot.stop()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def stored_state(config: Config) -> AccountState | None:
+    """What the state store remembers of an account, without any request."""
+    if not config.state_db:
+        return None
+    try:
+        return StateStore(config.state_db).account(config.username)
+    except sqlite3.Error as exc:
+        logger.warning("%s: could not read the state store: %s", config.username, exc)
+        return None
+
+
+def describe_account(config: Config) -> str:
+    """One line of ``--list-accounts``: settings, then remembered state."""
+    line = f"{config.username}\t{config.maze_rounds} maze(s)"
+    state = stored_state(config)
+    if state is None:
+        return line
+    if state.keys_left is not None:
+        line += f"\t{state.keys_left} keys"
+    if state.next_available_at is not None:
+        unlocks = datetime.fromtimestamp(state.next_available_at)
+        line += f"\tnext task {unlocks:%d.%m %H:%M}"
+    return line
+
+
+def run_daemon(configs: list[Config], workers: int) -> None:
+    """Visit accounts as their cooldowns end, until interrupted.
+
+    Each account sits in a :class:`~src.scheduler.Scheduler` keyed by its next
+    useful wake time. The main thread sleeps until the earliest is due and
+    hands it to the pool, and the visit puts the account back with the wake
+    time its task page asked for.
+    """
+    scheduler: Scheduler[Config] = Scheduler()
+    for config in configs:
+        scheduler.schedule(config, first_visit_delay(config, stored_state(config)))
+    # One task page cache per state file for the whole process, so a visit
+    # finds what the last one read in memory, and each file is set up once.
+    caches: dict[str | None, QuestCache] = {}
+    for config in configs:
+        if config.state_db not in caches:
+            store = StateStore(config.state_db) if config.state_db else None
+            caches[config.state_db] = QuestCache(store)
+
+    def visit(config: Config) -> None:
+        # Without a bot, or without a task page read, the account comes back
+        # after the usual interval; an account never drops off the schedule.
+        bot: NeboBot | None = None
+        try:
+            bot = NeboBot(config, caches[config.state_db])
+            run_account(config, False, bot)
+        except Exception:
+            logger.exception("%s: visit failed", config.username)
+        finally:
+            delay = next_visit_delay(config, bot.quest_wait if bot is not None else None)
+            scheduler.schedule(config, delay)
+            logger.info(
+                "%s: next visit at %s",
+                config.username,
+                (get_clock().now() + timedelta(seconds=delay)).strftime("%d.%m %H:%M"),
+            )
+
+    logger.info("Daemon started with %d account(s), up to %d at once", len(configs), workers)
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="account")
+    try:
+        while True:
+            pool.submit(visit, scheduler.next_due())
+    except KeyboardInterrupt:
+        human_like.interrupt()
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+async def run_account_async(config: Config, login_only: bool) -> bool:
+    """Play one account on the event loop; see :func:`run_account`."""
+    token = _current_account.set(config.username)
+    logger.info("=== %s ===", config.username)
+    started = time.perf_counter()
+    measured = instrumentation.measuring(account_stats(config.username))
+    with measured, governor.acting_for(config.username):
+        bot = AsyncNeboBot(config)
+        try:
+            if not await bot.start():
+                logger.error("%s: login failed", config.username)
+                return False
+            if login_only:
+                logger.info("%s: login check succeeded", config.username)
+                return True
+            return await bot.run()
+        except Exception:
+            logger.exception("%s: unexpected error", config.username)
+            return False
+        finally:
+            await bot.stop()
+            note_run(config.username, time.perf_counter() - started)
+            _current_account.reset(token)
+
+
+async def run_accounts_async(
+    configs: list[Config], login_only: bool, workers: int
+) -> dict[str, bool]:
+    """Play every account as a coroutine, up to ``workers`` of them at a time.
+
+    One thread and one event loop carry every account, so ``workers`` can be
+    in the thousands: a waiting account costs a timer and a socket, not a
+    thread.
+
+    Returns:
+        Whether each account succeeded, in configuration order.
+    """
+    logger.info("Playing up to %d account(s) at once on the event loop", workers)
+    slots = asyncio.Semaphore(workers)
+
+    async def play(config: Config) -> bool:
+        async with slots:
+            return await run_account_async(config, login_only)
+
+    try:
+        results = await asyncio.gather(*(play(config) for config in configs))
+    finally:
+        shared = get_transport()
+        if shared is not None:
+            await shared.aclose()
+    return {config.username: ok for config, ok in zip(configs, results)}
 
 
 def setup_logging(config: Config) -> None:
@@ -123,6 +500,9 @@ def setup_logging(config: Config) -> None:
         log_path.parent.mkdir(parents=True, exist_ok=True)
         handlers.append(logging.FileHandler(log_path, encoding="utf-8"))
 
+    for handler in handlers:
+        handler.addFilter(AccountFilter())
+
     logging.basicConfig(level=config.numeric_log_level, format=_LOG_FORMAT, handlers=handlers)
 
 
@@ -146,26 +526,98 @@ def main(argv: list[str] | None = None) -> int:
 
     if args.list_accounts:
         for config in configs:
-            print(f"{config.username}	{config.maze_rounds} maze(s)")
+            print(describe_account(config))
         return 0
 
+    configs = [archive_mode(config, args.record, args.replay) for config in configs]
+    # A coroutine waiting out a pause costs next to nothing, so the async
+    # engine plays every account at once unless told otherwise.
+    if args.workers is None:
+        args.workers = len(configs)
+
+    if args.time_scale != 1:
+        remote = [config.base_url for config in configs if not is_local(config.base_url)]
+        if remote:
+            print(
+                f"Configuration error: --time-scale only runs against a local stand-in, "
+                f"not {remote[0]}",
+                file=sys.stderr,
+            )
+            return 1
+        set_clock(ScaledClock(args.time_scale))
+
+    if args.engine == "async" and importlib.util.find_spec("aiohttp") is None:
+        print(
+            "Configuration error: --engine async needs aiohttp (pip install aiohttp)",
+            file=sys.stderr,
+        )
+        return 1
+
     # Logging settings come from the first account; they are global anyway.
     setup_logging(configs[0])
     logger.info("Running %d account(s)", len(configs))
+    if args.time_scale != 1:
+        logger.info("The clock runs %g times faster than real time", args.time_scale)
 
-    results: dict[str, bool] = {}
+    # One pool of connections for every account; each keeps its own cookies.
+    first = configs[0]
     try:
-        for position, config in enumerate(configs, start=1):
-            logger.info("Account %d of %d", position, len(configs))
-            results[config.username] = run_account(config, args.login_only)
+        limits = governor.from_settings(
+            first.http_rate_limit, first.http_max_in_flight, first.http_rate_file
+        )
+    except OSError as exc:
+        logger.error("Could not share the rate limit through %s: %s", first.http_rate_file, exc)
+        return 1
+    if limits is not None:
+        logger.info(
+            "Fleet limits: %s request(s)/s, %s in flight",
+            f"{first.http_rate_limit:g}" if first.http_rate_limit else "any",
+            first.http_max_in_flight or "any",
+        )
+    set_transport(
+        SharedTransport(first.http_pool_size or args.workers, first.http_retries, limits)
+    )
+
+    global _metrics_file, _profiler
+    _metrics_file = Path(args.metrics_file) if args.metrics_file else None
+    if args.profile:
+        try:
+            _profiler = AccountProfiler(args.profile, trace_malloc=args.trace_malloc)
+        except OSError as exc:
+            logger.error("Could not write profiles to %s: %s", args.profile, exc)
+            return 1
+    if args.metrics_port:
+        try:
+            metrics.serve(args.metrics_port)
+        except OSError as exc:
+            logger.error("Could not serve metrics on port %d: %s", args.metrics_port, exc)
+            return 1
+
+    if args.daemon:
+        try:
+            run_daemon(configs, args.workers)
+        except KeyboardInterrupt:
+            logger.info("Received shutdown signal")
+        log_timings()
+        return 130
+
+    started = time.process_time()
+    try:
+        if args.engine == "async":
+            results = asyncio.run(run_accounts_async(configs, args.login_only, args.workers))
+        else:
+            results = run_accounts(configs, args.login_only, args.workers)
     except KeyboardInterrupt:
         logger.info("Received shutdown signal")
         return 130
+    if args.replay:
+        logger.info("Replay took %.3f s of CPU", time.process_time() - started)
 
     if len(configs) > 1:
         logger.info("--- summary ---")
         for name, ok in results.items():
             logger.info("%-20s %s", name, "ok" if ok else "FAILED")
+    log_timings()
 
     succeeded = sum(results.values())
     logger.info("Finished: %d of %d account(s) succeeded", succeeded, len(results))
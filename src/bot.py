@@ -3,16 +3,23 @@
 from __future__ import annotations
 
 import logging
+import sqlite3
+from functools import partial
 from pathlib import Path
 
 import requests
+from requests.cookies import RequestsCookieJar
 
 from . import config as config_module
 from .config import Config
-from .modules.auth import Auth
-from .modules.maze import MazeBot
-from .modules.quests import QuestBot
-from .utils.human_like import within_active_hours
+from .modules.auth import AsyncAuth, Auth
+from .modules.maze import AsyncMazeBot, MazeBot
+from .modules.quests import AsyncQuestBot, QuestBot, QuestCache
+from .utils import flows, http_archive
+from .utils.cookie_store import CookieStore
+from .utils.flows import Flow
+from .utils.human_like import winding_down, within_active_hours
+from .utils.state_store import RunRecord, StateStore
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +27,10 @@ logger = logging.getLogger(__name__)
 class NeboBot:
     """Runs the enabled features against an authenticated session.
 
+    Attributes:
+        quest_wait: Minutes until the soonest task unlocks, as the last
+            :meth:`run` read it, or None if it could not tell.
+
     Example:
         bot = NeboBot('config/config.yml')
         if bot.start():
@@ -27,32 +38,110 @@ class NeboBot:
         bot.stop()
     """
 
-    def __init__(self, config: str | Path | Config = "config/config.yml"):
+    # What each module is built as; the async engine swaps in its own.
+    _auth_type: type[Auth] = Auth
+    _maze_type: type[MazeBot] = MazeBot
+    _quests_type: type[QuestBot] = QuestBot
+
+    def __init__(
+        self,
+        config: str | Path | Config = "config/config.yml",
+        quest_cache: QuestCache | None = None,
+    ):
         """Prepare the modules for one account.
 
         Args:
             config: An already-loaded Config, or the path of a YAML file to
                 read one from. Passing a Config is what lets a single file
                 drive one bot per account.
+            quest_cache: Task page cache to share with other bots, whose
+                state store this bot then writes to as well. It must be for
+                the configured ``state_db``. A fresh one when omitted.
 
         Raises:
             ConfigError: If the configuration is missing or invalid. Raised
                 rather than exiting, so callers decide how to handle it.
         """
         self.config: Config = config if isinstance(config, Config) else config_module.load(config)
-        self.auth = Auth(self.config)
-        self.maze = MazeBot(self.auth, self.config)
-        self.quests = QuestBot(self.auth, self.config)
+        self.auth = self._auth_type(self.config)
+        self.maze = self._maze_type(self.auth, self.config)
+        self.quests = self._quests_type(self.auth, self.config)
+        self.quest_wait: int | None = None
+        if quest_cache is None:
+            state = StateStore(self.config.state_db) if self.config.state_db else None
+            quest_cache = QuestCache(state)
+        self.state = quest_cache.store
+        self.quests.cache = quest_cache
+        self.cookies: CookieStore | None = None
+        if self.config.cookie_dir:
+            self.cookies = CookieStore(
+                self.config.cookie_dir,
+                self.config.base_url,
+                self.config.username,
+                self.config.cookie_max_age_minutes,
+            )
+        self.replayer: http_archive.HttpReplayer | None = None
         logger.debug("Bot initialised for %s", self.config.base_url)
 
     def start(self) -> bool:
-        """Authenticate.
+        """Authenticate, resuming the previous run's session when possible.
+
+        A saved session costs one check of ``/home`` to confirm, against the
+        login page, the form post and its check for a fresh login.
 
         Returns:
             True if the session is ready for use.
         """
+        return flows.run(self._start())
+
+    def _start(self) -> Flow[bool]:
+        """The steps of :meth:`start`."""
         logger.info("Starting bot")
-        return self.auth.login()
+        if not self._open_archive():
+            return False
+
+        if self.cookies is not None and self._load_session(self.cookies):
+            if (yield partial(self.auth.is_authenticated, probe=True)):
+                logger.info("Resumed the saved session")
+                return True
+            logger.info("Saved session has expired; logging in")
+            self._clear_session()
+            self.cookies.clear()
+
+        return (yield self.auth.login)
+
+    def _load_session(self, cookies: CookieStore) -> bool:
+        """Put the saved session's cookies on the session, if there is one."""
+        return cookies.load(self.auth.session.cookies)
+
+    def _session_cookies(self) -> RequestsCookieJar:
+        """The session's cookies, for the cookie store to save."""
+        return self.auth.session.cookies
+
+    def _clear_session(self) -> None:
+        """Forget every cookie the session holds."""
+        self.auth.session.cookies.clear()
+
+    def _open_archive(self) -> bool:
+        """Put the session on a recording or a replay, if one was asked for.
+
+        Returns:
+            False if the archive to replay cannot be read.
+        """
+        config = self.config
+        if config.http_replay:
+            path = http_archive.archive_path(config.http_replay, config.username)
+            try:
+                self.replayer = http_archive.replay(self.auth.session, path)
+            except http_archive.ArchiveError as exc:
+                logger.error("Cannot replay: %s", exc)
+                return False
+            logger.info("Replaying %s", path)
+        elif config.http_record:
+            path = http_archive.archive_path(config.http_record, config.username)
+            http_archive.record(self.auth.session, path, config.base_url)
+            logger.info("Recording to %s", path)
+        return True
 
     def run(self) -> bool:
         """Run the enabled features once.
@@ -60,27 +149,66 @@ class NeboBot:
         Returns:
             True if every feature that ran succeeded.
         """
-        if not within_active_hours(self.config.active_hours):
-            start, end = self.config.active_hours  # type: ignore[misc]
-            logger.info(
-                "Outside the configured active hours (%s-%s); nothing to do",
-                start.strftime("%H:%M"),
-                end.strftime("%H:%M"),
-            )
+        return flows.run(self._run())
+
+    def _run(self) -> Flow[bool]:
+        """The steps of :meth:`run`."""
+        if self._outside_active_hours():
             return True
 
-        if not self.auth.is_authenticated():
+        self._begin_record()
+        ok = False
+        try:
+            ok = yield from self._play()
+        finally:
+            self._save_record(ok)
+        return ok
+
+    def _play(self) -> Flow[bool]:
+        """Play the features against the session."""
+        if not (yield self.auth.is_authenticated):
             logger.error("Cannot run features without an authenticated session")
             return False
 
         # Keys come from the personal tasks, and the maze only spends them, so
         # report that state before playing.
         try:
-            self.quests.report()
+            self.quest_wait = self.quests.next_available_in((yield self.quests.report))
         except requests.RequestException as exc:
             logger.warning("Could not read the task page: %s", exc)
 
-        completed = self.maze.solve()
+        return self._judge((yield self.maze.solve))
+
+    def _begin_record(self) -> None:
+        """Give the modules a fresh record to note what they see in."""
+        if self.state is not None:
+            self.quests.record = self.maze.record = RunRecord(self.config.username)
+
+    def _save_record(self, ok: bool) -> None:
+        """Write the run's record, if one is being kept."""
+        record = self.maze.record
+        if self.state is None or record is None:
+            return
+        record.quest_wait = self.quest_wait
+        try:
+            self.state.write(record, ok)
+        except sqlite3.Error as exc:
+            logger.warning("Could not record the run: %s", exc)
+
+    def _outside_active_hours(self) -> bool:
+        """Whether the configured hours forbid playing now, logging if so."""
+        if within_active_hours(self.config.active_hours):
+            return False
+        start, end = self.config.active_hours  # type: ignore[misc]
+        logger.info(
+            "Outside the configured active hours (%s-%s); nothing to do",
+            start.strftime("%H:%M"),
+            end.strftime("%H:%M"),
+        )
+        return True
+
+    def _judge(self, completed: int) -> bool:
+        """Whether a solve that completed this many mazes did its job."""
         wanted = self.config.maze_rounds
         if wanted:
             logger.info("Completed %d of %d maze(s)", completed, wanted)
@@ -91,11 +219,84 @@ class NeboBot:
     def stop(self) -> None:
         """Log out and release the session.
 
-        Safe to call even if :meth:`start` failed or was never called.
+        With a cookie store the session is saved for the next run instead of
+        ended, which is the whole point of keeping it.
+
+        Safe to call even if :meth:`start` failed or was never called, and
+        after the run was interrupted: the logout's pauses are skipped then,
+        not raised.
         """
+        flows.run(self._stop())
+
+    def _stop(self) -> Flow[None]:
+        """The steps of :meth:`stop`."""
         logger.info("Stopping bot")
 
-        if not self.auth.logout():
-            logger.warning("Logout did not complete cleanly")
+        if self.cookies is not None and self.auth.authenticated:
+            try:
+                self.cookies.save(self._session_cookies())
+                logger.info("Kept the session for the next run")
+            except OSError as exc:
+                logger.warning("Could not save the session: %s", exc)
+        else:
+            with winding_down():
+                logged_out = yield self.auth.logout
+            if not logged_out:
+                logger.warning("Logout did not complete cleanly")
+            if self.cookies is not None:
+                self.cookies.clear()
+
+        if self.replayer is not None:
+            logger.info("Replayed %d recorded response(s)", self.replayer.served)
+        # Also finishes a recording's archive.
+        yield self.auth.session.close
+
+
+class AsyncNeboBot(NeboBot):
+    """:class:`NeboBot` for the async engine.
+
+    Every account is a coroutine rather than a thread: its pauses and its
+    requests are waits on a shared event loop, so thousands of accounts cost
+    a few kilobytes of coroutine state each instead of a thread stack apiece.
+    The steps are :class:`NeboBot`'s own; only the modules they call wait on
+    the loop.
+
+    Has to be created inside a running event loop.
+
+    Example:
+        bot = AsyncNeboBot(config)
+        if await bot.start():
+            await bot.run()
+        await bot.stop()
+    """
+
+    _auth_type = AsyncAuth
+    _maze_type = AsyncMazeBot
+    _quests_type = AsyncQuestBot
+
+    auth: AsyncAuth
+
+    async def start(self) -> bool:
+        """Authenticate, resuming a saved session; see :meth:`NeboBot.start`."""
+        return await flows.arun(self._start())
+
+    async def run(self) -> bool:
+        """Run the enabled features once; see :meth:`NeboBot.run`."""
+        return await flows.arun(self._run())
+
+    async def stop(self) -> None:
+        """Log out or keep the session; see :meth:`NeboBot.stop`."""
+        await flows.arun(self._stop())
+
+    def _load_session(self, cookies: CookieStore) -> bool:
+        saved = RequestsCookieJar()
+        if not cookies.load(saved):
+            return False
+        self.auth.session.import_cookies(saved, self.config.base_url)
+        return True
+
+    def _session_cookies(self) -> RequestsCookieJar:
+        return self.auth.session.export_cookies()
 
-        self.auth.session.close()
+    def _clear_session(self) -> None:
+        self.auth.session.clear_cookies()
@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import importlib.util
 import logging
 from dataclasses import dataclass
 from datetime import datetime, time
@@ -10,8 +11,18 @@ from typing import Any
 
 import yaml
 
+from .wicket import AUTO_PARSER, PARSERS
+
 _VALID_LOG_LEVELS = frozenset({"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"})
 
+# How maze pages are read: "dom" parses every page, "scan" reads door pages
+# straight from the markup and parses only what it cannot read, and "verify"
+# does both and counts disagreements.
+_MAZE_READERS = ("dom", "scan", "verify")
+
+# Packages the HTML parsers in wicket.PARSERS come from, when not the stdlib.
+_PARSER_PACKAGES = {"lxml": "lxml"}
+
 
 class ConfigError(Exception):
     """Raised when the configuration file is missing, malformed or incomplete."""
@@ -74,7 +85,9 @@ class Config:
         username: In-game name used to log in.
         password: Account password.
         base_url: Site root, without a trailing slash.
-        timeout: Per-request timeout in seconds.
+        timeout: Longest a request may take to connect or to go quiet, in
+            seconds. With a shared transport, tighter timeouts are learned
+            below it from how fast each page answers.
         delays: Timing envelope for pacing requests.
         log_level: Logging level name.
         log_file: Path of the log file, or None to log to stdout only.
@@ -87,6 +100,39 @@ class Config:
             can do.
         active_hours: Window during which the bot may play, as
             ``(start, end)``, or None to allow any time. May span midnight.
+        parser: HTML parser backend, ``"auto"`` for the fastest installed.
+        maze_reader: ``"dom"`` to parse every maze page, ``"scan"`` to read
+            door pages straight from the markup, ``"verify"`` to do both and
+            count disagreements.
+        maze_stream: Read maze pages only as far as a step needs and stop
+            downloading there, instead of fetching them whole.
+        cookie_dir: Directory where the session is kept between runs, or
+            None to log in and out every run.
+        cookie_max_age_minutes: How old a kept session may be and still be
+            worth trying to resume.
+        state_db: SQLite file where each account's state is kept between
+            runs, or None to keep nothing.
+        quest_cache_minutes: How long a read of the task page is trusted
+            while tasks are in progress. Pages where everything is cooling
+            down are trusted until the first countdown ends regardless.
+        daemon_interval_minutes: In daemon mode, how soon to come back when
+            the task page gives no countdown to wait for.
+        http_pool_size: Connections to the site kept open and shared by
+            every account in the process, or 0 for one per worker. Read from
+            the first account only, like the logging settings.
+        http_retries: Most times a failed read of ``/home`` or ``/quests`` is
+            sent again, 0 for never. Read from the first account only.
+        http_rate_limit: Requests per second allowed for every account
+            together, 0 for no ceiling. Read from the first account only.
+        http_max_in_flight: Requests allowed to wait on the site at once,
+            across every account, 0 for no limit. Read from the first account
+            only.
+        http_rate_file: File that processes sharing one rate limit keep it
+            in, or None to keep it per process.
+        http_record: Directory to write each run's HTTP archive to, or None.
+            Set by ``--record`` rather than the file.
+        http_replay: Directory to replay HTTP archives from instead of
+            using the network, or None. Set by ``--replay``.
     """
 
     username: str
@@ -101,6 +147,21 @@ class Config:
     maze_max_attempts: int = 0
     session_max_minutes: int = 0
     active_hours: tuple[time, time] | None = None
+    parser: str = "auto"
+    maze_reader: str = "dom"
+    maze_stream: bool = False
+    cookie_dir: str | None = None
+    cookie_max_age_minutes: int = 30
+    state_db: str | None = None
+    quest_cache_minutes: int = 30
+    daemon_interval_minutes: int = 60
+    http_pool_size: int = 0
+    http_retries: int = 2
+    http_rate_limit: float = 0.0
+    http_max_in_flight: int = 0
+    http_rate_file: str | None = None
+    http_record: str | None = None
+    http_replay: str | None = None
 
     @property
     def numeric_log_level(self) -> int:
@@ -222,9 +283,7 @@ def _from_mapping(raw: dict[str, Any], path: Path) -> Config:
             f"'log_level' must be one of {sorted(_VALID_LOG_LEVELS)}, got {log_level!r}"
         )
 
-    log_file = raw.get("log_file", "logs/nebo_bot.log")
-    if log_file is not None and not isinstance(log_file, str):
-        raise ConfigError("'log_file' must be a string or empty")
+    log_file = _optional_path(raw, "log_file", "logs/nebo_bot.log")
 
     delays = Delays(
         min_seconds=_number(raw, "delay_min", 1.5),
@@ -243,12 +302,25 @@ def _from_mapping(raw: dict[str, Any], path: Path) -> Config:
         timeout=int(_number(raw, "timeout", 30)),
         delays=delays,
         log_level=log_level,
-        log_file=log_file or None,
+        log_file=log_file,
         maze_target_level=int(_number(raw, "maze_target_level", 10)),
         maze_rounds=int(_number(raw, "maze_rounds", 1)),
         maze_max_attempts=int(_number(raw, "maze_max_attempts", 0)),
         session_max_minutes=int(_number(raw, "session_max_minutes", 0)),
         active_hours=_active_hours(raw.get("active_hours")),
+        parser=_parser(raw.get("parser", "auto")),
+        maze_reader=_maze_reader(raw.get("maze_reader", "dom")),
+        maze_stream=_flag(raw, "maze_stream", False),
+        cookie_dir=_optional_path(raw, "cookie_dir"),
+        cookie_max_age_minutes=_at_least(raw, "cookie_max_age_minutes", 30),
+        state_db=_optional_path(raw, "state_db"),
+        quest_cache_minutes=_at_least(raw, "quest_cache_minutes", 30),
+        daemon_interval_minutes=_at_least(raw, "daemon_interval_minutes", 60, minimum=1),
+        http_pool_size=_at_least(raw, "http_pool_size", 0),
+        http_retries=_at_least(raw, "http_retries", 2),
+        http_rate_limit=_at_least(raw, "http_rate_limit", 0, kind=float),
+        http_max_in_flight=_at_least(raw, "http_max_in_flight", 0),
+        http_rate_file=_optional_path(raw, "http_rate_file"),
     )
 
 
@@ -280,9 +352,62 @@ def _active_hours(value: Any) -> tuple[time, time] | None:
     return start, end
 
 
+def _parser(value: Any) -> str:
+    """Validate the HTML parser choice.
+
+    Checked here rather than on first use, so a missing package is reported at
+    startup instead of as a markup error halfway through a login.
+
+    Raises:
+        ConfigError: If the parser is unknown or its package is not installed.
+    """
+    name = str(value or AUTO_PARSER)
+    if name != AUTO_PARSER and name not in PARSERS:
+        raise ConfigError(f"'parser' must be one of {[AUTO_PARSER, *PARSERS]}, got {name!r}")
+    package = _PARSER_PACKAGES.get(name)
+    if package and importlib.util.find_spec(package) is None:
+        raise ConfigError(f"'parser' {name!r} needs the {package} package: pip install {package}")
+    return name
+
+
+def _maze_reader(value: Any) -> str:
+    """Validate the maze page reader choice."""
+    if value not in _MAZE_READERS:
+        raise ConfigError(f"'maze_reader' must be one of {list(_MAZE_READERS)}, got {value!r}")
+    return value
+
+
+def _optional_path(raw: dict[str, Any], key: str, default: str | None = None) -> str | None:
+    """Read an optional path, where empty means unset."""
+    value = raw.get(key, default)
+    if value is not None and not isinstance(value, str):
+        raise ConfigError(f"'{key}' must be a string or empty")
+    return value or None
+
+
+def _flag(raw: dict[str, Any], key: str, default: bool) -> bool:
+    """Read a yes/no setting."""
+    value = raw.get(key, default)
+    if not isinstance(value, bool):
+        raise ConfigError(f"'{key}' must be true or false, got {value!r}")
+    return value
+
+
 def _number(raw: dict[str, Any], key: str, default: float) -> float:
     """Read a numeric option, falling back to a default when absent."""
     value = raw.get(key, default)
     if isinstance(value, bool) or not isinstance(value, (int, float)):
         raise ConfigError(f"'{key}' must be a number, got {value!r}")
     return float(value)
+
+
+def _at_least(
+    raw: dict[str, Any], key: str, default: float, minimum: float = 0, kind: type = int
+) -> Any:
+    """Read a numeric option as ``kind``, refusing values below ``minimum``."""
+    value = kind(_number(raw, key, default))
+    if value < minimum:
+        if minimum == 0:
+            raise ConfigError(f"'{key}' cannot be negative, got {value:g}")
+        raise ConfigError(f"'{key}' must be at least {minimum:g}, got {value:g}")
+    return value
@@ -0,0 +1,80 @@
+"""What the bot knows about an account's tasks, apart from how it learns it.
+
+The task page reader produces these and the state store keeps them; neither
+needs the other to use them.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+
+from .utils.clock import get_clock
+
+
+@dataclass(frozen=True)
+class Quest:
+    """One personal task.
+
+    Attributes:
+        name: Task title, e.g. "Инкассатор".
+        description: What it asks for.
+        done: Progress so far, 0 while on cooldown.
+        total: Target, 0 while on cooldown.
+        minutes_left: Minutes until it becomes available, or None if active.
+        paid: Whether it requires topping up with real money.
+    """
+
+    name: str
+    description: str
+    done: int = 0
+    total: int = 0
+    minutes_left: int | None = None
+    paid: bool = False
+
+    @property
+    def on_cooldown(self) -> bool:
+        """Whether the task is waiting rather than in progress."""
+        return self.minutes_left is not None
+
+    @property
+    def complete(self) -> bool:
+        """Whether the target has been reached."""
+        return not self.on_cooldown and self.total > 0 and self.done >= self.total
+
+    @property
+    def remaining(self) -> int:
+        """How much is still needed to finish it."""
+        return max(0, self.total - self.done) if not self.on_cooldown else 0
+
+
+@dataclass(frozen=True)
+class QuestSnapshot:
+    """What the task page said at one moment, and for how long it holds.
+
+    Attributes:
+        quests: Every task listed, countdowns as of ``taken_at``.
+        completed: Tasks done today.
+        allowed: Tasks allowed per day, 0 if not shown.
+        keys_earned: Keys the tasks have produced, if shown.
+        taken_at: When the page was read, as a Unix time.
+        expires_at: When the page may start saying something different.
+    """
+
+    quests: tuple[Quest, ...]
+    completed: int
+    allowed: int
+    keys_earned: int | None
+    taken_at: float
+    expires_at: float
+
+    def current_quests(self, now: float | None = None) -> list[Quest]:
+        """The tasks with their countdowns moved on to ``now``."""
+        if now is None:
+            now = get_clock().time()
+        elapsed = int((now - self.taken_at) // 60)
+        return [
+            replace(quest, minutes_left=max(0, quest.minutes_left - elapsed))
+            if quest.on_cooldown
+            else quest
+            for quest in self.quests
+        ]
@@ -3,11 +3,16 @@
 from __future__ import annotations
 
 import logging
+from functools import partial
+from urllib.parse import urlsplit
 
 import requests
 
 from .. import wicket
 from ..config import Config
+from ..utils import flows, instrumentation, metrics, transport
+from ..utils.async_http import ACCEPT_ENCODING, AsyncClient
+from ..utils.flows import Flow
 from ..utils.human_like import HumanBehavior
 
 logger = logging.getLogger(__name__)
@@ -21,9 +26,23 @@ _DEFAULT_HEADERS = {
     ),
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
     "Accept-Language": "ru-RU,ru;q=0.9,uk;q=0.8,en;q=0.7",
+    # Pages compress to a fraction of their size. Offered for every encoding
+    # urllib3 can decode: gzip and deflate always, brotli and zstd when their
+    # packages are installed.
+    "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
 }
 
 
+# Component names that give the session state away. Every page served to a
+# logged-in session carries the logout link; the login form is only shown to
+# sessions that are not.
+_LOGOUT_COMPONENT = b"logoutLink"
+_LOGIN_COMPONENT = b"loginForm"
+
+# Where the site sends sessions that are not logged in.
+_LOGGED_OUT_PATH = "/welcome"
+
+
 class AuthError(Exception):
     """Raised when authentication cannot proceed."""
 
@@ -33,6 +52,15 @@ class Auth:
 
     Owns the ``requests.Session`` that every other module borrows, so cookies
     are shared across the whole bot.
+
+    Also keeps track of whether that session is logged in. Every page the bot
+    fetches already says so, through the logout link or a bounce to
+    ``/welcome``, so modules hand their responses to :meth:`observe` and
+    ``/home`` is only probed when the state is genuinely unknown.
+
+    Attributes:
+        authenticated: What the last telling response showed, or None when
+            nothing has shown it yet.
     """
 
     def __init__(self, config: Config, session: requests.Session | None = None):
@@ -40,13 +68,16 @@ class Auth:
 
         Args:
             config: Validated bot configuration.
-            session: Existing session to reuse. A fresh one is created when
-                omitted; mainly an injection point for tests.
+            session: Existing session to reuse. A fresh one on the shared
+                transport is created when omitted; mainly an injection point
+                for tests.
         """
         self.config = config
         self.human = HumanBehavior(config.delays)
-        self.session = session or requests.Session()
+        self.session = session or transport.new_session()
         self.session.headers.update(_DEFAULT_HEADERS)
+        instrumentation.instrument(self.session)
+        self.authenticated: bool | None = None
 
     @property
     def base_url(self) -> str:
@@ -58,115 +89,175 @@ class Auth:
 
         Fetches the login page, submits the form exactly as rendered, then
         confirms the session really is authenticated rather than trusting the
-        response body.
+        response status. The page the form lands on usually settles it; only
+        an inconclusive one costs a probe of ``/home``.
 
         Returns:
             True if the session is authenticated afterwards.
         """
+        return flows.run(self._login())
+
+    def is_authenticated(self, probe: bool = False) -> bool:
+        """Check whether the session is currently logged in.
+
+        Answers from :attr:`authenticated` when a recent page has settled it.
+        Otherwise requests ``/home`` without following redirects. The site
+        serves it only to authenticated sessions and bounces everyone else to
+        ``/welcome``, which makes this a more reliable signal than inspecting
+        cookies.
+
+        Args:
+            probe: Ask the server even when the state is already known.
+
+        Returns:
+            True if the session is logged in.
+        """
+        return flows.run(self._is_authenticated(probe))
+
+    def logout(self) -> bool:
+        """Log out by following the site's own logout link.
+
+        The link is read from ``/home``, fetched without following redirects,
+        so the same request also reveals a session that has already ended.
+
+        Returns:
+            True if the session is no longer authenticated. Also True when the
+            session was already logged out, since there is nothing to do.
+        """
+        return flows.run(self._logout())
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        data: dict[str, str] | None = None,
+        allow_redirects: bool = True,
+    ) -> requests.Response:
+        """Send one request on the session with the configured timeout.
+
+        With :meth:`pause` and :meth:`pause_page_load`, the calls every flow
+        is made of; :class:`AsyncAuth` makes them without blocking.
+        """
+        if method == "POST":
+            return self.session.post(
+                url, data=data, timeout=self.config.timeout, allow_redirects=allow_redirects
+            )
+        return self.session.get(url, timeout=self.config.timeout, allow_redirects=allow_redirects)
+
+    def pause(self, multiplier: float = 1.0) -> None:
+        """Pause between actions; see :meth:`HumanBehavior.pause`."""
+        self.human.pause(multiplier)
+
+    def pause_page_load(self) -> None:
+        """Pause to read a page; see :meth:`HumanBehavior.pause_page_load`."""
+        self.human.pause_page_load()
+
+    def observe(self, response: requests.Response) -> None:
+        """Update the known session state from a response received anyway.
+
+        A bounce to ``/welcome`` or a login form means logged out, a page
+        carrying the logout link means logged in. Anything else, such as a
+        page cut short or an error, leaves the state as it was.
+        """
+        for hop in (*getattr(response, "history", ()), response):
+            if hop.is_redirect and self._is_logged_out_url(
+                wicket.resolve(hop.url, hop.headers.get("Location", ""))
+            ):
+                self.authenticated = False
+                return
+        if self._is_logged_out_url(response.url):
+            self.authenticated = False
+        elif response.status_code == 200:
+            if _LOGOUT_COMPONENT in response.content:
+                self.authenticated = True
+            elif _LOGIN_COMPONENT in response.content:
+                self.authenticated = False
+
+    def _login(self) -> Flow[bool]:
+        """The steps of :meth:`login`."""
         logger.info("Logging in as %s", self.config.username)
+        self.authenticated = None
 
         try:
-            self.human.pause()
-            page = self._get(self.config.url("/login"))
+            yield self.pause
+            page = self._page((yield from self._get(self.config.url("/login"))), "login")
 
-            soup = wicket.parse(page.text)
-            form = wicket.parse_form(wicket.find_form(soup, "loginForm"), page.url)
+            form = page.form("loginForm")
             logger.debug("Login form action: %s", form.action_url)
 
             # Read the page as a human would before typing.
-            self.human.pause_page_load()
+            yield self.pause_page_load
 
-            response = self.session.post(
+            response = yield partial(
+                self.request,
+                "POST",
                 form.action_url,
-                data=form.payload(login=self.config.username, password=self.config.password),
-                timeout=self.config.timeout,
-                allow_redirects=True,
+                form.payload(login=self.config.username, password=self.config.password),
             )
             response.raise_for_status()
+            self.observe(response)
 
-            if self.is_authenticated():
+            if (yield from self._is_authenticated()):
                 logger.info("Authenticated successfully")
+                metrics.LOGINS.inc(self.config.username, "ok")
                 return True
 
-            # Not authenticated: surface whatever the server complained about.
-            # Bad credentials land in Wicket's feedback panel, other problems
-            # in the game's own banner, so check both.
-            soup = wicket.parse(response.text)
-            reason = wicket.find_error(soup) or wicket.find_notification(soup)
-            if reason:
-                logger.error("Login failed for %s: %s", self.config.username, reason)
-            else:
-                logger.error(
-                    "Login failed for %s; the session is not authenticated", self.config.username
-                )
+            self._report_failure(response)
+            metrics.LOGINS.inc(self.config.username, "rejected")
             return False
 
         except wicket.WicketError as exc:
             logger.error("Login page markup has changed: %s", exc)
+            metrics.LOGINS.inc(self.config.username, "markup")
             return False
         except requests.RequestException as exc:
             logger.error("Login request failed: %s", exc)
+            metrics.LOGINS.inc(self.config.username, "network")
             return False
 
-    def is_authenticated(self) -> bool:
-        """Check whether the session is currently logged in.
-
-        Requests ``/home`` without following redirects. The site serves it only
-        to authenticated sessions and bounces everyone else to ``/welcome``,
-        which makes this a more reliable signal than inspecting cookies.
+    def _is_authenticated(self, probe: bool = False) -> Flow[bool]:
+        """The steps of :meth:`is_authenticated`."""
+        if self.authenticated is not None and not probe:
+            return self.authenticated
 
-        Returns:
-            True if the session is logged in.
-        """
         try:
-            response = self.session.get(
-                self.config.url("/home"),
-                timeout=self.config.timeout,
-                allow_redirects=False,
+            response = yield partial(
+                self.request, "GET", self.config.url("/home"), allow_redirects=False
             )
         except requests.RequestException as exc:
             logger.error("Could not verify the session: %s", exc)
             return False
 
-        if response.status_code == 200:
-            return True
-
-        if response.is_redirect:
-            logger.debug("Not authenticated, /home redirects to %s", response.headers.get("Location"))
-        else:
-            logger.debug("Unexpected status %s from /home", response.status_code)
-        return False
-
-    def logout(self) -> bool:
-        """Log out by following the site's own logout link.
+        return self._read_probe(response)
 
-        Returns:
-            True if the session is no longer authenticated. Also True when the
-            session was already logged out, since there is nothing to do.
-        """
-        if not self.is_authenticated():
+    def _logout(self) -> Flow[bool]:
+        """The steps of :meth:`logout`."""
+        if self.authenticated is False:
             logger.debug("Already logged out")
             return True
 
-        logger.info("Logging out")
-
         try:
-            self.human.pause()
-            page = self._get(self.config.url("/home"))
+            yield self.pause
+            response = yield from self._get(self.config.url("/home"), allow_redirects=False)
+            self.observe(response)
+            if response.is_redirect:
+                self.authenticated = False
+            if self.authenticated is False:
+                logger.debug("Already logged out")
+                return True
 
-            logout_url = wicket.find_link_href(wicket.parse(page.text), "Выход", page.url)
+            logger.info("Logging out")
+            logout_url = self._page(response, "home").link("Выход")
             if logout_url is None:
                 logger.error("Logout link not found on /home")
                 return False
 
             logger.debug("Logout URL: %s", logout_url)
-            self.session.get(
-                logout_url,
-                timeout=self.config.timeout,
-                allow_redirects=True,
-            ).raise_for_status()
+            response = yield from self._get(logout_url)
+            self.authenticated = None
+            self.observe(response)
 
-            if self.is_authenticated():
+            if (yield from self._is_authenticated()):
                 logger.error("Logout request completed but the session is still active")
                 return False
 
@@ -177,8 +268,108 @@ class Auth:
             logger.error("Logout request failed: %s", exc)
             return False
 
-    def _get(self, url: str) -> requests.Response:
+    def _report_failure(self, response: requests.Response) -> None:
+        """Log why the page a login form landed on is not logged in.
+
+        Bad credentials land in Wicket's feedback panel, other problems in the
+        game's own banner, so both are checked.
+        """
+        soup = self._page(response).soup
+        reason = wicket.find_error(soup) or wicket.find_notification(soup)
+        if reason:
+            logger.error("Login failed for %s: %s", self.config.username, reason)
+        else:
+            logger.error(
+                "Login failed for %s; the session is not authenticated", self.config.username
+            )
+
+    def _read_probe(self, response: requests.Response) -> bool:
+        """Settle the session state from an unfollowed request for ``/home``."""
+        self.authenticated = response.status_code == 200
+        if self.authenticated:
+            return True
+
+        if response.is_redirect:
+            logger.debug("Not authenticated, /home redirects to %s", response.headers.get("Location"))
+        else:
+            logger.debug("Unexpected status %s from /home", response.status_code)
+        return False
+
+    @staticmethod
+    def _is_logged_out_url(url: str) -> bool:
+        """Whether a URL is the page logged-out sessions are sent to."""
+        return urlsplit(url).path.split(";")[0].rstrip("/") == _LOGGED_OUT_PATH
+
+    def _page(self, response: requests.Response, profile: str | None = None) -> wicket.Page:
+        """Wrap a response for parsing with the configured parser."""
+        return wicket.Page(response, self.config.parser, profile)
+
+    def _get(self, url: str, allow_redirects: bool = True) -> Flow[requests.Response]:
         """Fetch a page, raising on HTTP errors."""
-        response = self.session.get(url, timeout=self.config.timeout)
+        response = yield partial(self.request, "GET", url, allow_redirects=allow_redirects)
         response.raise_for_status()
         return response
+
+
+class AsyncAuth(Auth):
+    """:class:`Auth` for the async engine.
+
+    The same flows and the same state tracking over an
+    :class:`~src.utils.async_http.AsyncClient`, so one event loop can hold
+    thousands of sessions. Only the requests and the pauses differ: they
+    yield to the loop instead of blocking.
+    """
+
+    def __init__(self, config: Config, session: AsyncClient | None = None):
+        """Initialise the session.
+
+        Args:
+            config: Validated bot configuration.
+            session: Existing client to reuse. A fresh one is created when
+                omitted, which needs a running event loop.
+        """
+        if session is None:
+            shared = transport.get_transport()
+            session = (
+                AsyncClient(shared.connector(), shared.resilience)
+                if shared is not None
+                else AsyncClient()
+            )
+        super().__init__(config, session)
+        self.session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+
+    async def login(self) -> bool:
+        """Authenticate; see :meth:`Auth.login`."""
+        return await flows.arun(self._login())
+
+    async def is_authenticated(self, probe: bool = False) -> bool:
+        """Check the session; see :meth:`Auth.is_authenticated`."""
+        return await flows.arun(self._is_authenticated(probe))
+
+    async def logout(self) -> bool:
+        """Log out; see :meth:`Auth.logout`."""
+        return await flows.arun(self._logout())
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        data: dict[str, str] | None = None,
+        allow_redirects: bool = True,
+    ) -> requests.Response:
+        """Send one request; see :meth:`Auth.request`."""
+        if method == "POST":
+            return await self.session.post(
+                url, data=data, timeout=self.config.timeout, allow_redirects=allow_redirects
+            )
+        return await self.session.get(
+            url, timeout=self.config.timeout, allow_redirects=allow_redirects
+        )
+
+    async def pause(self, multiplier: float = 1.0) -> None:
+        """Pause between actions without blocking the loop."""
+        await self.human.apause(multiplier)
+
+    async def pause_page_load(self) -> None:
+        """Pause to read a page without blocking the loop."""
+        await self.human.apause_page_load()
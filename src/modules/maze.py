@@ -26,17 +26,30 @@ has already been reshuffled, so that knowledge cannot inform a choice either.
 
 from __future__ import annotations
 
+import html
 import logging
 import random
 import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING
 
 import requests
 from bs4 import BeautifulSoup
+from bs4.element import CData, NavigableString, Tag
 
 from .. import wicket
 from ..config import Config
-from ..modules.auth import Auth
+from ..modules.auth import AsyncAuth, Auth
+from ..utils import flows, instrumentation, metrics
+from ..utils.flows import Flow
 from ..utils.human_like import SessionBudget
+from ..utils.resilience import CircuitOpenError
+
+if TYPE_CHECKING:
+    from ..utils.state_store import RunRecord
 
 logger = logging.getLogger(__name__)
 
@@ -59,10 +72,110 @@ _VICTORY_PATTERN = re.compile(r"прошли\s+лабиринт", re.I)
 _KEYS_PATTERN = re.compile(r"Осталось\s+ключей:\s*(\d[\d'’ ]*)")
 
 
+# Markers the scanner reads straight from the markup. Each is exact on purpose:
+# anything written differently is left to the DOM path rather than guessed at.
+_SCAN_COMMENT = re.compile(r"<!--.*?-->", re.S)
+_SCAN_ANY_COUNTER = re.compile(r"<b\b[^>]*\bamount\b")
+_SCAN_COUNTER = re.compile(r'<b class="amount">\s*(\d+)\s*</b>')
+_SCAN_ANCHOR_HREF = re.compile(r'<a\b[^>]*?\shref="([^"]*)"')
+_SCAN_NOTIFY = re.compile(r'<span class="notify">([^<]*)</span>')
+_SCAN_KEYS = re.compile(r"Осталось\s+ключей:\s*([^<]*)<")
+_SCAN_KEYS_VALUE = re.compile(r"\d[\d'’ ]*")
+
+# Door pages carry everything a step reads first: the room counter, the
+# doors, then the keys left, with only the footer and navigation after them.
+# Once all three have come in, in that order, a streamed read can stop. Dead
+# ends and the victory screen never match, so they are read whole. Each is
+# found by the literal it starts with, then matched in full from there.
+_STREAM_MARKERS = (
+    (b'<b class="amount">', re.compile(rb'<b class="amount">')),
+    (b"doorLink", re.compile(rb"doorLink")),
+    (
+        "Осталось".encode(),
+        re.compile(r"Осталось\s+ключей:\s*(?:<[^>]*>\s*)*\d[\d'’ ]*<".encode()),
+    ),
+)
+# Longest a marker may run from its literal; one that has not matched by then
+# is not one.
+_STREAM_MARKER_SPAN = 256
+_STREAM_CHUNK = 1024
+# Stopping mid-body costs the connection. A tail this small is cheaper to
+# read and throw away than a new TCP and TLS handshake.
+_STREAM_DRAIN_LIMIT = 16 * 1024
+
+# String types that count as visible text, the same ones ``get_text`` uses.
+_TEXT_TYPES = (NavigableString, CData)
+
+
+class _StreamCut:
+    """Where a streamed door page has shown everything a step reads.
+
+    The markers are looked for in turn, each from where the one before it
+    ended, and every search picks up where the last chunk's left off. A body
+    is scanned about once, however many chunks it arrives in.
+    """
+
+    def __init__(self) -> None:
+        self._marker = 0
+        self._at = 0
+
+    def end(self, body: bytes | bytearray) -> int | None:
+        """Where the last marker ends in the body so far, or None until it has come in.
+
+        Args:
+            body: Everything received so far; each call's must start with
+                the previous call's.
+        """
+        while self._marker < len(_STREAM_MARKERS):
+            lead, marker = _STREAM_MARKERS[self._marker]
+            start = body.find(lead, self._at)
+            if start < 0:
+                # A literal cut off by the end of the chunk is found next time.
+                self._at = max(self._at, len(body) - len(lead) + 1)
+                return None
+            found = marker.match(body, start)
+            if found is None:
+                if len(body) - start < _STREAM_MARKER_SPAN:
+                    # The rest of it may not have arrived yet.
+                    self._at = start
+                    return None
+                self._at = start + 1
+                continue
+            self._at = found.end()
+            self._marker += 1
+        return self._at
+
+
 class OutOfKeys(Exception):
     """Raised when no keys remain, so retrying cannot help."""
 
 
+@dataclass(frozen=True)
+class MazeState:
+    """Everything a walk step needs from one maze page.
+
+    Attributes:
+        level: Room number, 0 when the counter is absent or unreadable.
+        keys: Keys remaining, or None when the page does not report them.
+        doors: Door numbers mapped to absolute URLs.
+        notification: Text of the notify banner, if any.
+        solved: Whether this is the victory screen.
+        reward: Reward amounts shown on the victory screen.
+    """
+
+    level: int = 0
+    keys: int | None = None
+    doors: dict[int, str] = field(default_factory=dict)
+    notification: str | None = None
+    solved: bool = False
+    reward: tuple[str, ...] = ()
+
+    @property
+    def dead_end(self) -> bool:
+        """Whether the run ended in a dead end."""
+        return self.notification is not None and "тупик" in self.notification.lower()
+
+
 class MazeBot:
     """Walks the maze until the target depth is reached."""
 
@@ -73,9 +186,17 @@ class MazeBot:
             auth: Auth instance owning the logged-in session.
             config: Validated bot configuration.
         """
+        self.auth = auth
         self.session = auth.session
         self.human = auth.human
         self.config = config
+        # Outcomes of the markup scanner: "scanned", "fallback", "checked",
+        # "mismatch". Only the scan and verify readers count anything.
+        self.scan_counts: Counter[str] = Counter()
+        # Keys remaining as the last maze page showed them.
+        self.keys_seen: int | None = None
+        # Where the run notes its results, when one is kept.
+        self.record: RunRecord | None = None
 
     def keys_left(self, soup: BeautifulSoup) -> int | None:
         """Read how many keys remain.
@@ -100,7 +221,11 @@ class MazeBot:
         Returns:
             The room number, or 0 when the counter is absent or unreadable.
         """
-        amount = soup.find("b", class_="amount")
+        return self._counter_value(soup.find("b", class_="amount"))
+
+    @staticmethod
+    def _counter_value(amount: Tag | None) -> int:
+        """Read the number inside the room counter, or 0 if it is unreadable."""
         if amount is None:
             return 0
         try:
@@ -152,6 +277,129 @@ class MazeBot:
                 numbered[int(match.group(1))] = url
         return numbered
 
+    def read_state(self, soup: BeautifulSoup, page_url: str) -> MazeState:
+        """Read the whole page state in a single pass over the tree.
+
+        Gives the same answers as :meth:`current_level`, :meth:`keys_left`,
+        :meth:`is_solved`, :meth:`is_dead_end`, :meth:`reward` and
+        :meth:`doors_by_number` together, but walks the document once and
+        flattens its text once, where calling them in turn costs a full walk
+        each. This runs on every room, so it is the one the walk uses.
+        """
+        strings: list[str] = []
+        doors: dict[int, str] = {}
+        counter: Tag | None = None
+        notify: Tag | None = None
+        reward: list[str] = []
+        reward_open = False
+
+        for node in soup.descendants:
+            if type(node) in _TEXT_TYPES:
+                text = node.strip()
+                if text:
+                    strings.append(text)
+                continue
+            if not isinstance(node, Tag):
+                continue
+
+            if node.name == "a":
+                href = node.get("href")
+                if isinstance(href, str) and _DOOR_COMPONENT in href:
+                    url = wicket.resolve(page_url, href)
+                    match = _DOOR_NUMBER.search(url)
+                    if match:
+                        doors[int(match.group(1))] = url
+            elif node.name == "b":
+                if counter is None and "amount" in (node.get("class") or ()):
+                    counter = node
+            elif node.name == "span":
+                classes = node.get("class") or ()
+                if notify is None and "notify" in classes:
+                    notify = node
+                if not reward_open:
+                    reward_open = "white" in classes
+                elif "amount" in classes and len(reward) < 2:
+                    amount = node.get_text(strip=True)
+                    if amount:
+                        reward.append(amount)
+
+        text = " ".join(strings)
+        keys = _KEYS_PATTERN.search(text)
+        notification = notify.get_text(strip=True) if notify is not None else None
+
+        logger.debug("Found %d door links: %s", len(doors), list(doors.values()))
+        return MazeState(
+            level=self._counter_value(counter),
+            keys=int(re.sub(r"\D", "", keys.group(1))) if keys else None,
+            doors=doors,
+            notification=notification or None,
+            solved=_VICTORY_PATTERN.search(text) is not None,
+            reward=tuple(reward),
+        )
+
+    def scan_state(self, markup: str, page_url: str) -> MazeState | None:
+        """Read a door page without building a tree.
+
+        Door pages are by far the most frequent, and their few markers are
+        rendered identically every time, so a handful of patterns over the
+        raw markup can stand in for parsing it. The scanner only answers when
+        it is sure: the victory screen, a page with neither a room counter nor
+        a notification, markers written in an unfamiliar way, or door links
+        it cannot account for all return None, and the caller falls back to
+        :meth:`read_state`.
+
+        Returns:
+            The page state, or None when the markup needs a real parse.
+        """
+        if "<!--" in markup:
+            markup = _SCAN_COMMENT.sub("", markup)
+
+        if _VICTORY_PATTERN.search(markup):
+            return None
+
+        level = 0
+        counter = _SCAN_ANY_COUNTER.search(markup)
+        if counter is not None:
+            exact = _SCAN_COUNTER.match(markup, counter.start())
+            if exact is None:
+                return None
+            level = int(exact.group(1))
+
+        notification = None
+        if 'class="notify"' in markup:
+            notify = _SCAN_NOTIFY.search(markup)
+            if notify is None:
+                return None
+            notification = html.unescape(notify.group(1)).strip() or None
+        elif counter is None:
+            # Not a door page at all: a login form, an error, another screen.
+            return None
+
+        keys = None
+        if "ключей" in markup:
+            found = _SCAN_KEYS.search(markup)
+            value = html.unescape(found.group(1)).strip() if found else ""
+            if not _SCAN_KEYS_VALUE.fullmatch(value):
+                return None
+            keys = int(re.sub(r"\D", "", value))
+
+        doors: dict[int, str] = {}
+        links = 0
+        for href in _SCAN_ANCHOR_HREF.findall(markup):
+            if _DOOR_COMPONENT not in href:
+                continue
+            links += 1
+            url = wicket.resolve(page_url, html.unescape(href))
+            match = _DOOR_NUMBER.search(url)
+            if match:
+                doors[int(match.group(1))] = url
+        # A door link in markup the pattern does not cover would silently drop
+        # a door, so every mention of the component has to be accounted for.
+        if links != markup.count(_DOOR_COMPONENT):
+            return None
+
+        return MazeState(level=level, keys=keys, doors=doors, notification=notification)
+
     def solve(self, rounds: int | None = None) -> int:
         """Complete whole mazes, prize included.
 
@@ -166,9 +414,12 @@ class MazeBot:
         Returns:
             The number of mazes completed.
         """
+        return flows.run(self._solve(rounds))
+
+    def _solve(self, rounds: int | None) -> Flow[int]:
+        """The steps of :meth:`solve`."""
         target = self.config.maze_target_level
         rounds = self.config.maze_rounds if rounds is None else rounds
-        max_attempts = self.config.maze_max_attempts
         budget = SessionBudget(self.config.session_max_minutes)
         wanted = str(rounds) if rounds else "unlimited"
 
@@ -177,44 +428,73 @@ class MazeBot:
         completed = 0
         attempt = 0
 
-        while rounds == 0 or completed < rounds:
-            if budget.expired():
-                logger.info(
-                    "Session limit of %d min reached; stopping after %d maze(s)",
-                    budget.max_minutes,
-                    completed,
-                )
-                break
-
-            if max_attempts and attempt >= max_attempts:
-                logger.warning("Gave up after %d attempts with %d maze(s) done", attempt, completed)
-                break
-
+        while self._may_continue(rounds, completed, attempt, budget):
             attempt += 1
+            metrics.MAZE_ATTEMPTS.inc(self.config.username)
             logger.info("Attempt #%d (%d/%s done)", attempt, completed, wanted)
 
             try:
-                if self._walk(target):
+                if (yield from self._walk(target)):
                     completed += 1
+                    metrics.MAZE_COMPLETIONS.inc(self.config.username)
                     logger.info("Maze %d/%s complete on attempt #%d", completed, wanted, attempt)
             except OutOfKeys as exc:
                 # Retrying cannot produce keys, so stop rather than spin.
                 logger.warning("Stopping: %s", exc)
                 break
+            except CircuitOpenError as exc:
+                # Every other account is held back too; the next run can try.
+                logger.warning("Stopping, the site is down: %s", exc)
+                break
             except requests.RequestException as exc:
                 logger.error("Attempt #%d failed: %s", attempt, exc)
 
-            self.human.pause(_SETBACK_MULTIPLIER)
+            yield partial(self.auth.pause, _SETBACK_MULTIPLIER)
 
+        self._log_reader_counts()
+        self._note(completed)
         return completed
 
-    def _walk(self, target: int) -> bool:
+    def _may_continue(
+        self, rounds: int, completed: int, attempt: int, budget: SessionBudget
+    ) -> bool:
+        """Whether :meth:`solve` should start another attempt, logging why not."""
+        if rounds and completed >= rounds:
+            return False
+        if budget.expired():
+            logger.info(
+                "Session limit of %d min reached; stopping after %d maze(s)",
+                budget.max_minutes,
+                completed,
+            )
+            return False
+        max_attempts = self.config.maze_max_attempts
+        if max_attempts and attempt >= max_attempts:
+            logger.warning("Gave up after %d attempts with %d maze(s) done", attempt, completed)
+            return False
+        return True
+
+    def _note(self, completed: int) -> None:
+        """Add a solve's results to the run's record, if one is kept."""
+        if self.record is None:
+            return
+        self.record.mazes_completed += completed
+        if self.keys_seen is not None:
+            self.record.keys_left = self.keys_seen
+
+    def _log_reader_counts(self) -> None:
+        """Log what the markup scanner did over the whole solve."""
+        if self.scan_counts:
+            counts = ", ".join(f"{name} {count}" for name, count in sorted(self.scan_counts.items()))
+            logger.info("Maze reader: %s", counts)
+
+    def _walk(self, target: int) -> Flow[bool]:
         """Walk one run from the entrance.
 
         Returns:
             True if the target level was reached during this run.
         """
-        response = self._get(self.config.url("/doors"))
+        response = yield from self._get(self.config.url("/doors"))
 
         # Every step should either advance a room or end in a dead end. If
         # neither happens the page is not behaving as expected, and looping on
@@ -225,55 +505,172 @@ class MazeBot:
         pending: tuple[int, int] | None = None
 
         for _ in range(budget):
-            soup = wicket.parse(response.text)
-
-            if self.is_solved(soup):
-                reward = self.reward(soup)
-                logger.info(
-                    "Maze complete%s", f", reward: {' + '.join(reward)}" if reward else ""
-                )
-                return True
-
-            if self.is_dead_end(soup):
-                if pending:
-                    logger.info("Dead end behind room %d door %d, restarting", *pending)
-                else:
-                    logger.info("Dead end, restarting")
-                return False
-
-            level = self.current_level(soup)
-            pending = None
-
-            if level == 0:
-                logger.warning("No room counter on %s; the maze markup may have changed", response.url)
-                return False
-
-            keys = self.keys_left(soup)
-            logger.info(
-                "Room %d/%d%s", level, target, f", keys left: {keys}" if keys is not None else ""
-            )
-
-            if keys == 0:
-                raise OutOfKeys("No keys left to open another door")
-
-            doors = self.doors_by_number(soup, response.url)
-            if not doors:
-                logger.warning("No door links on %s; the maze markup may have changed", response.url)
-                return False
-
-            choice = random.choice(sorted(doors))
+            state = self._read(wicket.Page(response, self.config.parser, "doors"))
+            step = self._next_step(state, target, pending, response.url)
+            if isinstance(step, bool):
+                return step
 
             # "Think" before committing to a door.
-            self.human.pause()
+            yield self.auth.pause
+            level, choice, url = step
             pending = (level, choice)
-            response = self._get(doors[choice])
+            response = yield from self._get(url)
 
         logger.warning("Walk exceeded %d steps without finishing; abandoning the attempt", budget)
         return False
 
-    def _get(self, url: str) -> requests.Response:
+    def _next_step(
+        self, state: MazeState, target: int, pending: tuple[int, int] | None, page_url: str
+    ) -> bool | tuple[int, int, str]:
+        """Decide what one maze page calls for.
+
+        Args:
+            state: What the page shows.
+            target: Room the run is aiming for.
+            pending: Room and door opened on the previous step, if any.
+            page_url: Address of the page, for log messages.
+
+        Returns:
+            Whether the run was won once it is over, otherwise the room, the
+            door chosen and its URL.
+
+        Raises:
+            OutOfKeys: If there is no key left for another door.
+        """
+        if state.keys is not None:
+            self.keys_seen = state.keys
+            metrics.KEYS_LEFT.set(state.keys, self.config.username)
+
+        if state.solved:
+            logger.info(
+                "Maze complete%s",
+                f", reward: {' + '.join(state.reward)}" if state.reward else "",
+            )
+            return True
+
+        if state.dead_end:
+            if pending:
+                logger.info("Dead end behind room %d door %d, restarting", *pending)
+            else:
+                logger.info("Dead end, restarting")
+            metrics.MAZE_DEAD_ENDS.inc(pending[0] if pending else 0)
+            return False
+
+        level = state.level
+        if level == 0:
+            logger.warning("No room counter on %s; the maze markup may have changed", page_url)
+            return False
+
+        keys = state.keys
+        logger.info(
+            "Room %d/%d%s", level, target, f", keys left: {keys}" if keys is not None else ""
+        )
+
+        if keys == 0:
+            raise OutOfKeys("No keys left to open another door")
+
+        doors = state.doors
+        if not doors:
+            logger.warning("No door links on %s; the maze markup may have changed", page_url)
+            return False
+
+        choice = random.choice(sorted(doors))
+        return level, choice, doors[choice]
+
+    def _read(self, page: wicket.Page) -> MazeState:
+        """Read a maze page with the configured reader."""
+        reader = self.config.maze_reader
+        scanned = None
+        if reader != "dom":
+            scanned = self.scan_state(page.html, page.url)
+            if scanned is None:
+                self.scan_counts["fallback"] += 1
+            elif reader == "scan":
+                self.scan_counts["scanned"] += 1
+                return scanned
+
+        # The page carries the lean "doors" profile, which covers door pages
+        # and dead ends. The victory text sits outside every element it keeps,
+        # so that one screen is parsed whole.
+        if _VICTORY_PATTERN.search(page.html):
+            soup = wicket.parse(page.html, page.parser)
+        else:
+            soup = page.soup
+        state = self.read_state(soup, page.url)
+
+        if reader == "verify" and scanned is not None:
+            self.scan_counts["checked"] += 1
+            if scanned != state:
+                self.scan_counts["mismatch"] += 1
+                logger.warning("Scanner disagrees with the parser on %s", page.url)
+                logger.debug("Scanned %s, parsed %s", scanned, state)
+        return state
+
+    def _get(self, url: str) -> Flow[requests.Response]:
         """Fetch a page, raise on HTTP errors, then pause as a reader would."""
-        response = self.session.get(url, timeout=self.config.timeout)
+        response = yield partial(self._fetch, url)
         response.raise_for_status()
-        self.human.pause_page_load()
+        self.auth.observe(response)
+        yield self.auth.pause_page_load
+        return response
+
+    def _fetch(self, url: str) -> requests.Response:
+        """Send the request for a maze page, streamed if so configured."""
+        if self.config.maze_stream:
+            return self._get_streamed(url)
+        return self.auth.request("GET", url)
+
+    def _get_streamed(self, url: str) -> requests.Response:
+        """Fetch a maze page only as far as a step needs.
+
+        The body is read a chunk at a time until the counter, the doors and
+        the keys have all come in. The response then holds just that much,
+        which every reader handles like a whole page, and the rest is either
+        read and dropped, when it is short, or abandoned with the connection.
+        A page where they never all turn up is simply read to the end.
+        """
+        started = time.perf_counter()
+        response = self.session.get(url, timeout=self.config.timeout, stream=True)
+        body = bytearray()
+        cut = _StreamCut()
+        with response:
+            for chunk in response.iter_content(_STREAM_CHUNK):
+                body += chunk
+                if response.status_code == 200 and cut.end(body) is not None:
+                    self._abandon(response)
+                    break
+            response._content = bytes(body)
+            response._content_consumed = True
+        instrumentation.record_streamed(response, time.perf_counter() - started, len(body))
         return response
+
+    @staticmethod
+    def _abandon(response: requests.Response) -> None:
+        """Stop reading a streamed body, keeping the connection if that is cheap."""
+        if response.raw is None:
+            # Served from memory, as in a replay; there is no connection.
+            return
+        length = response.headers.get("Content-Length", "")
+        left = int(length) - response.raw.tell() if length.isdigit() else None
+        if left is not None and left <= _STREAM_DRAIN_LIMIT:
+            response.raw.drain_conn()
+        else:
+            response.raw.close()
+
+
+class AsyncMazeBot(MazeBot):
+    """:class:`MazeBot` for the async engine.
+
+    Reads pages and picks doors exactly as :class:`MazeBot` does; only the
+    fetching and the pauses wait on the event loop instead of a thread.
+    """
+
+    auth: AsyncAuth
+
+    async def solve(self, rounds: int | None = None) -> int:
+        """Complete whole mazes; see :meth:`MazeBot.solve`."""
+        return await flows.arun(self._solve(rounds))
+
+    async def _fetch(self, url: str) -> requests.Response:
+        """Send the request for a maze page; always read whole, as aiohttp has it."""
+        return await self.auth.request("GET", url)
@@ -24,13 +24,25 @@ from __future__ import annotations
 
 import logging
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import partial
+from typing import TYPE_CHECKING
 
+import requests
 from bs4 import BeautifulSoup
+from bs4.element import CData, NavigableString, Tag
 
 from .. import wicket
 from ..config import Config
-from ..modules.auth import Auth
+from ..models import Quest, QuestSnapshot
+from ..modules.auth import AsyncAuth, Auth
+from ..utils import flows, metrics
+from ..utils.clock import get_clock
+from ..utils.flows import Flow
+
+if TYPE_CHECKING:
+    from ..utils.state_store import RunRecord, StateStore
 
 logger = logging.getLogger(__name__)
 
@@ -42,47 +54,122 @@ _KEYS_EARNED = re.compile(r"Собрано\s+ключей:\s*([\d'’ ]+)")
 # Tasks asking for real money. The bot must never act on these.
 _PAID = re.compile(r"Пополни\s+счет", re.I)
 
+# The same patterns merged for single-pass reading: one search per task block
+# and one over the whole page, instead of one per field.
+_BLOCK_FIELDS = re.compile(
+    r"До\s+старта:\s*(?:(?P<hours>\d+)\s*ч)?\s*(?:(?P<minutes>\d+)\s*мин)?"
+    r"|Прогресс:\s*(?P<done>[\d'’ ]+)\s*из\s*(?P<total>[\d'’ ]+)"
+)
+_PAGE_FIELDS = re.compile(
+    r"Сегодня\s+выполнено\s+заданий:\s*(?P<completed>\d+)\s*из\s*(?P<allowed>\d+)"
+    r"|Собрано\s+ключей:\s*(?P<keys>[\d'’ ]+)"
+)
+
+# Thousand separators the game puts in counts: "75'000".
+_SEPARATORS = str.maketrans("", "", "'’ ")
+
+# String types that count as visible text, the same ones ``get_text`` uses.
+_TEXT_TYPES = (NavigableString, CData)
+
 
 def _number(text: str) -> int:
     """Read a count that may carry thousand separators."""
-    digits = re.sub(r"\D", "", text)
-    return int(digits) if digits else 0
+    digits = text.translate(_SEPARATORS)
+    return int(digits) if digits.isdigit() else 0
 
 
 @dataclass(frozen=True)
-class Quest:
-    """One personal task.
+class QuestPage:
+    """Everything the task page says.
 
     Attributes:
-        name: Task title, e.g. "Инкассатор".
-        description: What it asks for.
-        done: Progress so far, 0 while on cooldown.
-        total: Target, 0 while on cooldown.
-        minutes_left: Minutes until it becomes available, or None if active.
-        paid: Whether it requires topping up with real money.
+        quests: Every task listed.
+        completed: Tasks done today.
+        allowed: Tasks allowed per day, 0 if not shown.
+        keys_earned: Keys the tasks have produced, if shown.
+    """
+
+    quests: list[Quest]
+    completed: int = 0
+    allowed: int = 0
+    keys_earned: int | None = None
+
+
+@dataclass
+class _Title:
+    """A task title met while walking the page, and the line after it."""
+
+    strings: list[str] = field(default_factory=list)
+    # The div after the one holding the title, when it is a grey "minor" line,
+    # which is where a task on cooldown keeps its description.
+    following: Tag | None = None
+    following_strings: list[str] = field(default_factory=list)
+
+
+@dataclass
+class _Block:
+    """A task block met while walking the page, and the text read inside it.
+
+    Each list gathers one element's strings as the walk passes through it:
+    the whole block, the first ``<b>`` and ``<strong>`` and the first
+    ``<div class="white">``.
     """
 
-    name: str
-    description: str
-    done: int = 0
-    total: int = 0
-    minutes_left: int | None = None
-    paid: bool = False
+    tag: Tag
+    strings: list[str] = field(default_factory=list)
+    bold: _Title | None = None
+    strong: _Title | None = None
+    white: list[str] | None = None
+
 
-    @property
-    def on_cooldown(self) -> bool:
-        """Whether the task is waiting rather than in progress."""
-        return self.minutes_left is not None
+def snapshot_expiry(quests: list[Quest], taken_at: float, active_minutes: int) -> float:
+    """Work out how long a read of the task page stays true.
 
-    @property
-    def complete(self) -> bool:
-        """Whether the target has been reached."""
-        return not self.on_cooldown and self.total > 0 and self.done >= self.total
+    A page where every task is cooling down cannot change before the first
+    countdown runs out, and the countdowns round down to the minute, so
+    expiring then is never late. Tasks in progress can move at any time; for
+    those the page is trusted for ``active_minutes`` only.
 
-    @property
-    def remaining(self) -> int:
-        """How much is still needed to finish it."""
-        return max(0, self.total - self.done) if not self.on_cooldown else 0
+    Returns:
+        A Unix time, ``taken_at`` itself for a page not worth keeping.
+    """
+    if not quests:
+        return taken_at
+    deadlines = [quest.minutes_left * 60 for quest in quests if quest.on_cooldown]
+    if len(deadlines) < len(quests):
+        deadlines.append(active_minutes * 60)
+    return taken_at + min(deadlines)
+
+
+class QuestCache:
+    """Recent reads of the task page, so a run can skip one.
+
+    Kept in memory for as long as the cache is, and in the state store when
+    there is one, which is what lets the next process use it too. A bot
+    makes its own unless given one; the daemon keeps one for the whole
+    process, so a later visit to an account finds the page in memory.
+    """
+
+    def __init__(self, store: StateStore | None = None):
+        """Initialise, optionally backed by the state store."""
+        self.store = store
+        self._snapshots: dict[str, QuestSnapshot] = {}
+
+    def get(self, username: str, now: float | None = None) -> QuestSnapshot | None:
+        """Return the account's snapshot if it has not expired yet."""
+        snapshot = self._snapshots.get(username)
+        if snapshot is None and self.store is not None:
+            snapshot = self.store.quest_snapshot(username)
+        if now is None:
+            now = get_clock().time()
+        if snapshot is None or snapshot.expires_at <= now:
+            return None
+        self._snapshots[username] = snapshot
+        return snapshot
+
+    def put(self, username: str, snapshot: QuestSnapshot) -> None:
+        """Remember a fresh read."""
+        self._snapshots[username] = snapshot
 
 
 class QuestBot:
@@ -90,16 +177,30 @@ class QuestBot:
 
     def __init__(self, auth: Auth, config: Config):
         """Initialise with an authenticated session."""
+        self.auth = auth
         self.session = auth.session
         self.human = auth.human
         self.config = config
+        # Where the run notes what the page showed, when one is kept.
+        self.record: RunRecord | None = None
+        # Serves report() while the last read still holds; None always fetches.
+        self.cache: QuestCache | None = None
 
-    def fetch(self) -> BeautifulSoup:
+    def fetch(self) -> wicket.Page:
         """Load the task page."""
-        response = self.session.get(self.config.url("/quests"), timeout=self.config.timeout)
+        return flows.run(self._fetch())
+
+    def _fetch(self) -> Flow[wicket.Page]:
+        """The steps of :meth:`fetch`."""
+        response = yield partial(self.auth.request, "GET", self.config.url("/quests"))
         response.raise_for_status()
-        self.human.pause_page_load()
-        return wicket.parse(response.text)
+        self.auth.observe(response)
+        yield self.auth.pause_page_load
+        return self._page(response)
+
+    def _page(self, response: requests.Response) -> wicket.Page:
+        """Wrap the task page for parsing."""
+        return wicket.Page(response, self.config.parser, "quests")
 
     def parse(self, soup: BeautifulSoup) -> list[Quest]:
         """Read every task listed on the page."""
@@ -137,6 +238,134 @@ class QuestBot:
 
         return quests
 
+    def extract(self, soup: BeautifulSoup) -> QuestPage:
+        """Read the tasks and the page counters in a single pass over the tree.
+
+        Gives the same answers as :meth:`parse`, :meth:`done_today` and
+        :meth:`keys_earned` together. Those flatten each task block, search it
+        again for the description and then flatten the whole page twice more;
+        this walks the document once and hands each string to the page and to
+        every element around it whose text is wanted. It is the one
+        :meth:`report` uses.
+        """
+        strings: list[str] = []
+        blocks: list[_Block] = []
+        open_blocks: list[_Block] = []
+        open_divs: list[Tag] = []
+        # Titles with a grey line after them, to be read when the walk gets there.
+        waiting: list[_Title] = []
+        # Lists the current string goes to: the page's and the open elements'.
+        sinks: list[list[str]] = [strings]
+        # Elements the walk is inside, with how many sinks each opened.
+        path: list[tuple[Tag, int]] = []
+
+        for node in soup.descendants:
+            while path and path[-1][0] is not node.parent:
+                tag, opened = path.pop()
+                del sinks[len(sinks) - opened :]
+                if tag.name == "div":
+                    open_divs.pop()
+                    if open_blocks and open_blocks[-1].tag is tag:
+                        open_blocks.pop()
+            if type(node) in _TEXT_TYPES:
+                text = node.strip()
+                if text:
+                    for sink in sinks:
+                        sink.append(text)
+                continue
+            if not isinstance(node, Tag):
+                continue
+
+            opened = len(sinks)
+            if node.name == "div":
+                classes = node.get("class") or ()
+                if "nfl" in classes:
+                    blocks.append(_Block(node))
+                    open_blocks.append(blocks[-1])
+                    sinks.append(blocks[-1].strings)
+                if "white" in classes:
+                    for block in open_blocks:
+                        if block.white is None:
+                            block.white = []
+                            sinks.append(block.white)
+                for title in waiting:
+                    if title.following is node:
+                        sinks.append(title.following_strings)
+                open_divs.append(node)
+            elif node.name in ("b", "strong"):
+                holder = open_divs[-1] if open_divs else None
+                for block in open_blocks:
+                    if node.name == "b" and block.bold is None:
+                        title = block.bold = self._title(holder)
+                    elif node.name == "strong" and block.strong is None:
+                        title = block.strong = self._title(holder)
+                    else:
+                        continue
+                    sinks.append(title.strings)
+                    if title.following is not None:
+                        waiting.append(title)
+            path.append((node, len(sinks) - opened))
+
+        quests = [quest for block in blocks if (quest := self._block_quest(block))]
+
+        completed = allowed = 0
+        keys: int | None = None
+        counted = False
+        for match in _PAGE_FIELDS.finditer(" ".join(strings)):
+            if match.group("completed") is not None:
+                if not counted:
+                    completed, allowed = int(match.group("completed")), int(match.group("allowed"))
+                    counted = True
+            elif keys is None:
+                keys = _number(match.group("keys"))
+        return QuestPage(quests, completed, allowed, keys)
+
+    @staticmethod
+    def _title(holder: Tag | None) -> _Title:
+        """Start a title held in ``holder``, noting the grey line after it."""
+        following = holder.find_next_sibling("div") if holder else None
+        if following is not None and "minor" not in (following.get("class") or []):
+            following = None
+        return _Title(following=following)
+
+    @staticmethod
+    def _block_quest(block: _Block) -> Quest | None:
+        """Build the task a walked block describes, as :meth:`parse` would."""
+        title = block.bold or block.strong
+        if title is None:
+            return None
+        name = "".join(title.strings)
+        if not name:
+            return None
+
+        description = ""
+        if block.white is not None:
+            description = " ".join(block.white)
+        elif title.following is not None:
+            text = " ".join(title.following_strings)
+            if not text.startswith(("Прогресс", "Награда", "До старта")):
+                description = text
+
+        cooldown = progress = None
+        for match in _BLOCK_FIELDS.finditer(" ".join(block.strings)):
+            if match.group("done") is None:
+                cooldown = cooldown or match
+            else:
+                progress = progress or match
+
+        if cooldown and (cooldown.group("hours") or cooldown.group("minutes")):
+            minutes = int(cooldown.group("hours") or 0) * 60 + int(cooldown.group("minutes") or 0)
+            return Quest(name, description, minutes_left=minutes)
+        if progress is None:
+            return None
+        return Quest(
+            name,
+            description,
+            done=_number(progress.group("done")),
+            total=_number(progress.group("total")),
+            paid=bool(_PAID.search(description)),
+        )
+
     @staticmethod
     def _description(block, title) -> str:
         """Read the line under the title that says what the task wants.
@@ -159,14 +388,14 @@ class QuestBot:
                 return text
         return ""
 
-    def done_today(self, soup: BeautifulSoup) -> tuple[int, int]:
+    def done_today(self, page: wicket.Page | BeautifulSoup) -> tuple[int, int]:
         """Return ``(completed, allowed)`` tasks for today."""
-        match = _DONE_TODAY.search(soup.get_text(" ", strip=True))
+        match = _DONE_TODAY.search(wicket.page_text(page))
         return (int(match.group(1)), int(match.group(2))) if match else (0, 0)
 
-    def keys_earned(self, soup: BeautifulSoup) -> int | None:
+    def keys_earned(self, page: wicket.Page | BeautifulSoup) -> int | None:
         """Return how many keys the tasks have produced, as the page reports."""
-        match = _KEYS_EARNED.search(soup.get_text(" ", strip=True))
+        match = _KEYS_EARNED.search(wicket.page_text(page))
         return _number(match.group(1)) if match else None
 
     def next_available_in(self, quests: list[Quest]) -> int | None:
@@ -185,13 +414,58 @@ class QuestBot:
     def report(self) -> list[Quest]:
         """Log the current state of the task page.
 
+        Served from the cache while the last read still holds, which during
+        a long cooldown saves fetching and parsing the page on every run.
+
         Returns:
             The parsed tasks.
         """
-        soup = self.fetch()
-        quests = self.parse(soup)
-        completed, allowed = self.done_today(soup)
-        keys = self.keys_earned(soup)
+        return flows.run(self._report())
+
+    def _report(self) -> Flow[list[Quest]]:
+        """The steps of :meth:`report`."""
+        snapshot = self._cached()
+        if snapshot is None:
+            snapshot = self._snapshot((yield from self._fetch()))
+        return self._log(snapshot)
+
+    def _cached(self) -> QuestSnapshot | None:
+        """The cached read of the task page, if it still holds."""
+        if self.cache is None:
+            return None
+        snapshot = self.cache.get(self.config.username)
+        if snapshot is not None:
+            logger.info(
+                "Quests: as read at %s, unchanged until %s",
+                datetime.fromtimestamp(snapshot.taken_at).strftime("%H:%M"),
+                datetime.fromtimestamp(snapshot.expires_at).strftime("%H:%M"),
+            )
+        return snapshot
+
+    def _snapshot(self, page: wicket.Page) -> QuestSnapshot:
+        """Read a fetched task page, noting and caching what it says."""
+        read = self.extract(page.soup)
+        quests = read.quests
+        taken_at = get_clock().time()
+        snapshot = QuestSnapshot(
+            quests=tuple(quests),
+            completed=read.completed,
+            allowed=read.allowed,
+            keys_earned=read.keys_earned,
+            taken_at=taken_at,
+            expires_at=snapshot_expiry(quests, taken_at, self.config.quest_cache_minutes),
+        )
+        if self.record is not None:
+            self.record.quests = quests
+            self.record.quest_snapshot = snapshot
+        if self.cache is not None:
+            self.cache.put(self.config.username, snapshot)
+        return snapshot
+
+    def _log(self, snapshot: QuestSnapshot) -> list[Quest]:
+        """Log a read of the task page and return its tasks as of now."""
+        quests = snapshot.current_quests()
+        completed, allowed, keys = snapshot.completed, snapshot.allowed, snapshot.keys_earned
 
         logger.info(
             "Quests: %d today%s%s",
@@ -208,6 +482,23 @@ class QuestBot:
                             quest.description, "  [платное]" if quest.paid else "")
 
         wait = self.next_available_in(quests)
+        metrics.QUESTS_DONE.set(completed, self.config.username)
+        if wait is not None:
+            metrics.QUEST_WAIT.set(wait * 60, self.config.username)
         if wait:
             logger.info("Nothing new for %d ч %02d мин", wait // 60, wait % 60)
         return quests
+
+
+class AsyncQuestBot(QuestBot):
+    """:class:`QuestBot` for the async engine."""
+
+    auth: AsyncAuth
+
+    async def fetch(self) -> wicket.Page:
+        """Load the task page."""
+        return await flows.arun(self._fetch())
+
+    async def report(self) -> list[Quest]:
+        """Log the current state of the task page; see :meth:`QuestBot.report`."""
+        return await flows.arun(self._report())
@@ -0,0 +1,128 @@
+"""Waking accounts when there is something for them to do.
+
+A single run plays once and exits, which leaves cron to guess when to call
+again. The game says exactly when: each task's ``До старта`` countdown, and
+the cooldown is 20 hours from when the reward was taken, so the right moment
+drifts by about four hours a day and no fixed schedule keeps up with it.
+
+The daemon keeps one timer per account in a heap ordered by wake time and
+sleeps until the earliest is due. An account is woken when its soonest
+cooldown ends, or when its ``active_hours`` window opens if that comes later,
+and is never logged in just to find it has nothing to do.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime
+from typing import Generic, TypeVar
+
+from .config import Config
+from .utils.clock import Clock, get_clock
+from .utils.human_like import seconds_until_active
+from .utils.state_store import AccountState
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Countdowns are shown in whole minutes and rounded down, so a visit exactly
+# on time can still find the task locked.
+_COOLDOWN_SLACK_SECONDS = 60
+
+
+def next_visit_delay(config: Config, quest_wait: int | None, now: datetime | None = None) -> float:
+    """Decide how long an account can be left alone.
+
+    Args:
+        config: The account's configuration.
+        quest_wait: Minutes until the soonest task unlocks, as
+            ``QuestBot.next_available_in`` reports it: 0 when tasks are
+            already running, None when the page said nothing usable.
+        now: Time to measure from. Defaults to the clock's current local time.
+
+    Returns:
+        Seconds until the next visit, never inside a forbidden hour.
+    """
+    now = now or get_clock().now()
+    if quest_wait:
+        delay = quest_wait * 60 + _COOLDOWN_SLACK_SECONDS
+    else:
+        # Running tasks progress in their own time, and an unreadable page
+        # gives nothing to go on, so look again after the fallback interval.
+        delay = config.daemon_interval_minutes * 60.0
+
+    wake = datetime.fromtimestamp(now.timestamp() + delay)
+    return delay + seconds_until_active(config.active_hours, wake)
+
+
+def first_visit_delay(
+    config: Config, state: AccountState | None, now: datetime | None = None
+) -> float:
+    """Decide when the daemon should first visit an account.
+
+    Without a stored state every account is visited as soon as its hours
+    allow. With one, an account whose tasks are still cooling down is left
+    alone until they unlock, rather than logged in to be told so again.
+
+    Args:
+        config: The account's configuration.
+        state: What the state store remembers of it, if anything.
+        now: Time to measure from. Defaults to the clock's current local time.
+    """
+    now = now or get_clock().now()
+    delay = 0.0
+    if state is not None and state.next_available_at is not None:
+        remaining = state.next_available_at - now.timestamp()
+        if remaining > 0:
+            delay = remaining + _COOLDOWN_SLACK_SECONDS
+
+    wake = datetime.fromtimestamp(now.timestamp() + delay)
+    return delay + seconds_until_active(config.active_hours, wake)
+
+
+class Scheduler(Generic[T]):
+    """A timer queue that hands out entries as they fall due.
+
+    Entries are scheduled from worker threads as their runs finish while the
+    main thread waits on the earliest one, so the queue is guarded by a
+    condition that also wakes the waiter when an earlier entry arrives.
+    """
+
+    def __init__(self, clock: Clock | None = None) -> None:
+        self.clock = clock or get_clock()
+        self._heap: list[tuple[float, int, T]] = []
+        # Breaks ties between equal wake times without comparing entries.
+        self._order = itertools.count()
+        self._changed = threading.Condition()
+
+    def __len__(self) -> int:
+        with self._changed:
+            return len(self._heap)
+
+    def schedule(self, entry: T, delay: float) -> None:
+        """Queue an entry to fall due after ``delay`` seconds."""
+        due = self.clock.monotonic() + max(0.0, delay)
+        with self._changed:
+            heapq.heappush(self._heap, (due, next(self._order), entry))
+            self._changed.notify()
+
+    def next_due(self) -> T:
+        """Block until the earliest entry is due, then remove and return it.
+
+        Waits indefinitely while the queue is empty, since a run in progress
+        will put its account back when it finishes.
+        """
+        with self._changed:
+            while True:
+                if not self._heap:
+                    self.clock.wait(self._changed, None)
+                    continue
+                due = self._heap[0][0]
+                remaining = due - self.clock.monotonic()
+                if remaining <= 0:
+                    return heapq.heappop(self._heap)[2]
+                self.clock.wait(self._changed, remaining)
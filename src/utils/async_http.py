@@ -0,0 +1,256 @@
+"""A non-blocking HTTP client for the async engine.
+
+Thousands of accounts on one event loop need a client that does not block,
+and aiohttp is that client. Everything that reads pages, though, was written
+against ``requests``: ``wicket.Page``, ``Auth.observe``, ``raise_for_status``
+and every ``except requests.RequestException``. So each aiohttp response is
+read in full and copied into a ``requests.Response``, and aiohttp's errors are
+raised as their ``requests`` equivalents. The async modules then share every
+line of parsing and error handling with the threaded ones.
+
+aiohttp is optional (``pip install aiohttp``) and imported only when a client
+is created, so the threaded engine never needs it.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.cookies import Morsel
+from typing import Any
+
+import requests
+from requests.cookies import RequestsCookieJar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from . import instrumentation
+from .resilience import Resilience
+
+
+def _accept_encoding() -> str:
+    """The encodings aiohttp can decode here; brotli needs its own package."""
+    encodings = ["gzip", "deflate"]
+    if importlib.util.find_spec("brotli") or importlib.util.find_spec("brotlicffi"):
+        encodings.append("br")
+    return ", ".join(encodings)
+
+
+# Sent instead of the threaded engine's list, which may name encodings only
+# urllib3 can decode.
+ACCEPT_ENCODING = _accept_encoding()
+
+
+def wire_size(headers: Any, size: int) -> int | None:
+    """How many body bytes a compressed response took, from its length header.
+
+    aiohttp decompresses as it reads and keeps no count of what came in, so
+    only a body sent with a length can be measured.
+    """
+    if not headers.get("Content-Encoding"):
+        return size
+    length = headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+
+def to_requests(
+    raw: Any, body: bytes, history: list[requests.Response] | None = None
+) -> requests.Response:
+    """Copy an aiohttp response into a ``requests.Response``.
+
+    Args:
+        raw: The aiohttp response, or anything with its ``status``,
+            ``reason``, ``url`` and ``headers``.
+        body: The body, already read.
+        history: Redirects that led here, already converted.
+    """
+    response = requests.Response()
+    response.status_code = raw.status
+    response.reason = raw.reason or ""
+    response.url = str(raw.url)
+    response.headers = CaseInsensitiveDict(raw.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.history = history or []
+    response._content = body
+    return response
+
+
+def _expiry(morsel: Morsel[str]) -> int | None:
+    """When a cookie expires, as a timestamp, or None for a session cookie."""
+    if morsel["max-age"]:
+        # Counted from now rather than from when it was set, which only
+        # ever keeps it a little longer than the site asked.
+        return int(time.time()) + int(morsel["max-age"])
+    if morsel["expires"]:
+        return int(parsedate_to_datetime(morsel["expires"]).timestamp())
+    return None
+
+
+class AsyncClient:
+    """An aiohttp session that answers with ``requests`` responses.
+
+    Has to be created inside a running event loop, as aiohttp requires.
+
+    Attributes:
+        headers: Sent with every request, like ``requests.Session.headers``.
+    """
+
+    def __init__(self, connector: Any = None, resilience: Resilience | None = None) -> None:
+        """Open the underlying aiohttp session.
+
+        Args:
+            connector: aiohttp connector to share with other clients, which
+                closing this one leaves open. The client gets a connector of
+                its own when omitted.
+            resilience: Timeouts, retries and circuit breakers to put every
+                request through, if any.
+
+        Raises:
+            ImportError: If aiohttp is not installed.
+        """
+        try:
+            import aiohttp
+        except ImportError as exc:
+            raise ImportError("The async engine needs aiohttp: pip install aiohttp") from exc
+
+        self._aiohttp = aiohttp
+        self._resilience = resilience
+        self.headers: dict[str, str] = {"Accept-Encoding": ACCEPT_ENCODING}
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=connector is None,
+            # By default aiohttp drops cookies set by an IP address, which is
+            # how the local stand-in is reached; requests keeps them.
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+        )
+
+    async def get(
+        self, url: str, *, timeout: float | None = None, allow_redirects: bool = True
+    ) -> requests.Response:
+        """Fetch a URL."""
+        return await self._request("GET", url, timeout=timeout, allow_redirects=allow_redirects)
+
+    async def post(
+        self,
+        url: str,
+        data: dict[str, str] | None = None,
+        *,
+        timeout: float | None = None,
+        allow_redirects: bool = True,
+    ) -> requests.Response:
+        """Submit a form."""
+        return await self._request(
+            "POST", url, data=data, timeout=timeout, allow_redirects=allow_redirects
+        )
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        data: dict[str, str] | None = None,
+        timeout: float | None,
+        allow_redirects: bool,
+    ) -> requests.Response:
+        """Send a request and read the whole response."""
+        if self._resilience is None:
+            return await self._send(method, url, data, timeout, allow_redirects)
+        return await self._resilience.asend(
+            method,
+            url,
+            timeout,
+            lambda limits: self._send(method, url, data, limits, allow_redirects),
+        )
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        data: dict[str, str] | None,
+        timeout: float | tuple[float, float] | None,
+        allow_redirects: bool,
+    ) -> requests.Response:
+        """Send a request once, with a total or a connect and read timeout."""
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            limits = self._aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        else:
+            limits = self._aiohttp.ClientTimeout(total=timeout)
+        started = time.perf_counter()
+        try:
+            async with self._session.request(
+                method,
+                url,
+                data=data,
+                headers=self.headers,
+                allow_redirects=allow_redirects,
+                timeout=limits,
+            ) as raw:
+                body = await raw.read()
+                # Redirect bodies are never read; only their status and
+                # Location matter to anything downstream.
+                history = [to_requests(hop, b"") for hop in raw.history]
+                response = to_requests(raw, body, history)
+        except asyncio.TimeoutError as exc:
+            raise requests.Timeout(f"{method} {url} timed out") from exc
+        except self._aiohttp.ClientError as exc:
+            raise requests.ConnectionError(str(exc)) from exc
+        # The whole redirect chain counts towards the page it ended on.
+        instrumentation.record_response(
+            response.url,
+            time.perf_counter() - started,
+            len(body),
+            response.status_code,
+            wire_size(raw.headers, len(body)),
+        )
+        return response
+
+    def export_cookies(self) -> RequestsCookieJar:
+        """Copy the session's cookies into a jar the cookie store can save.
+
+        Each keeps its domain, path and expiry, so a restored session ends
+        when the site meant it to.
+        """
+        jar = RequestsCookieJar()
+        for morsel in self._session.cookie_jar:
+            jar.set(
+                morsel.key,
+                morsel.value,
+                domain=morsel["domain"],
+                path=morsel["path"] or "/",
+                secure=bool(morsel["secure"]),
+                expires=_expiry(morsel),
+            )
+        return jar
+
+    def import_cookies(self, jar: RequestsCookieJar, base_url: str) -> None:
+        """Load saved cookies into the session, domain, path and expiry included.
+
+        Args:
+            jar: Cookies restored by the cookie store.
+            base_url: Site the cookies belong to. aiohttp scopes cookies by
+                the response that set them, so this stands in for it.
+        """
+        from yarl import URL  # Installed with aiohttp.
+
+        for cookie in jar:
+            morsel: Morsel[str] = Morsel()
+            morsel.set(cookie.name, cookie.value or "", cookie.value or "")
+            morsel["path"] = cookie.path or "/"
+            if cookie.domain_specified:
+                morsel["domain"] = cookie.domain
+            if cookie.expires is not None:
+                morsel["expires"] = formatdate(cookie.expires, usegmt=True)
+            if cookie.secure:
+                morsel["secure"] = True
+            self._session.cookie_jar.update_cookies({cookie.name: morsel}, URL(base_url))
+
+    def clear_cookies(self) -> None:
+        """Forget every cookie."""
+        self._session.cookie_jar.clear()
+
+    async def close(self) -> None:
+        """Close the underlying aiohttp session."""
+        await self._session.close()
@@ -0,0 +1,179 @@
+"""Where the bot's notion of time comes from.
+
+Pauses, session budgets, active hours, task countdowns and the daemon's
+timers all read or wait on the clock, so a simulated run normally takes as
+long as a real one. Everything goes through the process clock kept here
+instead of :mod:`time` directly, which lets a run be sped up as a whole:
+
+* :class:`Clock` is real time, and the default.
+* :class:`ScaledClock` runs time faster by a constant factor. Every reading
+  and every wait is scaled alike, so accounts playing side by side, budgets,
+  windows and timers all keep their proportions; ``--time-scale`` sets it.
+* :class:`VirtualClock` never waits at all: a sleep moves the clock forward
+  by its length and returns. Concurrent sleepers each move it, so it is exact
+  for one account at a time, which is what tests and single-account
+  simulations need.
+
+Only the bot's own time is affected. Anything the server decides, such as
+when a session expires, still happens in real time, so a sped-up run belongs
+against the local stand-in, never the live site.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time as time_module
+from datetime import datetime
+
+
+class Clock:
+    """Real time."""
+
+    def time(self) -> float:
+        """Wall-clock time as a Unix timestamp."""
+        return time_module.time()
+
+    def monotonic(self) -> float:
+        """A reading for measuring intervals, unaffected by clock changes."""
+        return time_module.monotonic()
+
+    def now(self) -> datetime:
+        """The current local time."""
+        return datetime.fromtimestamp(self.time())
+
+    def sleep(self, seconds: float, interrupt: threading.Event | None = None) -> bool:
+        """Wait, unless interrupted first.
+
+        Args:
+            seconds: How long to wait.
+            interrupt: Event that cuts the wait short when set.
+
+        Returns:
+            True if the wait was interrupted.
+        """
+        seconds = self.real_seconds(max(0.0, seconds))
+        if interrupt is None:
+            time_module.sleep(seconds)
+            return False
+        return interrupt.wait(seconds)
+
+    async def asleep(self, seconds: float) -> None:
+        """Wait on the event loop."""
+        await asyncio.sleep(self.real_seconds(max(0.0, seconds)))
+
+    def wait(self, condition: threading.Condition, seconds: float | None) -> None:
+        """Wait on a held condition for at most ``seconds``, or until notified."""
+        condition.wait(None if seconds is None else self.real_seconds(max(0.0, seconds)))
+
+    def real_seconds(self, seconds: float) -> float:
+        """How long a wait of this many clock seconds takes in real time."""
+        return seconds
+
+
+class ScaledClock(Clock):
+    """Time that runs ``scale`` times faster than real time.
+
+    Readings start from the real time at creation and move on ``scale``
+    seconds for every real second.
+    """
+
+    def __init__(self, scale: float):
+        """Start the clock.
+
+        Raises:
+            ValueError: If the scale is not positive.
+        """
+        if scale <= 0:
+            raise ValueError(f"Time scale must be positive, got {scale}")
+        self.scale = scale
+        self._real_start = time_module.time()
+        self._monotonic_start = time_module.monotonic()
+
+    def time(self) -> float:
+        """Wall-clock time, scaled from the moment the clock started."""
+        return self._real_start + (time_module.time() - self._real_start) * self.scale
+
+    def monotonic(self) -> float:
+        """Interval reading, scaled from the moment the clock started."""
+        elapsed = time_module.monotonic() - self._monotonic_start
+        return self._monotonic_start + elapsed * self.scale
+
+    def real_seconds(self, seconds: float) -> float:
+        """A scaled wait lasts ``1 / scale`` of its length."""
+        return seconds / self.scale
+
+
+class VirtualClock(Clock):
+    """Time that only moves when someone waits.
+
+    Attributes:
+        slept: Total seconds slept, across every caller.
+    """
+
+    def __init__(self, start: float | None = None):
+        """Start the clock at a Unix time, by default the real current one."""
+        self._now = time_module.time() if start is None else start
+        self._monotonic = 0.0
+        self._lock = threading.Lock()
+        self.slept = 0.0
+
+    def time(self) -> float:
+        """The virtual wall-clock time."""
+        with self._lock:
+            return self._now
+
+    def monotonic(self) -> float:
+        """Seconds the clock has moved on since it started."""
+        with self._lock:
+            return self._monotonic
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock forward."""
+        seconds = max(0.0, seconds)
+        with self._lock:
+            self._now += seconds
+            self._monotonic += seconds
+            self.slept += seconds
+
+    def sleep(self, seconds: float, interrupt: threading.Event | None = None) -> bool:
+        """Move the clock forward instead of waiting."""
+        if interrupt is not None and interrupt.is_set():
+            return True
+        self.advance(seconds)
+        return False
+
+    async def asleep(self, seconds: float) -> None:
+        """Move the clock forward, letting other coroutines run."""
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+    def wait(self, condition: threading.Condition, seconds: float | None) -> None:
+        """Move the clock forward by a timed wait; an untimed one really waits."""
+        if seconds is None:
+            condition.wait()
+        else:
+            self.advance(seconds)
+
+    def real_seconds(self, seconds: float) -> float:
+        """A virtual wait takes no real time."""
+        return 0.0
+
+
+_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    """The clock the process is running on."""
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """Run the process on another clock.
+
+    Returns:
+        The clock it replaces, so tests can put it back.
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
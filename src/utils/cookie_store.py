@@ -0,0 +1,125 @@
+"""Keeping an account's session cookies between runs.
+
+A scheduled run that logs in, plays a few minutes and logs out spends most of
+its requests on the login itself: the login page, the form, the check. The
+server keeps a Wicket session alive for a while after the last request, so a
+run that starts soon after the previous one can simply pick it up again.
+
+The file holds a live session, which is as good as the password for as long
+as it lasts. It is written with owner-only permissions, and the whole feature
+is off unless ``cookie_dir`` is set.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from requests.cookies import RequestsCookieJar
+
+logger = logging.getLogger(__name__)
+
+
+class CookieStore:
+    """Saves and restores one account's cookies."""
+
+    def __init__(
+        self, directory: str | Path, base_url: str, username: str, max_age_minutes: int
+    ):
+        """Locate the account's file.
+
+        Args:
+            directory: Where cookie files live.
+            base_url: Site the session was opened on. The same name on
+                another site, the stand-in for one, is another account.
+            username: Account the cookies belong to. Names are Cyrillic and
+                may hold anything, so the file is named after a hash of the
+                site and the name.
+            max_age_minutes: Saved sessions older than this are not worth a
+                resume attempt, since the server will have expired them.
+        """
+        key = f"{base_url}\n{username}"
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        self.path = Path(directory) / f"{digest}.json"
+        self.max_age_minutes = max_age_minutes
+
+    def load(self, jar: RequestsCookieJar) -> bool:
+        """Restore saved cookies into a jar.
+
+        Cookies whose own expiry has passed are skipped, and so is the whole
+        file once it is older than the allowed age.
+
+        Returns:
+            True if anything was restored.
+        """
+        try:
+            saved = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring unreadable cookie file %s: %s", self.path, exc)
+            return False
+
+        now = time.time()
+        age_minutes = (now - saved.get("saved_at", 0)) / 60
+        if age_minutes > self.max_age_minutes:
+            logger.debug("Saved session is %.0f min old; not resuming it", age_minutes)
+            return False
+
+        restored = 0
+        for cookie in saved.get("cookies", []):
+            expires = cookie.get("expires")
+            if expires is not None and expires <= now:
+                continue
+            jar.set(
+                cookie["name"],
+                cookie["value"],
+                domain=cookie.get("domain", ""),
+                path=cookie.get("path", "/"),
+                expires=expires,
+                secure=cookie.get("secure", False),
+            )
+            restored += 1
+        return restored > 0
+
+    def save(self, jar: RequestsCookieJar) -> None:
+        """Write the jar's cookies, replacing the previous file atomically.
+
+        The file is written next to its final location and renamed over it,
+        so a crash mid-write leaves the old file intact rather than half of
+        a new one.
+        """
+        cookies = [
+            {
+                "name": cookie.name,
+                "value": cookie.value,
+                "domain": cookie.domain,
+                "path": cookie.path,
+                "expires": cookie.expires,
+                "secure": cookie.secure,
+            }
+            for cookie in jar
+        ]
+        payload = json.dumps({"saved_at": time.time(), "cookies": cookies})
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # mkstemp creates the file readable by its owner only.
+        handle, temporary = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8") as stream:
+                stream.write(payload)
+                stream.flush()
+                os.fsync(stream.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            Path(temporary).unlink(missing_ok=True)
+            raise
+
+    def clear(self) -> None:
+        """Forget the saved session."""
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,62 @@
+"""Flows written once for both engines.
+
+Logging in, walking the maze and reading the task page are the same
+decisions whichever engine runs them; only the waiting differs. So each flow
+is a generator that yields every call it needs made, a request sent or a
+pause taken, and is sent back what the call returned. :func:`run` makes the
+calls as they come, blocking the thread. :func:`arun` awaits whatever a call
+returns that can be awaited, so the async classes only swap the calls for
+coroutines and inherit every decision unchanged.
+
+A call that raises has its exception thrown into the flow where it yielded,
+so the flow's own ``try`` blocks handle it under either engine.
+
+Example:
+    def _fetch(self) -> Flow[wicket.Page]:
+        response = yield partial(self.auth.request, "GET", url)
+        yield self.auth.pause_page_load
+        return wicket.Page(response)
+"""
+
+from __future__ import annotations
+
+import inspect
+from collections.abc import Callable, Generator
+from typing import Any, TypeVar
+
+_T = TypeVar("_T")
+
+Flow = Generator[Callable[[], Any], Any, _T]
+
+
+def run(flow: Flow[_T]) -> _T:
+    """Run a flow to the end on this thread, returning what it returns."""
+    result: Any = None
+    error: BaseException | None = None
+    while True:
+        try:
+            call = flow.send(result) if error is None else flow.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result, error = call(), None
+        except BaseException as exc:
+            result, error = None, exc
+
+
+async def arun(flow: Flow[_T]) -> _T:
+    """Run a flow to the end on the event loop, returning what it returns."""
+    result: Any = None
+    error: BaseException | None = None
+    while True:
+        try:
+            call = flow.send(result) if error is None else flow.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        try:
+            result = call()
+            if inspect.isawaitable(result):
+                result = await result
+            error = None
+        except BaseException as exc:
+            result, error = None, exc
@@ -0,0 +1,295 @@
+"""A ceiling on how hard the whole fleet presses on the site.
+
+Each account paces itself like a person would, but nothing paced the
+accounts together: thirty workers meant thirty times the requests, in bursts
+whenever their pauses happened to end at once. The governor here sits under
+every account's requests and keeps the total predictable:
+
+* A token bucket caps the requests per second across every account. Bursts
+  up to a second's worth pass straight through; beyond that, requests wait
+  for a token.
+* A cap on requests in flight per host keeps a slow site from piling up
+  connections, however many workers there are.
+* Accounts take turns. Waiting requests queue per account, and the accounts
+  are served round-robin, so one that fires requests back to back cannot
+  starve the others of tokens.
+
+With ``http_rate_file``, several processes share one bucket through a small
+state file locked with ``flock``, so the ceiling holds for the fleet rather
+than for each process. Requests in flight and turns are still counted per
+process.
+
+The limits are what the server sees, so they run in real time whatever the
+``--time-scale``.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+from collections import Counter, deque
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from . import instrumentation, metrics
+from .clock import Clock
+
+# Longest an async request sleeps before looking at the queue again; async
+# waiters cannot be woken the way threads are.
+_POLL = 0.05
+
+_account: ContextVar[str] = ContextVar("governed_account", default="-")
+
+
+@contextmanager
+def acting_for(username: str) -> Iterator[None]:
+    """Queue every request from this context as the account's."""
+    token = _account.set(username)
+    try:
+        yield
+    finally:
+        _account.reset(token)
+
+
+class TokenBucket:
+    """Requests per second with a burst allowance, for one process.
+
+    Not locked itself; the :class:`Governor` holding it is.
+
+    Attributes:
+        rate: Tokens added per second.
+        burst: Most tokens saved up, a second's worth unless given.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None, clock: Clock | None = None):
+        """Start full.
+
+        Raises:
+            ValueError: If the rate is not positive.
+        """
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.clock = clock or Clock()
+        self._tokens = self.burst
+        self._updated = self.clock.monotonic()
+
+    def take(self) -> float:
+        """Spend a token, returning 0, or how long until one is there."""
+        now = self.clock.monotonic()
+        self._tokens, wait = self._spend(self._tokens, now - self._updated)
+        self._updated = now
+        return wait
+
+    def _spend(self, tokens: float, elapsed: float) -> tuple[float, float]:
+        tokens = min(self.burst, tokens + max(0.0, elapsed) * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+
+class FileTokenBucket(TokenBucket):
+    """A :class:`TokenBucket` kept in a file every process on the machine shares.
+
+    The file holds the tokens left and when they were counted, on wall time
+    since processes share no other clock. Each take locks it, brings it up to
+    date and writes it back.
+    """
+
+    def __init__(
+        self, path: str | Path, rate: float, burst: float | None = None, clock: Clock | None = None
+    ):
+        """Open the file, creating it full if it is new.
+
+        Raises:
+            OSError: If the file cannot be opened, or the system has no
+                ``flock``.
+        """
+        super().__init__(rate, burst, clock)
+        try:
+            import fcntl
+        except ImportError as exc:
+            raise OSError("A shared rate limit file needs a POSIX system") from exc
+        self._fcntl = fcntl
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def take(self) -> float:
+        """Spend a token from the shared file."""
+        self._fcntl.flock(self._fd, self._fcntl.LOCK_EX)
+        try:
+            now = self.clock.time()
+            try:
+                tokens, updated = map(float, os.pread(self._fd, 64, 0).split())
+            except ValueError:
+                # New or unreadable: start full.
+                tokens, updated = self.burst, now
+            tokens, wait = self._spend(tokens, now - updated)
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, f"{tokens!r} {now!r}\n".encode(), 0)
+            return wait
+        finally:
+            self._fcntl.flock(self._fd, self._fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        """Close the file; other processes carry on with it."""
+        os.close(self._fd)
+
+
+@dataclass(eq=False)
+class _Ticket:
+    account: str
+    host: str
+
+
+class Governor:
+    """Admits every account's requests under one rate and concurrency limit.
+
+    Attributes:
+        bucket: Tokens for the rate ceiling, or None for no ceiling.
+        max_in_flight: Most requests waiting on one host at once, 0 for no
+            limit.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket | None = None,
+        max_in_flight: int = 0,
+        clock: Clock | None = None,
+    ):
+        """Start with nobody waiting."""
+        self.bucket = bucket
+        self.max_in_flight = max_in_flight
+        self.clock = clock or Clock()
+        self._queues: dict[str, deque[_Ticket]] = {}
+        # Accounts with requests waiting, in the order they get their turn.
+        self._turns: deque[str] = deque()
+        self._in_flight: Counter[str] = Counter()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """Wait for a request's turn, and hold its place while it is sent."""
+        ticket = self._join(url)
+        started = self.clock.monotonic()
+        held = False
+        with self._condition:
+            try:
+                while wait := self._admit(ticket):
+                    held = True
+                    self.clock.wait(self._condition, None if wait == math.inf else wait)
+            except BaseException:
+                self._leave(ticket)
+                raise
+        if held:
+            self._note(ticket, self.clock.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, url: str) -> AsyncIterator[None]:
+        """:meth:`slot` for the async engine, waiting on the event loop."""
+        ticket = self._join(url)
+        started = self.clock.monotonic()
+        held = False
+        try:
+            while True:
+                with self._condition:
+                    wait = self._admit(ticket)
+                if not wait:
+                    break
+                held = True
+                await self.clock.asleep(min(wait, _POLL))
+        except BaseException:
+            with self._condition:
+                self._leave(ticket)
+            raise
+        if held:
+            self._note(ticket, self.clock.monotonic() - started)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def _join(self, url: str) -> _Ticket:
+        ticket = _Ticket(_account.get(), urlsplit(url).netloc)
+        with self._condition:
+            queue = self._queues.get(ticket.account)
+            if queue is None:
+                queue = self._queues[ticket.account] = deque()
+                self._turns.append(ticket.account)
+            queue.append(ticket)
+        return ticket
+
+    def _admit(self, ticket: _Ticket) -> float:
+        """Let the ticket through if it is its turn: 0, or how long to wait.
+
+        The first account in turn whose next request has room on its host
+        goes. Called with the condition held.
+        """
+        for account in self._turns:
+            head = self._queues[account][0]
+            if self.max_in_flight and self._in_flight[head.host] >= self.max_in_flight:
+                continue
+            if head is not ticket:
+                # Someone else's turn; they notify once they go.
+                return math.inf
+            wait = self.bucket.take() if self.bucket is not None else 0.0
+            if wait:
+                return wait
+            self._leave(ticket)
+            self._in_flight[ticket.host] += 1
+            return 0.0
+        # The host is full; a request finishing notifies.
+        return math.inf
+
+    def _leave(self, ticket: _Ticket) -> None:
+        """Take a ticket out of the queue, passing the turn on. Condition held."""
+        queue = self._queues[ticket.account]
+        queue.remove(ticket)
+        self._turns.remove(ticket.account)
+        if queue:
+            self._turns.append(ticket.account)
+        else:
+            del self._queues[ticket.account]
+        self._condition.notify_all()
+
+    def _release(self, ticket: _Ticket) -> None:
+        with self._condition:
+            self._in_flight[ticket.host] -= 1
+            self._condition.notify_all()
+
+    @staticmethod
+    def _note(ticket: _Ticket, waited: float) -> None:
+        """Count the time a ticket that had to wait spent waiting."""
+        if waited > 0:
+            metrics.HTTP_THROTTLED.inc(ticket.account, amount=waited)
+            instrumentation.record_hold(waited)
+
+
+def from_settings(rate: float, max_in_flight: int, path: str | None = None) -> Governor | None:
+    """The governor for the configured limits, or None when there are none.
+
+    Args:
+        rate: Requests per second across every account, 0 for no ceiling.
+        max_in_flight: Requests in flight per host, 0 for no limit.
+        path: File to share the rate with other processes through, if any.
+
+    Raises:
+        OSError: If the shared file cannot be used.
+    """
+    if not rate and not max_in_flight:
+        return None
+    bucket: TokenBucket | None = None
+    if rate:
+        bucket = FileTokenBucket(path, rate) if path else TokenBucket(rate)
+    return Governor(bucket, max_in_flight)
@@ -0,0 +1,250 @@
+"""Recording a run's HTTP traffic and playing it back offline.
+
+A recorded run is the only honest input for measuring what the bot itself
+costs: the parsing and decisions for every page, without the network and the
+deliberate pauses around them. The recorder sits on the ``requests`` session
+as a transport adapter, in front of the adapters already mounted there, and
+writes every exchange they carry, redirect hops included, to a gzipped
+JSON-lines archive. Requests still go through the shared connection pool and
+its retries that way. The replayer is an adapter too, so the bot runs
+unchanged on top of it.
+
+Wicket URLs carry a page version that moves on with every render, so no URL
+of a replay matches its recording exactly. Exchanges are matched by method,
+path and the Wicket component instead, and served in recorded order for
+each. Door links differ only by their number and the bot picks one at
+random, so the number is left out too: whichever door a replay opens, it gets
+what the recorded door led to.
+
+Request bodies and ``Set-Cookie`` headers are never written, so an archive
+holds neither the password nor a live session.
+
+Every body is recorded whole, so a recording reads each response to its end:
+``maze_stream`` never cuts a page short while recording, and the recorded
+run's byte and wire counts are those of a run without it.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Bumped whenever the entry layout changes, so old archives are refused
+# rather than misread.
+_FORMAT = 1
+
+# "3-1.-doorLink2&action=..." in a query: the page version, then the
+# component path, whose trailing number is the door.
+_LISTENER = re.compile(r"^\d+-\d+\.-([\w-]*?)\d*(?:&|$)")
+
+_UNSTORED_HEADERS = frozenset({"set-cookie"})
+
+
+class ArchiveError(requests.ConnectionError):
+    """Raised when a replay asks for something the archive does not hold.
+
+    A ``requests`` exception, so the bot handles it as it would a network
+    failure instead of crashing.
+    """
+
+
+def archive_path(directory: str | Path, username: str) -> Path:
+    """Where an account's archive lives, named like its cookie file."""
+    digest = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+    return Path(directory) / f"{digest}.jsonl.gz"
+
+
+def request_key(method: str, url: str) -> tuple[str, str, str]:
+    """What identifies a request across runs: method, path and component.
+
+    The ``;jsessionid=`` path parameter, the page version and any door
+    number are all left out, since none of them survive into another run.
+    """
+    parts = urlsplit(url)
+    path = parts.path.split(";")[0].rstrip("/") or "/"
+    listener = _LISTENER.match(parts.query)
+    return method.upper(), path, listener.group(1) if listener else ""
+
+
+class HttpRecorder(BaseAdapter):
+    """A transport that writes every exchange it carries to an archive."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        base_url: str = "",
+        adapters: Mapping[str, BaseAdapter] | None = None,
+    ):
+        """Open the archive for writing, replacing any earlier one.
+
+        Args:
+            path: File to write.
+            base_url: Site the run talks to, noted in the archive's header.
+            adapters: What carries the requests, by URL prefix as a session
+                mounts them. A plain :class:`HTTPAdapter` when omitted.
+        """
+        super().__init__()
+        self.adapters = dict(adapters) if adapters else {"": HTTPAdapter()}
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(self.path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._write({"format": _FORMAT, "base_url": base_url, "recorded_at": time.time()})
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        """Carry a request over the adapter for its URL, then note the exchange."""
+        # The session sets ``response.elapsed`` only after this returns.
+        started = time.perf_counter()
+        response = _adapter_for(self.adapters, request.url or "").send(request, **kwargs)
+        elapsed = time.perf_counter() - started
+        self._write(
+            {
+                "method": request.method,
+                "url": request.url,
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": [
+                    [name, value]
+                    for name, value in response.headers.items()
+                    if name.lower() not in _UNSTORED_HEADERS
+                ],
+                # Kept byte for byte: undecodable bytes survive the round
+                # trip through JSON as lone surrogates.
+                "body": response.content.decode("utf-8", "surrogateescape"),
+                "elapsed": elapsed,
+            }
+        )
+        return response
+
+    def close(self) -> None:
+        """Finish the archive and close the adapters it sent through."""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+        _close(self.adapters)
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=True, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+class HttpReplayer(BaseAdapter):
+    """A transport that answers from an archive instead of the network.
+
+    Attributes:
+        served: Exchanges answered so far.
+    """
+
+    def __init__(self, path: str | Path, adapters: Mapping[str, BaseAdapter] | None = None):
+        """Load a whole archive.
+
+        Args:
+            path: File to read.
+            adapters: The adapters the replayer was mounted over. Nothing is
+                sent through them, but they are closed with it, since the
+                session no longer holds them.
+
+        Raises:
+            ArchiveError: If the file is not an archive this version can read.
+        """
+        super().__init__()
+        self.adapters = dict(adapters or {})
+        self.path = Path(path)
+        self.served = 0
+        self._queues: dict[tuple[str, str, str], deque[dict[str, Any]]] = defaultdict(deque)
+        self._lock = threading.Lock()
+
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as archive:
+                header = json.loads(archive.readline() or "{}")
+                if header.get("format") != _FORMAT:
+                    raise ArchiveError(f"{self.path} is not a format {_FORMAT} HTTP archive")
+                for line in archive:
+                    entry = json.loads(line)
+                    self._queues[request_key(entry["method"], entry["url"])].append(entry)
+        except (OSError, EOFError, ValueError) as exc:
+            raise ArchiveError(f"Could not read HTTP archive {self.path}: {exc}") from exc
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        """Answer with the next recorded response for the same request.
+
+        Raises:
+            ArchiveError: If every such response has already been served.
+        """
+        key = request_key(request.method or "GET", request.url or "")
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise ArchiveError(f"Nothing left in {self.path.name} for {' '.join(key)}")
+            entry = queue.popleft()
+            self.served += 1
+        return self._response(request, entry)
+
+    def close(self) -> None:
+        """Close the adapters it replaced; the archive was read whole."""
+        _close(self.adapters)
+
+    @staticmethod
+    def _response(request: requests.PreparedRequest, entry: dict[str, Any]) -> requests.Response:
+        """Rebuild a recorded response as the one this request received."""
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response._content = entry["body"].encode("utf-8", "surrogateescape")
+        response._content_consumed = True
+        response.url = request.url or entry["url"]
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+
+def record(session: requests.Session, path: str | Path, base_url: str = "") -> HttpRecorder:
+    """Make a session write everything it sends and receives to an archive.
+
+    The requests still go through the adapters the session had mounted.
+    """
+    recorder = HttpRecorder(path, base_url, session.adapters)
+    _mount(session, recorder)
+    return recorder
+
+
+def replay(session: requests.Session, path: str | Path) -> HttpReplayer:
+    """Make a session answer every request from an archive."""
+    replayer = HttpReplayer(path, session.adapters)
+    _mount(session, replayer)
+    return replayer
+
+
+def _mount(session: requests.Session, adapter: BaseAdapter) -> None:
+    """Put an adapter in front of every URL the session sends to."""
+    for prefix in list(session.adapters):
+        session.mount(prefix, adapter)
+
+
+def _adapter_for(adapters: Mapping[str, BaseAdapter], url: str) -> BaseAdapter:
+    """The adapter for a URL, matched on prefix as a session does."""
+    for prefix in sorted(adapters, key=len, reverse=True):
+        if url.lower().startswith(prefix.lower()):
+            return adapters[prefix]
+    raise requests.exceptions.InvalidSchema(f"No connection adapters were found for {url!r}")
+
+
+def _close(adapters: Mapping[str, BaseAdapter]) -> None:
+    """Close each of a set of adapters once."""
+    for adapter in {id(adapter): adapter for adapter in adapters.values()}.values():
+        adapter.close()
@@ -10,6 +10,9 @@ reaction times are: a dense cluster of short gaps with a thin tail of long
 ones. On top of that a small fraction of actions get a real break, and both
 the session length and the hours of play can be capped — a bot that plays
 without pause and without end is the easiest kind to notice.
+
+Every wait and every reading of the time goes through :mod:`.clock`, so a
+simulated run can be sped up without changing how any of this behaves.
 """
 
 from __future__ import annotations
@@ -17,10 +20,16 @@ from __future__ import annotations
 import logging
 import math
 import random
+import threading
 import time as time_module
-from datetime import datetime, time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
 
 from ..config import Delays
+from . import instrumentation
+from .clock import Clock, get_clock
 
 logger = logging.getLogger(__name__)
 
@@ -30,17 +39,75 @@ _P10_TO_P90 = 2 * 1.2816
 # No action is ever faster than this, whatever the distribution returns.
 _FLOOR_SECONDS = 0.4
 
+# Set by interrupt() to cut every pause in the process short.
+_interrupted = threading.Event()
+
+# Set while an account winds down, where an interrupt must not raise.
+_winding_down: ContextVar[bool] = ContextVar("winding_down", default=False)
+
+
+def interrupt() -> None:
+    """Make every current and future pause raise KeyboardInterrupt at once.
+
+    Ctrl-C only reaches the main thread. Accounts playing in worker threads
+    spend nearly all their time in a pause, so ending those is how they learn
+    the run is over, rather than finishing their whole session first.
+    """
+    _interrupted.set()
+
+
+@contextmanager
+def winding_down() -> Iterator[None]:
+    """Let pauses inside end early on an interrupt rather than raise it.
+
+    An interrupted account still has to log out, which takes a pause of its
+    own; raising there would leave the session open on the server. While an
+    account winds down, an interrupt only skips what is left of a pause.
+    """
+    token = _winding_down.set(True)
+    try:
+        yield
+    finally:
+        _winding_down.reset(token)
+
+
+def _sleep(seconds: float, clock: Clock) -> None:
+    """Sleep, unless the run has been interrupted."""
+    started = time_module.perf_counter()
+    try:
+        interrupted = clock.sleep(seconds, _interrupted)
+    finally:
+        instrumentation.record_sleep(time_module.perf_counter() - started)
+    if interrupted and not _winding_down.get():
+        raise KeyboardInterrupt
+
+
+async def _asleep(seconds: float, clock: Clock) -> None:
+    """Sleep on the event loop."""
+    started = time_module.perf_counter()
+    try:
+        await clock.asleep(seconds)
+    finally:
+        instrumentation.record_sleep(time_module.perf_counter() - started)
+
 
 class HumanBehavior:
     """Generates varied delays instead of a fixed request cadence."""
 
-    def __init__(self, delays: Delays | None = None):
+    def __init__(self, delays: Delays | None = None, clock: Clock | None = None):
         """Initialise with a timing envelope.
 
         Args:
             delays: Timing bounds. Defaults are used when omitted.
+            clock: Clock to pause on. The process clock when omitted.
         """
         self.delays = delays or Delays()
+        self._clock = clock
+
+    @property
+    def clock(self) -> Clock:
+        """The clock pauses wait on."""
+        return self._clock or get_clock()
 
     def delay(self) -> float:
         """Return a randomised pause between actions, in seconds.
@@ -80,24 +147,38 @@ class HumanBehavior:
             multiplier: Scales the pause; use a value above 1 after a setback,
                 where a person would naturally hesitate longer.
         """
-        time_module.sleep(self.delay() * multiplier)
+        _sleep(self.delay() * multiplier, self.clock)
 
     def pause_page_load(self) -> None:
         """Sleep for :meth:`page_load_delay` seconds."""
-        time_module.sleep(self.page_load_delay())
+        _sleep(self.page_load_delay(), self.clock)
+
+    async def apause(self, multiplier: float = 1.0) -> None:
+        """Like :meth:`pause`, but yields to the event loop while waiting.
+
+        The async engine is built on this: an account in a pause costs a
+        timer entry in the loop rather than a whole blocked thread.
+        """
+        await _asleep(self.delay() * multiplier, self.clock)
+
+    async def apause_page_load(self) -> None:
+        """Like :meth:`pause_page_load`, but yields to the event loop."""
+        await _asleep(self.page_load_delay(), self.clock)
 
 
 class SessionBudget:
     """Caps how long a single run may keep playing."""
 
-    def __init__(self, max_minutes: int):
+    def __init__(self, max_minutes: int, clock: Clock | None = None):
         """Start the clock.
 
         Args:
             max_minutes: Minutes allowed, or 0 for no limit.
+            clock: Clock to measure on. The process clock when omitted.
         """
         self.max_minutes = max_minutes
-        self.started = time_module.monotonic()
+        self.clock = clock or get_clock()
+        self.started = self.clock.monotonic()
 
     @property
     def unlimited(self) -> bool:
@@ -106,7 +187,7 @@ class SessionBudget:
 
     def elapsed_minutes(self) -> float:
         """Minutes played so far."""
-        return (time_module.monotonic() - self.started) / 60
+        return (self.clock.monotonic() - self.started) / 60
 
     def expired(self) -> bool:
         """Whether the allotted time has run out."""
@@ -120,7 +201,7 @@ def within_active_hours(window: tuple[time, time] | None, now: datetime | None =
 
     Args:
         window: Start and end of the window, or None to allow any time.
-        now: Time to test. Defaults to the current local time.
+        now: Time to test. Defaults to the clock's current local time.
 
     Returns:
         True if playing is allowed right now.
@@ -129,9 +210,29 @@ def within_active_hours(window: tuple[time, time] | None, now: datetime | None =
         return True
 
     start, end = window
-    current = (now or datetime.now()).time()
+    current = (now or get_clock().now()).time()
 
     if start <= end:
         return start <= current < end
     # The window wraps past midnight.
     return current >= start or current < end
+
+
+def seconds_until_active(window: tuple[time, time] | None, now: datetime | None = None) -> float:
+    """Return how long until playing is allowed.
+
+    Args:
+        window: Start and end of the window, or None to allow any time.
+        now: Time to measure from. Defaults to the clock's current local time.
+
+    Returns:
+        0 inside the window, otherwise the seconds until it next opens.
+    """
+    now = now or get_clock().now()
+    if within_active_hours(window, now):
+        return 0.0
+
+    opens = datetime.combine(now.date(), window[0])  # type: ignore[index]
+    if opens <= now:
+        opens += timedelta(days=1)
+    return (opens - now).total_seconds()
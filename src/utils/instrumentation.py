@@ -0,0 +1,335 @@
+"""Where a run's wall time goes: the network, parsing, or pausing.
+
+A run is mostly deliberate waiting, but from the log alone there is no
+telling how much, or whether a slow run was the site, the parser or the
+pauses. Three hooks answer that:
+
+* every response the session receives, redirect hops included, is timed and
+  weighed per endpoint (``/login``, ``/home``, ``/doors``, ``/quests``), both
+  as the body came over the wire and once decompressed;
+* :func:`src.wicket.parse` reports how long each tree took to build;
+* :class:`~src.utils.human_like.HumanBehavior` reports every pause.
+
+A request can also be held back before it goes out: queued by the fleet's
+governor, backing off before a retry or waiting out an outage. That time is
+counted apart as held, and taken out of the response's latency, so the
+endpoint figures stay what the site took to answer.
+
+The figures go to whichever :class:`RunStats` the current account is being
+measured into, found through a context variable the same way the log filter
+finds the account name, so threads and coroutines never share one and no
+lock is needed. Outside :func:`measuring` only responses are counted, and
+only in the process-wide :mod:`~src.utils.metrics`.
+"""
+
+from __future__ import annotations
+
+import bisect
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import requests
+
+from . import metrics
+
+# Upper bounds of the latency buckets, in seconds; the last one is open.
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current: ContextVar[RunStats | None] = ContextVar("run_stats", default=None)
+# Time held back since the last response was counted, to take out of it.
+_unclaimed: ContextVar[float] = ContextVar("unclaimed_hold", default=0.0)
+
+
+@dataclass
+class EndpointStats:
+    """Responses from one endpoint.
+
+    Attributes:
+        buckets: Responses per latency bucket, one more than
+            :data:`LATENCY_BUCKETS` for those slower than the last bound.
+        seconds: Total time from sending to the last byte of the body.
+        bytes: Total body size, decompressed.
+        wire_bytes: Total body size as transferred, compressed or not.
+        slowest: Longest single response.
+        statuses: Responses per HTTP status.
+    """
+
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    seconds: float = 0.0
+    bytes: int = 0
+    wire_bytes: int = 0
+    slowest: float = 0.0
+    statuses: dict[int, int] = field(default_factory=dict)
+
+    @property
+    def count(self) -> int:
+        """Responses seen."""
+        return sum(self.buckets)
+
+    def add(self, seconds: float, size: int, status: int, wire: int | None = None) -> None:
+        """Count one response; ``wire`` defaults to ``size``, as if uncompressed."""
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.seconds += seconds
+        self.bytes += size
+        self.wire_bytes += size if wire is None else wire
+        self.slowest = max(self.slowest, seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile(self, share: float) -> float:
+        """Upper bound of the bucket holding the given share of responses.
+
+        Returns:
+            Seconds, or infinity when that share lies past the last bound.
+        """
+        wanted = share * self.count
+        seen = 0
+        for bound, count in zip((*LATENCY_BUCKETS, float("inf")), self.buckets):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return float("inf")
+
+    def merge(self, other: EndpointStats) -> None:
+        """Add another set of responses to this one."""
+        self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, other.buckets)]
+        self.seconds += other.seconds
+        self.bytes += other.bytes
+        self.wire_bytes += other.wire_bytes
+        self.slowest = max(self.slowest, other.slowest)
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+@dataclass
+class RunStats:
+    """How one account's runs spent their time.
+
+    Attributes:
+        endpoints: Response statistics per endpoint path.
+        parse_seconds: Time spent building trees in ``wicket.parse``.
+        parses: Trees built.
+        sleep_seconds: Time spent in deliberate pauses.
+        sleeps: Pauses taken.
+        held_seconds: Time requests were held back before being sent.
+        holds: Times a request was held back.
+        wall_seconds: Time spent inside :func:`measuring`.
+    """
+
+    endpoints: dict[str, EndpointStats] = field(default_factory=dict)
+    parse_seconds: float = 0.0
+    parses: int = 0
+    sleep_seconds: float = 0.0
+    sleeps: int = 0
+    held_seconds: float = 0.0
+    holds: int = 0
+    wall_seconds: float = 0.0
+
+    @property
+    def network_seconds(self) -> float:
+        """Time spent waiting for responses."""
+        return sum(endpoint.seconds for endpoint in self.endpoints.values())
+
+    @property
+    def requests(self) -> int:
+        """Responses received."""
+        return sum(endpoint.count for endpoint in self.endpoints.values())
+
+    @property
+    def bytes(self) -> int:
+        """Body bytes received, decompressed."""
+        return sum(endpoint.bytes for endpoint in self.endpoints.values())
+
+    @property
+    def wire_bytes(self) -> int:
+        """Body bytes as transferred."""
+        return sum(endpoint.wire_bytes for endpoint in self.endpoints.values())
+
+    def summary(self) -> str:
+        """One line splitting the wall time between its parts."""
+        other = (
+            self.wall_seconds
+            - self.network_seconds
+            - self.parse_seconds
+            - self.sleep_seconds
+            - self.held_seconds
+        )
+        held = f"held {self.held_seconds:.1f} s ({self.holds}), " if self.holds else ""
+        return (
+            f"{self.wall_seconds:.1f} s: network {self.network_seconds:.2f} s "
+            f"({self.requests} req, {self.bytes / 1024:.0f} KiB, "
+            f"{self.wire_bytes / 1024:.0f} KiB on the wire), "
+            f"parse {self.parse_seconds:.2f} s ({self.parses}), "
+            f"sleep {self.sleep_seconds:.1f} s ({self.sleeps}), "
+            f"{held}other {max(0.0, other):.2f} s"
+        )
+
+    def endpoint_lines(self) -> list[str]:
+        """One line per endpoint, busiest first."""
+        lines = []
+        ranked = sorted(self.endpoints.items(), key=lambda item: item[1].count, reverse=True)
+        for path, endpoint in ranked:
+            lines.append(
+                f"{path:<9} {endpoint.count:>5} req  "
+                f"p50 ≤{_millis(endpoint.quantile(0.5))}  "
+                f"p90 ≤{_millis(endpoint.quantile(0.9))}  "
+                f"max {endpoint.slowest * 1000:.0f} ms  "
+                f"avg {endpoint.bytes / endpoint.count / 1024:.1f} KiB, "
+                f"{endpoint.wire_bytes / endpoint.count / 1024:.1f} KiB on the wire"
+            )
+        return lines
+
+
+def _millis(seconds: float) -> str:
+    return "∞" if seconds == float("inf") else f"{seconds * 1000:.0f} ms"
+
+
+def endpoint(url: str) -> str:
+    """The endpoint a URL belongs to: its first path segment.
+
+    ``;jsessionid=``, the query and anything deeper in the path are dropped,
+    so every door of the maze counts as ``/doors``.
+    """
+    path = urlsplit(url).path.split(";")[0]
+    return "/" + path.lstrip("/").split("/")[0]
+
+
+@contextmanager
+def measuring(stats: RunStats) -> Iterator[RunStats]:
+    """Send every hook's figures from this context to ``stats``."""
+    token = _current.set(stats)
+    started = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.wall_seconds += time.perf_counter() - started
+        _current.reset(token)
+
+
+def current() -> RunStats | None:
+    """The statistics being collected here, if any."""
+    return _current.get()
+
+
+def record_response(
+    url: str, seconds: float, size: int, status: int, wire: int | None = None
+) -> None:
+    """Count a response received, in the process metrics as well.
+
+    Args:
+        url: Where the response came from.
+        seconds: Time from sending to the last byte of the body.
+        size: Body size, decompressed.
+        status: HTTP status.
+        wire: Body size as transferred, when known; otherwise taken to be
+            ``size``.
+    """
+    path = endpoint(url)
+    metrics.HTTP_RESPONSES.inc(path, status)
+    metrics.HTTP_SECONDS.inc(path, amount=seconds)
+    metrics.HTTP_BYTES.inc(path, amount=size)
+    metrics.HTTP_WIRE_BYTES.inc(path, amount=size if wire is None else wire)
+    stats = _current.get()
+    if stats is None:
+        return
+    found = stats.endpoints.get(path)
+    if found is None:
+        found = stats.endpoints[path] = EndpointStats()
+    found.add(seconds, size, status, wire)
+
+
+def record_parse(seconds: float) -> None:
+    """Count a tree built."""
+    stats = _current.get()
+    if stats is not None:
+        stats.parse_seconds += seconds
+        stats.parses += 1
+
+
+def record_sleep(seconds: float) -> None:
+    """Count a deliberate pause."""
+    stats = _current.get()
+    if stats is not None:
+        stats.sleep_seconds += seconds
+        stats.sleeps += 1
+
+
+def record_hold(seconds: float) -> None:
+    """Count time a request waited before being sent."""
+    _unclaimed.set(_unclaimed.get() + seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.held_seconds += seconds
+        stats.holds += 1
+
+
+def _claim_held() -> float:
+    """Time held back since the last response, which that one is spared."""
+    held = _unclaimed.get()
+    if held:
+        _unclaimed.set(0.0)
+    return held
+
+
+def _on_response(response: requests.Response, *args, **kwargs) -> None:
+    """Session hook: time a response through to the end of its body.
+
+    A streamed response is left for its reader, which may not want all of
+    it, to count with :func:`record_streamed`.
+    """
+    if kwargs.get("stream"):
+        return
+    started = time.perf_counter()
+    body = response.content or b""
+    seconds = max(0.0, response.elapsed.total_seconds() - _claim_held())
+    seconds += time.perf_counter() - started
+    record_response(
+        response.url, seconds, len(body), response.status_code, wire_size(response, len(body))
+    )
+
+
+def record_streamed(response: requests.Response, seconds: float, size: int) -> None:
+    """Count a streamed response once its reader has finished with it.
+
+    Args:
+        response: The response, with any redirects that led to it.
+        seconds: Time from sending the first request to the last byte read.
+        size: Body bytes read, decompressed.
+    """
+    seconds -= _claim_held()
+    for hop in response.history:
+        body = hop.content or b""
+        hop_seconds = hop.elapsed.total_seconds()
+        seconds -= hop_seconds
+        record_response(hop.url, hop_seconds, len(body), hop.status_code, wire_size(hop, len(body)))
+    record_response(
+        response.url, max(0.0, seconds), size, response.status_code, wire_size(response, size)
+    )
+
+
+def wire_size(response: requests.Response, size: int) -> int | None:
+    """How many body bytes a response took on the wire, if that is known.
+
+    urllib3 counts what it reads from the socket, but only for bodies sent
+    with a length; a chunked body, or one replayed from an archive, reports
+    nothing and is taken to be its decoded size.
+    """
+    tell = getattr(response.raw, "tell", None)
+    if tell is None:
+        return None
+    wire = tell()
+    return wire if wire or not size else None
+
+
+def instrument(session: requests.Session) -> None:
+    """Have a session report every response it receives.
+
+    Anything without ``requests`` hooks, such as a stand-in session in a
+    test, is left as it is.
+    """
+    hooks = getattr(session, "hooks", None)
+    if hooks is not None and _on_response not in hooks["response"]:
+        hooks["response"].append(_on_response)
@@ -0,0 +1,282 @@
+"""Counters and gauges for watching a fleet, in the Prometheus text format.
+
+The log says what one account did; these say how the whole process is doing
+over days of running as a daemon: responses by endpoint and status, bytes
+before and after decompression, maze attempts, wins and dead ends by room,
+keys left, failed logins and how long each run took. They are kept for the
+life of the process and published in one of two ways:
+
+* :func:`serve` answers ``GET /metrics`` on a local port for a scraper;
+* :func:`write_textfile` writes the same text to a file for node_exporter's
+  textfile collector, replacing it atomically so a half-written file is
+  never read.
+
+Counting sits on the request path of every account, so it takes no lock.
+Each thread counts into its own shard, which no other thread writes, and a
+scrape sums copies of the shards. Copying a plain dict and storing into one
+are single steps under the GIL, so neither side ever waits for the other. A
+lock is only taken the first time a thread counts anything.
+"""
+
+from __future__ import annotations
+
+import abc
+import logging
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TypeVar
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+
+_M = TypeVar("_M", bound="_Metric")
+
+
+class _Metric(abc.ABC):
+    """A named family of values, one per combination of label values."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def _key(self, values: tuple[object, ...]) -> Labels:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {values}")
+        return tuple(str(value) for value in values)
+
+    @abc.abstractmethod
+    def samples(self) -> dict[Labels, float]:
+        """Every current value, by label values."""
+
+    def render(self) -> list[str]:
+        """The metric's lines in the text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """A total that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        super().__init__(name, documentation, labels)
+        self._local = threading.local()
+        self._shards: list[dict[Labels, float]] = []
+        self._adding_shard = threading.Lock()
+
+    def inc(self, *labels: object, amount: float = 1.0) -> None:
+        """Add to the total for these label values."""
+        key = self._key(labels)
+        shard = self._shard()
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def _shard(self) -> dict[Labels, float]:
+        """This thread's own share of the totals."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._adding_shard:
+                self._shards.append(shard)
+            return shard
+
+    def samples(self) -> dict[Labels, float]:
+        """Totals summed over every thread that has counted."""
+        totals: dict[Labels, float] = {}
+        for shard in list(self._shards):
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+class Gauge(_Metric):
+    """A value that is set rather than added to."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: object) -> None:
+        """Replace the value for these label values."""
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> dict[Labels, float]:
+        """The latest value for every label combination set so far."""
+        return self._values.copy()
+
+
+class Registry:
+    """The metrics a process publishes."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def counter(self, name: str, documentation: str, labels: Labels = ()) -> Counter:
+        """Create and register a counter."""
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Labels = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self._add(Gauge(name, documentation, labels))
+
+    def _add(self, metric: _M) -> _M:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Every metric in the text exposition format."""
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _label_text(names: Labels, values: Labels) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+REGISTRY = Registry()
+
+HTTP_RESPONSES = REGISTRY.counter(
+    "nebo_http_responses_total",
+    "Responses received, redirect hops included.",
+    ("endpoint", "status"),
+)
+HTTP_SECONDS = REGISTRY.counter(
+    "nebo_http_response_seconds_total", "Time spent receiving responses.", ("endpoint",)
+)
+HTTP_BYTES = REGISTRY.counter(
+    "nebo_http_response_bytes_total", "Body bytes received, decompressed.", ("endpoint",)
+)
+HTTP_WIRE_BYTES = REGISTRY.counter(
+    "nebo_http_response_wire_bytes_total", "Body bytes as transferred.", ("endpoint",)
+)
+HTTP_RETRIES = REGISTRY.counter(
+    "nebo_http_retries_total", "Requests sent again after failing.", ("endpoint",)
+)
+HTTP_THROTTLED = REGISTRY.counter(
+    "nebo_http_throttled_seconds_total",
+    "Time requests waited for the fleet's rate or concurrency limit.",
+    ("account",),
+)
+CIRCUIT_OPEN = REGISTRY.gauge(
+    "nebo_circuit_open", "1 while requests to the host are held back, else 0.", ("host",)
+)
+LOGINS = REGISTRY.counter(
+    "nebo_logins_total",
+    "Login attempts by outcome: ok, rejected, markup or network.",
+    ("account", "outcome"),
+)
+MAZE_ATTEMPTS = REGISTRY.counter(
+    "nebo_maze_attempts_total", "Walks started from the maze entrance.", ("account",)
+)
+MAZE_COMPLETIONS = REGISTRY.counter(
+    "nebo_maze_completions_total", "Mazes completed, prize included.", ("account",)
+)
+MAZE_DEAD_ENDS = REGISTRY.counter(
+    "nebo_maze_dead_ends_total", "Dead ends, by the room whose door led there.", ("room",)
+)
+KEYS_LEFT = REGISTRY.gauge(
+    "nebo_keys_left", "Keys remaining as the last maze page showed them.", ("account",)
+)
+QUESTS_DONE = REGISTRY.gauge(
+    "nebo_quests_done_today", "Tasks completed today as the task page showed them.", ("account",)
+)
+QUEST_WAIT = REGISTRY.gauge(
+    "nebo_quest_wait_seconds", "Time until a task is next available, 0 if one is now.", ("account",)
+)
+RUN_SECONDS = REGISTRY.gauge(
+    "nebo_run_duration_seconds", "Wall time of the account's last run.", ("account",)
+)
+RUN_FINISHED = REGISTRY.gauge(
+    "nebo_run_finished_timestamp_seconds", "When the account's last run ended.", ("account",)
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MetricsServer
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        logger.debug("Metrics scrape: " + format, *args)
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Answers scrapes of a registry."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], registry: Registry = REGISTRY):
+        self.registry = registry
+        super().__init__(address, _Handler)
+
+
+def serve(port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> MetricsServer:
+    """Answer scrapes on a port from a background thread.
+
+    Listens on the loopback interface by default: account names are in the
+    labels, and nothing outside the machine needs them.
+    """
+    server = MetricsServer((host, port), registry)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+def write_textfile(path: str | Path, registry: Registry = REGISTRY) -> None:
+    """Write every metric to a file, replacing it in one step.
+
+    The text goes to a temporary file beside the target first and is then
+    renamed over it, so a collector never reads a partial file, even with
+    several accounts finishing at once.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    try:
+        temporary.write_text(registry.render(), encoding="utf-8")
+        os.replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,142 @@
+"""Profiling individual accounts' runs: CPU with cProfile, memory with tracemalloc.
+
+A run is nearly all waiting, so a profile on wall time would be nothing but
+``Event.wait`` under :class:`~src.utils.human_like.HumanBehavior`. The
+profiler here times on the thread's own CPU clock instead: a pause or a
+response in flight costs nothing and drops out of the profile, leaving the
+parsing and lookups that actually use the processor. How long was spent
+pausing is logged beside it from the run's
+:class:`~src.utils.instrumentation.RunStats`.
+
+Each account gets its own ``.pstats`` file, named like its cookie file,
+accumulating across every visit of a daemon, and optionally a report of the
+lines that allocated the most memory during its runs. Both are
+written to one directory after every run.
+
+Up to Python 3.11 cProfile only watches the thread that enabled it, so
+accounts playing side by side keep separate profiles. From 3.12 it watches
+every thread and only one profile may be on at a time, so there profiling
+takes ``--workers 1``; see :data:`PER_THREAD`. tracemalloc watches the whole
+process on any version, so with several workers an account's report includes
+what the others allocated meanwhile; ``--workers 1`` gives clean reports.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import hashlib
+import logging
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Frames kept per allocation; enough to see which lookup called into bs4.
+_MALLOC_FRAMES = 10
+
+# Whether cProfile keeps to the thread that enabled it. From 3.12 it is built
+# on sys.monitoring, which sees every thread and lets one profiler in at a time.
+PER_THREAD = sys.version_info < (3, 12)
+
+
+def profile_path(directory: str | Path, username: str, suffix: str) -> Path:
+    """Where an account's profile lives, named like its cookie file."""
+    digest = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+    return Path(directory) / f"{digest}{suffix}"
+
+
+class AccountProfiler:
+    """Profiles each account's runs into a directory.
+
+    Attributes:
+        directory: Where the files are written.
+        trace_malloc: Whether allocations are traced too.
+        top: Allocation sites listed per report.
+    """
+
+    def __init__(self, directory: str | Path, trace_malloc: bool = False, top: int = 25):
+        """Prepare the directory and, if asked, start tracing allocations."""
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.trace_malloc = trace_malloc
+        self.top = top
+        self._profiles: dict[str, cProfile.Profile] = {}
+        self._lock = threading.Lock()
+        if trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start(_MALLOC_FRAMES)
+
+    @contextmanager
+    def profiling(self, username: str) -> Iterator[None]:
+        """Profile one run of an account, then write its files."""
+        with self._lock:
+            profile = self._profiles.setdefault(username, cProfile.Profile(time.thread_time))
+        before = self._snapshot()
+        try:
+            profile.enable()
+        except ValueError as exc:
+            # Another profiler is active; the run goes ahead unprofiled.
+            logger.warning("Could not profile %s: %s", username, exc)
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._write(username, profile, before)
+
+    def _snapshot(self) -> tracemalloc.Snapshot | None:
+        if not self.trace_malloc:
+            return None
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+
+    def _write(
+        self, username: str, profile: cProfile.Profile, before: tracemalloc.Snapshot | None
+    ) -> None:
+        path = profile_path(self.directory, username, ".pstats")
+        try:
+            profile.dump_stats(path)
+        except OSError as exc:
+            logger.warning("Could not write the profile of %s to %s: %s", username, path, exc)
+        else:
+            cpu = pstats.Stats(profile).total_tt
+            stats = instrumentation.current()
+            paused = f", {stats.sleep_seconds:.1f} s of pauses left out" if stats else ""
+            logger.info(
+                "Profile of %s: %.2f s of CPU%s, written to %s", username, cpu, paused, path
+            )
+
+        after = self._snapshot()
+        if before is None or after is None:
+            return
+        path = profile_path(self.directory, username, ".malloc.txt")
+        try:
+            path.write_text(self._malloc_report(username, before, after), encoding="utf-8")
+        except OSError as exc:
+            logger.warning("Could not write the allocation report of %s: %s", username, exc)
+            return
+        logger.info("Allocation report of %s written to %s", username, path)
+
+    def _malloc_report(
+        self, username: str, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot
+    ) -> str:
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"Allocations during the last run of {username}",
+            f"Traced now {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB",
+            "",
+            f"Top {self.top} lines by growth:",
+        ]
+        lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[: self.top])
+        lines += ["", f"Top {self.top} lines by size held:"]
+        lines.extend(str(stat) for stat in after.statistics("lineno")[: self.top])
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,500 @@
+"""Riding out a slow or failing site: learned timeouts, retries, a circuit breaker.
+
+One fixed timeout fits no page. ``/home`` answers in a fraction of a second,
+so a request to it still waiting after thirty has a stuck connection, not a
+heavy page. Timeouts here are learned instead. Each endpoint's recent
+time to first byte sets its read timeout at a few times its 99th percentile.
+The host's latency as a whole sets the connect timeout. The configured
+``timeout`` stays the ceiling, and until an endpoint has answered often
+enough to judge, it is all there is.
+
+Only GETs that merely render a page are retried: ``/home`` and ``/quests``,
+with at most a page version in the query. A door link or a form post changes
+something, and sending it twice could spend a key or a task. Retries come
+out of a budget the whole process shares: every request earns a fifth of a
+retry, so while the site struggles, retries add a fifth to the load instead
+of multiplying it. The wait before each retry is drawn at random up to a
+limit that doubles each time, so accounts that failed together do not come
+back together.
+
+A circuit breaker per host catches an outage. After five failures in a row,
+timeouts, dropped connections and 5xx answers alike, every account's
+requests to that host wait for a cool-down instead of timing out one after
+another. Then a single request goes through as a probe. If the probe
+succeeds, everyone carries on. If it fails, the cool-down doubles, up to
+five minutes. A request gives up with :class:`CircuitOpenError` after ten
+minutes of waiting, which the bot handles like any network failure.
+
+Every try, retries included, waits its turn under the fleet's
+:class:`~src.utils.governor.Governor` when there is one, and is timed from
+when it is let through.
+
+Waits run on the process clock, so they scale with ``--time-scale``. Latency
+is network time and is measured in real seconds.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, TypeVar
+from urllib.parse import urlsplit
+
+import requests
+
+from . import instrumentation, metrics
+from .clock import get_clock
+from .governor import Governor
+
+logger = logging.getLogger(__name__)
+
+_R = TypeVar("_R")
+
+# Pages that are only read, so fetching one twice does no harm.
+_IDEMPOTENT_PATHS = frozenset({"/home", "/quests"})
+# Answers from a site in trouble rather than from a page that is wrong.
+_FAILURE_STATUSES = frozenset({500, 502, 503, 504})
+
+# Latest responses kept per endpoint, and how many it takes to judge.
+_WINDOW = 200
+_MIN_SAMPLES = 20
+# Learned timeouts are this many times the latency seen, and never shorter
+# than the floor: a busy evening can slow everything down at once.
+_HEADROOM = 3.0
+_FLOOR = 2.0
+# Requests a learned latency is used for before it is worked out again from
+# the samples; sorting them for every request would cost more than it tells.
+_RELEARN_AFTER = 20
+
+_RETRY_RATIO = 0.2
+_RETRY_RESERVE = 10.0
+_BACKOFF_BASE = 0.5
+_BACKOFF_CAP = 8.0
+
+_TRIP_AFTER = 5
+_COOLDOWN = 5.0
+_MAX_COOLDOWN = 300.0
+# How often requests held back look again while a probe is out.
+_PROBE_POLL = 1.0
+_MAX_HOLD = 600.0
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised when the site stays down for longer than a request will wait.
+
+    A ``requests`` exception, so the bot handles it as it would any network
+    failure.
+    """
+
+
+def is_idempotent(method: str, url: str) -> bool:
+    """Whether a request only reads a page and may be sent again."""
+    if method.upper() != "GET":
+        return False
+    query = urlsplit(url).query
+    return instrumentation.endpoint(url) in _IDEMPOTENT_PATHS and (not query or query.isdigit())
+
+
+def _quantile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class AdaptiveTimeouts:
+    """Connect and read timeouts learned from how fast each endpoint answers.
+
+    Attributes:
+        window: Latest responses kept per endpoint.
+        min_samples: Responses an endpoint needs before its timeout is learned.
+        headroom: Multiple of the latency seen that a timeout allows.
+        floor: Shortest timeout ever set, in seconds.
+        relearn_after: Requests a learned latency serves before it is worked
+            out again.
+    """
+
+    def __init__(
+        self,
+        window: int = _WINDOW,
+        min_samples: int = _MIN_SAMPLES,
+        headroom: float = _HEADROOM,
+        floor: float = _FLOOR,
+        relearn_after: int = _RELEARN_AFTER,
+    ):
+        """Start with nothing learned."""
+        self.window = window
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.floor = floor
+        self.relearn_after = relearn_after
+        self._samples: dict[tuple[str, str], deque[float]] = {}
+        # Latency learned for an endpoint, or with no path for the whole
+        # host, and the requests it has left to serve.
+        self._learned: dict[tuple[str, str | None], tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, url: str, seconds: float) -> None:
+        """Note how long a response took to start arriving."""
+        key = (urlsplit(url).netloc, instrumentation.endpoint(url))
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def limits(self, url: str, ceiling: float) -> tuple[float, float]:
+        """The connect and read timeouts for a request.
+
+        Args:
+            url: Where the request goes.
+            ceiling: The longest either may be.
+        """
+        host, path = urlsplit(url).netloc, instrumentation.endpoint(url)
+        with self._lock:
+            # Connecting is a fraction of any response, so the whole host's
+            # latency bounds it, and new endpoints get it learned from the start.
+            connect = self._latency(host, None, 0.9)
+            read = self._latency(host, path, 0.99)
+        return self._bound(connect, ceiling), self._bound(read, ceiling)
+
+    def _latency(self, host: str, path: str | None, q: float) -> float | None:
+        """A quantile of the latency seen, None until there are samples enough.
+
+        Reused for :attr:`relearn_after` requests once learned. Called with
+        the lock held.
+        """
+        key = (host, path)
+        learned = self._learned.get(key)
+        if learned is not None and learned[1] > 0:
+            self._learned[key] = (learned[0], learned[1] - 1)
+            return learned[0]
+        if path is None:
+            samples = [
+                seconds
+                for (other, _), kept in self._samples.items()
+                if other == host
+                for seconds in kept
+            ]
+        else:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        latency = _quantile(samples, q)
+        self._learned[key] = (latency, self.relearn_after - 1)
+        return latency
+
+    def _bound(self, latency: float | None, ceiling: float) -> float:
+        if latency is None:
+            return ceiling
+        return min(ceiling, max(self.floor, latency * self.headroom))
+
+
+class RetryBudget:
+    """Retries the process may spend, earned by the requests it sends.
+
+    Attributes:
+        ratio: Retries earned per request.
+        reserve: Most retries saved up, and what there is to start with.
+    """
+
+    def __init__(self, ratio: float = _RETRY_RATIO, reserve: float = _RETRY_RESERVE):
+        """Start with the reserve full."""
+        self.ratio = ratio
+        self.reserve = reserve
+        self._balance = reserve
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        """Earn a share of a retry for a request sent."""
+        with self._lock:
+            self._balance = min(self.reserve, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend a retry, if one is left."""
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Holds every request to a host back while it is down.
+
+    Attributes:
+        host: The host guarded.
+        trip_after: Failures in a row that open the circuit.
+        failures: Failures in a row so far.
+        open: Whether requests are being held back.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        trip_after: int = _TRIP_AFTER,
+        cooldown: float = _COOLDOWN,
+        max_cooldown: float = _MAX_COOLDOWN,
+    ):
+        """Start closed, letting everything through."""
+        self.host = host
+        self.trip_after = trip_after
+        self.failures = 0
+        self.open = False
+        self._first_cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._cooldown = cooldown
+        self._reopen_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def admit(self) -> float:
+        """How long to wait before sending, or 0 to send now.
+
+        Once the cool-down is over, the first caller is let through as the
+        probe and the rest keep waiting for its outcome.
+        """
+        with self._lock:
+            if not self.open:
+                return 0.0
+            if self._probing:
+                return _PROBE_POLL
+            left = self._reopen_at - get_clock().monotonic()
+            if left > 0:
+                return left
+            self._probing = True
+            return 0.0
+
+    def record(self, ok: bool | None) -> None:
+        """Note how a request admitted went.
+
+        Args:
+            ok: Whether the host answered properly, or None when the request
+                never got far enough to tell.
+        """
+        with self._lock:
+            if ok is None:
+                self._probing = False
+            elif ok:
+                if self.open:
+                    logger.info("%s answers again; resuming requests", self.host)
+                    metrics.CIRCUIT_OPEN.set(0, self.host)
+                self.failures = 0
+                self.open = self._probing = False
+                self._cooldown = self._first_cooldown
+            else:
+                self.failures += 1
+                if self._probing:
+                    self._cooldown = min(self._max_cooldown, self._cooldown * 2)
+                    self._trip()
+                elif not self.open and self.failures >= self.trip_after:
+                    self._trip()
+
+    def _trip(self) -> None:
+        self.open = True
+        self._probing = False
+        self._reopen_at = get_clock().monotonic() + self._cooldown
+        metrics.CIRCUIT_OPEN.set(1, self.host)
+        logger.warning(
+            "%s failed %d time(s) in a row; holding every request to it for %.0f s",
+            self.host,
+            self.failures,
+            self._cooldown,
+        )
+
+
+class Resilience:
+    """Timeouts, retries and circuit breakers for every request in the process.
+
+    Attributes:
+        retries: Most times one request is sent again.
+        max_hold: Longest a request waits for its host to come back.
+        governor: The fleet's rate and concurrency limits every try waits
+            its turn under, if any.
+        timeouts: What each endpoint has been learned to need.
+        budget: Retries the process may still spend.
+    """
+
+    def __init__(
+        self, retries: int = 2, max_hold: float = _MAX_HOLD, governor: Governor | None = None
+    ):
+        """Start with nothing learned and every circuit closed."""
+        self.retries = retries
+        self.max_hold = max_hold
+        self.governor = governor
+        self.timeouts = AdaptiveTimeouts()
+        self.budget = RetryBudget()
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """The circuit breaker for a URL's host."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host)
+            return breaker
+
+    def send(
+        self, method: str, url: str, timeout: Any, send: Callable[[Any], requests.Response]
+    ) -> requests.Response:
+        """Send a request through the breaker, retrying it if it may be.
+
+        Args:
+            method: The request's method.
+            url: Where it goes.
+            timeout: The caller's timeout. A number is the ceiling for the
+                learned ones; anything else is passed on as it is.
+            send: Sends the request once with the timeout it is given.
+
+        Raises:
+            CircuitOpenError: If the host stays down past :attr:`max_hold`.
+        """
+        breaker = self.breaker(url)
+        self.budget.deposit()
+        held = 0.0
+        attempt = 0
+        while True:
+            wait = self._hold(breaker, held)
+            if wait:
+                get_clock().sleep(wait)
+                instrumentation.record_hold(get_clock().real_seconds(wait))
+                held += wait
+                continue
+            limits = self._limits(url, timeout)
+            started = time.perf_counter()
+            try:
+                with self._turn(url):
+                    started = time.perf_counter()
+                    response = send(limits)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                self._settle(breaker, url, limits, started, exc)
+                backoff = self._backoff(method, url, attempt, exc)
+                if backoff is None:
+                    raise
+            except BaseException:
+                breaker.record(None)
+                raise
+            else:
+                if not self._settle(breaker, url, limits, started, response):
+                    return response
+                backoff = self._backoff(method, url, attempt, response.status_code)
+                if backoff is None:
+                    return response
+                response.close()
+            attempt += 1
+            get_clock().sleep(backoff)
+            instrumentation.record_hold(get_clock().real_seconds(backoff))
+
+    async def asend(
+        self, method: str, url: str, timeout: Any, send: Callable[[Any], Awaitable[_R]]
+    ) -> _R:
+        """:meth:`send` for the async engine, waiting on the event loop."""
+        breaker = self.breaker(url)
+        self.budget.deposit()
+        held = 0.0
+        attempt = 0
+        while True:
+            wait = self._hold(breaker, held)
+            if wait:
+                await get_clock().asleep(wait)
+                instrumentation.record_hold(get_clock().real_seconds(wait))
+                held += wait
+                continue
+            limits = self._limits(url, timeout)
+            started = time.perf_counter()
+            try:
+                async with self._aturn(url):
+                    started = time.perf_counter()
+                    response: Any = await send(limits)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                self._settle(breaker, url, limits, started, exc)
+                backoff = self._backoff(method, url, attempt, exc)
+                if backoff is None:
+                    raise
+            except BaseException:
+                breaker.record(None)
+                raise
+            else:
+                if not self._settle(breaker, url, limits, started, response):
+                    return response
+                backoff = self._backoff(method, url, attempt, response.status_code)
+                if backoff is None:
+                    return response
+            attempt += 1
+            await get_clock().asleep(backoff)
+            instrumentation.record_hold(get_clock().real_seconds(backoff))
+
+    @contextmanager
+    def _turn(self, url: str) -> Iterator[None]:
+        """Wait for the governor to let a try through, if there is one."""
+        if self.governor is None:
+            yield
+            return
+        with self.governor.slot(url):
+            yield
+
+    @asynccontextmanager
+    async def _aturn(self, url: str) -> AsyncIterator[None]:
+        """:meth:`_turn` for the async engine."""
+        if self.governor is None:
+            yield
+            return
+        async with self.governor.aslot(url):
+            yield
+
+    def _hold(self, breaker: CircuitBreaker, held: float) -> float:
+        """How long to wait for the host before sending, 0 for not at all."""
+        wait = breaker.admit()
+        if not wait:
+            return 0.0
+        if held >= self.max_hold:
+            raise CircuitOpenError(f"{breaker.host} has been down for {held:.0f} s")
+        return min(wait, self.max_hold - held)
+
+    def _limits(self, url: str, timeout: Any) -> Any:
+        if isinstance(timeout, (int, float)):
+            return self.timeouts.limits(url, timeout)
+        return timeout
+
+    def _settle(
+        self,
+        breaker: CircuitBreaker,
+        url: str,
+        limits: Any,
+        started: float,
+        outcome: requests.Response | Exception,
+    ) -> bool:
+        """Learn from one try, returning whether it failed."""
+        if isinstance(outcome, requests.Timeout):
+            # How long it really needed is unknown, but at least this long;
+            # counting that much lets the timeout grow with a slower site.
+            if isinstance(limits, tuple) and not isinstance(outcome, requests.ConnectTimeout):
+                self.timeouts.record(url, limits[1])
+            failed = True
+        elif isinstance(outcome, Exception):
+            failed = True
+        else:
+            failed = outcome.status_code in _FAILURE_STATUSES
+            if not failed:
+                self.timeouts.record(url, time.perf_counter() - started)
+        breaker.record(not failed)
+        return failed
+
+    def _backoff(self, method: str, url: str, attempt: int, reason: object) -> float | None:
+        """How long to wait before trying again, or None not to."""
+        if attempt >= self.retries or not is_idempotent(method, url):
+            return None
+        if not self.budget.withdraw():
+            logger.debug("Retry budget spent; not retrying %s", url)
+            return None
+        path = instrumentation.endpoint(url)
+        metrics.HTTP_RETRIES.inc(path)
+        delay = self._random.uniform(0, min(_BACKOFF_CAP, _BACKOFF_BASE * 2**attempt))
+        logger.warning("%s failed (%s); trying again in %.1f s", path, reason, delay)
+        return delay
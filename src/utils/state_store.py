@@ -0,0 +1,268 @@
+"""Remembering each account's game state between runs.
+
+Everything a run learns, the task list, the keys left, the mazes completed
+and when the next task unlocks, used to end up in the log and nowhere else,
+so every run had to rediscover it over HTTP. The store keeps it in a local
+SQLite file, where the daemon and ``--list-accounts`` can read it without
+touching the network.
+
+Modules add what they see to a :class:`RunRecord` as the run goes, and the
+whole record is written at the end in a single transaction: one fsync per
+run rather than one per page. The feature is off unless ``state_db`` is set.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from contextlib import closing
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from ..models import Quest, QuestSnapshot
+from .clock import get_clock
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    username          TEXT PRIMARY KEY,
+    keys_left         INTEGER,
+    next_available_at REAL,
+    mazes_completed   INTEGER NOT NULL DEFAULT 0,
+    last_run_at       REAL,
+    last_run_ok       INTEGER
+);
+CREATE TABLE IF NOT EXISTS quests (
+    username     TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    description  TEXT NOT NULL,
+    done         INTEGER NOT NULL,
+    total        INTEGER NOT NULL,
+    minutes_left INTEGER,
+    paid         INTEGER NOT NULL,
+    seen_at      REAL NOT NULL,
+    PRIMARY KEY (username, name)
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id              INTEGER PRIMARY KEY,
+    username        TEXT NOT NULL,
+    started_at      REAL NOT NULL,
+    finished_at     REAL NOT NULL,
+    ok              INTEGER NOT NULL,
+    mazes_completed INTEGER NOT NULL,
+    keys_left       INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_account ON runs (username, finished_at);
+CREATE TABLE IF NOT EXISTS quest_pages (
+    username    TEXT PRIMARY KEY,
+    completed   INTEGER NOT NULL,
+    allowed     INTEGER NOT NULL,
+    keys_earned INTEGER,
+    taken_at    REAL NOT NULL,
+    expires_at  REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class RunRecord:
+    """What one run of one account found out, waiting to be written.
+
+    Attributes:
+        username: The account.
+        started_at: When the run began, as a Unix time.
+        quests: The task list, if the page was read.
+        quest_snapshot: The whole read of the task page, for the cache.
+        quest_wait: Minutes until the soonest task unlocks, if known.
+        mazes_completed: Mazes won during the run.
+        keys_left: Keys remaining the last time a maze page showed them.
+    """
+
+    username: str
+    started_at: float = field(default_factory=lambda: get_clock().time())
+    quests: list[Quest] | None = None
+    quest_snapshot: QuestSnapshot | None = None
+    quest_wait: int | None = None
+    mazes_completed: int = 0
+    keys_left: int | None = None
+
+
+@dataclass(frozen=True)
+class AccountState:
+    """An account as the last run left it.
+
+    Attributes:
+        username: The account.
+        keys_left: Keys remaining, or None if never seen.
+        next_available_at: Unix time the soonest task unlocks, or None.
+        mazes_completed: Mazes won across every recorded run.
+        last_run_at: When the last run finished, as a Unix time.
+        last_run_ok: Whether that run succeeded.
+    """
+
+    username: str
+    keys_left: int | None
+    next_available_at: float | None
+    mazes_completed: int
+    last_run_at: float | None
+    last_run_ok: bool | None
+
+
+class StateStore:
+    """Reads and writes the state file.
+
+    Connections are opened per call, so one store can serve accounts playing
+    in several threads; SQLite serialises the writers. The tables and the
+    journal mode are set up by the first connection only.
+    """
+
+    def __init__(self, path: str | Path):
+        """Locate the file; it and its tables are created on first use."""
+        self.path = Path(path)
+        self._prepared = False
+        self._prepare_lock = threading.Lock()
+
+    def write(self, record: RunRecord, ok: bool) -> None:
+        """Write a finished run in a single transaction.
+
+        Args:
+            record: What the run found out.
+            ok: Whether the run succeeded.
+        """
+        now = get_clock().time()
+        next_available_at = None
+        if record.quest_wait is not None:
+            next_available_at = now + record.quest_wait * 60
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                """
+                INSERT INTO accounts (username, keys_left, next_available_at,
+                                      mazes_completed, last_run_at, last_run_ok)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (username) DO UPDATE SET
+                    keys_left = COALESCE(excluded.keys_left, keys_left),
+                    next_available_at = COALESCE(excluded.next_available_at, next_available_at),
+                    mazes_completed = mazes_completed + excluded.mazes_completed,
+                    last_run_at = excluded.last_run_at,
+                    last_run_ok = excluded.last_run_ok
+                """,
+                (
+                    record.username,
+                    record.keys_left,
+                    next_available_at,
+                    record.mazes_completed,
+                    now,
+                    ok,
+                ),
+            )
+            if record.quests is not None:
+                # The page lists every task, so whatever it no longer shows
+                # is gone from the game too.
+                connection.execute("DELETE FROM quests WHERE username = ?", (record.username,))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO quests VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            record.username,
+                            quest.name,
+                            quest.description,
+                            quest.done,
+                            quest.total,
+                            quest.minutes_left,
+                            quest.paid,
+                            now,
+                        )
+                        for quest in record.quests
+                    ],
+                )
+            if record.quest_snapshot is not None:
+                snapshot = record.quest_snapshot
+                connection.execute(
+                    "INSERT OR REPLACE INTO quest_pages VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        record.username,
+                        snapshot.completed,
+                        snapshot.allowed,
+                        snapshot.keys_earned,
+                        snapshot.taken_at,
+                        snapshot.expires_at,
+                    ),
+                )
+            connection.execute(
+                """
+                INSERT INTO runs (username, started_at, finished_at, ok,
+                                  mazes_completed, keys_left)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    record.username,
+                    record.started_at,
+                    now,
+                    ok,
+                    record.mazes_completed,
+                    record.keys_left,
+                ),
+            )
+
+    def account(self, username: str) -> AccountState | None:
+        """Return what the last run recorded for an account, if anything."""
+        if not self.path.exists():
+            return None
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT username, keys_left, next_available_at, mazes_completed,"
+                " last_run_at, last_run_ok FROM accounts WHERE username = ?",
+                (username,),
+            ).fetchone()
+        if row is None:
+            return None
+        *values, last_run_ok = row
+        return AccountState(*values, last_run_ok=None if last_run_ok is None else bool(last_run_ok))
+
+    def quests(self, username: str) -> list[Quest]:
+        """Return the task list as the last run read it.
+
+        Countdowns are as they stood then; ``AccountState.next_available_at``
+        is the absolute time to compare against.
+        """
+        if not self.path.exists():
+            return []
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT name, description, done, total, minutes_left, paid"
+                " FROM quests WHERE username = ? ORDER BY rowid",
+                (username,),
+            ).fetchall()
+        return [Quest(*row[:5], paid=bool(row[5])) for row in rows]
+
+    def quest_snapshot(self, username: str) -> QuestSnapshot | None:
+        """Return the last read of the task page, expired or not."""
+        if not self.path.exists():
+            return None
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT completed, allowed, keys_earned, taken_at, expires_at"
+                " FROM quest_pages WHERE username = ?",
+                (username,),
+            ).fetchone()
+        if row is None:
+            return None
+        return QuestSnapshot(tuple(self.quests(username)), *row)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the file, creating it and its tables if needed."""
+        if not self._prepared:
+            with self._prepare_lock:
+                if not self._prepared:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    with closing(self._open()) as connection:
+                        # WAL is kept in the file, so one connection sets it.
+                        connection.execute("PRAGMA journal_mode=WAL")
+                        connection.executescript(_SCHEMA)
+                    self._prepared = True
+        return self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        # Accounts playing side by side all write here; give a busy writer
+        # time to finish rather than failing the run.
+        return sqlite3.connect(self.path, timeout=30)
@@ -0,0 +1,163 @@
+"""Connections shared by every account in the process.
+
+Each account needs its own cookies, so each gets its own session. By default
+each session also brought its own connection pool, so thirty accounts
+against the one site meant thirty TCP and TLS handshakes per round, each
+connection dropped again when its account stopped. The transport here owns a
+single pool instead: every session mounts the same adapter, so a connection
+one account has finished with is picked up by the next, across runs and
+daemon visits alike. Cookies stay with the session that received them,
+since a cookie jar belongs to a session and never to a connection.
+
+Keeping connections alive is what saves the handshakes; a reused connection
+needs no TLS resumption because it never closed. Connections the server has
+dropped while idle are noticed and replaced when they are next taken from the
+pool.
+
+The async engine gets the same from one aiohttp connector shared by every
+account's client.
+
+Every request through the transport also goes through its
+:class:`~src.utils.resilience.Resilience`, the learned timeouts, retries and
+circuit breakers the process shares, and waits its turn under the fleet's
+:class:`~src.utils.governor.Governor` if one is set.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .governor import Governor
+from .resilience import Resilience
+
+logger = logging.getLogger(__name__)
+
+# Hosts a pool is kept for; the bot only ever talks to one or two.
+_POOLED_HOSTS = 4
+
+
+class SharedAdapter(HTTPAdapter):
+    """An adapter mounted on many sessions at once.
+
+    A session closes its adapters when it is closed, which every account does
+    on stopping. That would drop the connections the others are using, so
+    :meth:`close` leaves them open and :meth:`shutdown` really closes them.
+    """
+
+    def __init__(self, resilience: Resilience | None = None, **kwargs: Any):
+        """Create the adapter.
+
+        Args:
+            resilience: What every request sent is put through, if anything.
+            **kwargs: Passed on to :class:`~requests.adapters.HTTPAdapter`.
+        """
+        self.resilience = resilience
+        super().__init__(**kwargs)
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        """Send a request, through :attr:`resilience` when there is one."""
+        if self.resilience is None:
+            return super().send(request, **kwargs)
+        timeout = kwargs.pop("timeout", None)
+        return self.resilience.send(
+            request.method or "GET",
+            request.url or "",
+            timeout,
+            lambda limits: super(SharedAdapter, self).send(request, timeout=limits, **kwargs),
+        )
+
+    def close(self) -> None:
+        """Leave the pool to the other sessions."""
+
+    def shutdown(self) -> None:
+        """Close every pooled connection."""
+        super().close()
+
+
+class SharedTransport:
+    """A connection pool every account's session draws on.
+
+    Attributes:
+        pool_size: Connections kept open per host. Accounts playing at once
+            each hold one while a request is in flight, so this should match
+            the number of workers; beyond it connections are opened and
+            dropped again rather than waited for.
+        resilience: The timeouts, retries and circuit breakers every request
+            through the pool shares.
+    """
+
+    def __init__(self, pool_size: int = 10, retries: int = 2, governor: Governor | None = None):
+        """Create the pool; connections are opened as they are first needed.
+
+        Args:
+            pool_size: See :attr:`pool_size`.
+            retries: Most times a request that only reads a page is sent
+                again after failing.
+            governor: Rate and concurrency limits for every account's
+                requests together, if any.
+        """
+        self.pool_size = pool_size
+        self.resilience = Resilience(retries, governor=governor)
+        self.adapter = SharedAdapter(
+            self.resilience, pool_connections=_POOLED_HOSTS, pool_maxsize=pool_size
+        )
+        self._connector: Any = None
+
+    def session(self) -> requests.Session:
+        """A session with cookies of its own and connections from the pool."""
+        session = requests.Session()
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        return session
+
+    def connector(self) -> Any:
+        """The aiohttp connector for the async engine's clients.
+
+        Created on first use, as aiohttp needs a running event loop; it
+        belongs to that loop.
+        """
+        if self._connector is None:
+            import aiohttp
+
+            self._connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_size)
+        return self._connector
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        self.adapter.shutdown()
+
+    async def aclose(self) -> None:
+        """Close the async engine's connections, once its loop is done with them."""
+        if self._connector is not None:
+            connector, self._connector = self._connector, None
+            await connector.close()
+
+
+_transport: SharedTransport | None = None
+
+
+def get_transport() -> SharedTransport | None:
+    """The transport the process shares, if one was set up."""
+    return _transport
+
+
+def set_transport(transport: SharedTransport | None) -> SharedTransport | None:
+    """Share a transport between every session created from now on.
+
+    Returns:
+        The transport it replaces, so tests can put it back.
+    """
+    global _transport
+    previous, _transport = _transport, transport
+    return previous
+
+
+def new_session() -> requests.Session:
+    """A session for one account, on the shared transport when there is one."""
+    if _transport is None:
+        return requests.Session()
+    return _transport.session()
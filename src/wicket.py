@@ -24,15 +24,60 @@ Two consequences drive the design below:
 
 from __future__ import annotations
 
+import codecs
+import re
+import time
 from dataclasses import dataclass, field
-from urllib.parse import urljoin
+from functools import cached_property, lru_cache
+from typing import TYPE_CHECKING
+from urllib.parse import urljoin, urlsplit
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
 from bs4.element import Tag
 
+from .utils import instrumentation
+
+if TYPE_CHECKING:
+    import requests
+
 # Input types that carry no value we should submit.
 _SKIPPED_INPUT_TYPES = frozenset({"submit", "button", "reset", "image", "file"})
 
+# Tree builders every helper below is tested against, fastest first. lxml is a
+# C parser and an optional install; html.parser ships with Python.
+PARSERS = ("lxml", "html.parser")
+
+# Picks the fastest builder that is actually installed.
+AUTO_PARSER = "auto"
+
+# Declared charsets: in the Content-Type header, or in a <meta> within the
+# first kilobyte, which is as far as browsers look for one.
+_HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+_META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.I)
+_META_SCAN_BYTES = 1024
+
+# Encodings learned for each host: declared by one of its pages, or detected
+# from a body that is not ASCII. Detection reads the whole body, so it runs
+# once per host rather than once per page.
+_host_encodings: dict[str, str] = {}
+
+# What each page's consumer actually reads. Parsing with a profile builds only
+# those elements, each with its whole subtree, and drops the rest of the page:
+# headers, footers, scripts and layout wrappers. Text outside them is dropped
+# too, so a profile must cover every string its consumer searches.
+PROFILES = {
+    # The login form, fields included.
+    "login": SoupStrainer("form"),
+    # Links only; enough to find the logout link.
+    "home": SoupStrainer("a"),
+    # Door links, the room counter, and the notify banner, key count and
+    # reward, which are all spans. Not the victory text, which is bare.
+    "doors": SoupStrainer(["a", "b", "span"]),
+    # Task blocks, plus the counters above the list.
+    "quests": SoupStrainer("div", class_=["nfl", "m5"]),
+}
+
 
 class WicketError(Exception):
     """Raised when the expected Wicket markup cannot be found on a page."""
@@ -67,9 +112,202 @@ class WicketForm:
         return data
 
 
-def parse(html: str) -> BeautifulSoup:
-    """Parse a page into a BeautifulSoup tree."""
-    return BeautifulSoup(html, "html.parser")
+def available_parsers() -> list[str]:
+    """Return the supported tree builders that are installed, fastest first."""
+    return [name for name in PARSERS if builder_registry.lookup(name) is not None]
+
+
+@lru_cache(maxsize=None)
+def resolve_parser(name: str = AUTO_PARSER) -> str:
+    """Turn a configured parser name into a tree builder BeautifulSoup accepts.
+
+    Raises:
+        WicketError: If the name is unknown or its package is not installed.
+    """
+    if name == AUTO_PARSER:
+        return available_parsers()[0]
+    if name not in PARSERS:
+        raise WicketError(f"Unknown parser {name!r}; expected one of {(AUTO_PARSER, *PARSERS)}")
+    if builder_registry.lookup(name) is None:
+        raise WicketError(f"Parser {name!r} is not installed")
+    return name
+
+
+def parse(html: str, parser: str = AUTO_PARSER, profile: str | None = None) -> BeautifulSoup:
+    """Parse a page into a BeautifulSoup tree.
+
+    Parsing is the main CPU cost of every step, and html.parser, written in
+    pure Python, is several times slower than lxml on these pages. Every helper
+    in this module behaves the same whichever builder produced the tree.
+
+    Args:
+        html: Page markup.
+        parser: A name from :data:`PARSERS`, or ``"auto"`` for the fastest one
+            installed.
+        profile: A key of :data:`PROFILES` to build only what that page's
+            consumer reads, or None for the whole page.
+    """
+    strainer = PROFILES[profile] if profile is not None else None
+    started = time.perf_counter()
+    soup = BeautifulSoup(html, resolve_parser(parser), parse_only=strainer)
+    instrumentation.record_parse(time.perf_counter() - started)
+    return soup
+
+
+class Page:
+    """One fetched page, parsed and flattened at most once.
+
+    Several consumers often read the same response: the tree for one lookup,
+    the flattened text for a couple of patterns, the links for another. Each
+    of those is computed on first use and then kept, so passing a Page around
+    instead of the response means no page is ever parsed or flattened twice.
+    Nothing is computed for a page nobody reads.
+
+    Attributes:
+        url: The URL the page was served from, after redirects.
+        parser: Tree builder used for :attr:`soup`.
+        profile: Parse profile used for :attr:`soup`, or None for the whole
+            page.
+    """
+
+    def __init__(
+        self,
+        response: requests.Response,
+        parser: str = AUTO_PARSER,
+        profile: str | None = None,
+    ):
+        self.response = response
+        self.url: str = response.url
+        self.parser = parser
+        self.profile = profile
+
+    @cached_property
+    def encoding(self) -> str:
+        """The charset the body is decoded with; see :func:`page_encoding`."""
+        return page_encoding(self.response)
+
+    @cached_property
+    def html(self) -> str:
+        """The decoded markup.
+
+        Decoded straight from the body bytes rather than through
+        ``response.text``, which runs charset detection over the whole body
+        whenever the server omits a charset, and does so on every access.
+        """
+        return self.response.content.decode(self.encoding, errors="replace")
+
+    @cached_property
+    def soup(self) -> BeautifulSoup:
+        """The parsed tree."""
+        return parse(self.html, self.parser, self.profile)
+
+    @cached_property
+    def text(self) -> str:
+        """Visible text, whitespace-normalised as ``get_text(" ", strip=True)``."""
+        return self.soup.get_text(" ", strip=True)
+
+    @cached_property
+    def anchors(self) -> list[tuple[str, str | None]]:
+        """Every link as ``(stripped text, absolute URL or None)``, in page order."""
+        return [(label, url) for label, _, url in self._links]
+
+    @cached_property
+    def _links(self) -> list[tuple[str, str, str | None]]:
+        """Every link as ``(stripped text, href as written, absolute URL or None)``."""
+        index: list[tuple[str, str, str | None]] = []
+        for anchor in self.soup.find_all("a"):
+            href = anchor.get("href")
+            href = href if isinstance(href, str) else ""
+            url = resolve(self.url, href) if href else None
+            index.append((anchor.get_text(strip=True), href, url))
+        return index
+
+    @cached_property
+    def forms(self) -> list[Tag]:
+        """Every form on the page."""
+        return self.soup.find_all("form")
+
+    def link(self, text: str) -> str | None:
+        """Absolute URL of the first link with the given text, as :func:`find_link_href`."""
+        for label, url in self.anchors:
+            if label == text:
+                return url
+        return None
+
+    def links_containing(self, component: str) -> list[str]:
+        """Absolute URLs of every link whose href names a component.
+
+        Matched on the href as written, as :func:`find_links_containing` does,
+        so a name that only the page's own URL carries matches nothing.
+        """
+        return [url for _, href, url in self._links if url is not None and component in href]
+
+    def form(self, action_contains: str) -> WicketForm:
+        """Parse the POST form whose action names a component, as :func:`find_form`.
+
+        Raises:
+            WicketError: If no matching form exists on the page.
+        """
+        for form in self.forms:
+            method = form.get("method")
+            action = form.get("action")
+            if (
+                isinstance(method, str)
+                and method.lower() == "post"
+                and isinstance(action, str)
+                and action_contains in action
+            ):
+                return parse_form(form, self.url)
+        raise WicketError(f"No POST form with {action_contains!r} in its action")
+
+
+def page_encoding(response: requests.Response) -> str:
+    """Work out a response's charset without guessing where it can be avoided.
+
+    In order: the Content-Type header, a ``<meta>`` charset near the top of
+    the body, and the encoding already learned for this host. Without any of
+    them, a body that decodes as UTF-8 is taken as UTF-8, and only one that
+    does not is run through detection. One site serves every page the same
+    way, so a declared or detected charset is remembered for the host. A
+    body of plain ASCII reads the same in any of them and teaches nothing,
+    so it is decoded as UTF-8 without remembering anything.
+    """
+    host = urlsplit(response.url).netloc
+    declared = _HEADER_CHARSET.search(response.headers.get("Content-Type", ""))
+    if declared is None:
+        declared = _META_CHARSET.search(response.content[:_META_SCAN_BYTES])
+    if declared is not None:
+        name = declared.group(1)
+        name = name.decode("ascii") if isinstance(name, bytes) else name
+        try:
+            encoding = codecs.lookup(name).name
+        except LookupError:
+            pass  # A misspelt charset; fall through to detection.
+        else:
+            _host_encodings[host] = encoding
+            return encoding
+
+    encoding = _host_encodings.get(host)
+    if encoding is not None:
+        return encoding
+    body = response.content
+    if body.isascii():
+        return "utf-8"
+    try:
+        body.decode("utf-8")
+    except UnicodeDecodeError:
+        encoding = response.apparent_encoding or "utf-8"
+    else:
+        encoding = "utf-8"
+    _host_encodings[host] = encoding
+    return encoding
+
+
+def page_text(source: Page | BeautifulSoup) -> str:
+    """Return a page's visible text, reusing it when the source is a :class:`Page`."""
+    if isinstance(source, Page):
+        return source.text
+    return source.get_text(" ", strip=True)
 
 
 def resolve(page_url: str, href: str) -> str:
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import sys
+import threading
 from pathlib import Path
 
 import pytest
@@ -62,3 +63,39 @@ def login_error_page() -> str:
 def quests_page() -> str:
     """The personal task page, mirroring the live markup."""
     return load_fixture("quests.html")
+
+
+@pytest.fixture
+def virtual():
+    """Run the process on a virtual clock for the length of a test."""
+    from src.utils import clock
+    from src.utils.clock import VirtualClock
+
+    virtual_clock = VirtualClock(start=1_800_000_000)
+    previous = clock.set_clock(virtual_clock)
+    yield virtual_clock
+    clock.set_clock(previous)
+
+
+@pytest.fixture
+def standin():
+    """Start local stand-in servers for a test, shut down once it ends.
+
+    Call the fixture with :class:`~tools.standin.Options` fields; the seed
+    is 7 unless given.
+    """
+    from tools.standin import Options, StandinServer
+
+    servers = []
+
+    def start(**options):
+        options.setdefault("seed", 7)
+        server = StandinServer(("127.0.0.1", 0), Options(**options))
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -2,11 +2,21 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
 import pytest
 import yaml
 
 from src import config as config_module
 from src.config import Config, ConfigError
+from src.scheduler import Scheduler
+from src.utils import human_like, metrics
+from src.utils.state_store import RunRecord, StateStore
+import main as main_module
 from main import select_accounts
 
 MULTI = {
@@ -99,3 +109,283 @@ class TestOutputEncoding:
         config = write(tmp_path, {"accounts": [{"username": "Профиль А", "password": "pw"}]})
         assert main_module.main(["-c", str(config), "--list-accounts"]) == 0
         assert "Профиль А" in capsys.readouterr().out
+
+
+class TestWorkers:
+    @pytest.fixture
+    def configs(self):
+        return [Config(username=name, password="pw") for name in ("First", "Second", "Third")]
+
+    def test_runs_accounts_side_by_side(self, configs, monkeypatch):
+        # Every account waits for the others, which only works if all three
+        # are running at the same time.
+        barrier = threading.Barrier(3, timeout=5)
+
+        def play(config, login_only):
+            barrier.wait()
+            return config.username != "Second"
+
+        monkeypatch.setattr(main_module, "run_account", play)
+        results = main_module.run_accounts(configs, False, workers=3)
+        assert results == {"First": True, "Second": False, "Third": True}
+
+    def test_keeps_configuration_order(self, configs, monkeypatch):
+        def play(config, login_only):
+            time.sleep(0.05 if config.username == "First" else 0)
+            return True
+
+        monkeypatch.setattr(main_module, "run_account", play)
+        assert list(main_module.run_accounts(configs, False, workers=3)) == [
+            "First", "Second", "Third",
+        ]
+
+    def test_log_lines_name_their_account(self, configs, monkeypatch):
+        records = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                records.append(record)
+
+        handler = Collect()
+        handler.addFilter(main_module.AccountFilter())
+        logging.getLogger("main").addHandler(handler)
+        monkeypatch.setattr(main_module, "NeboBot", lambda config: FailingBot())
+        try:
+            main_module.run_accounts(configs[:2], False, workers=2)
+        finally:
+            logging.getLogger("main").removeHandler(handler)
+
+        failures = {record.account for record in records if "login failed" in record.getMessage()}
+        assert failures == {"First", "Second"}
+
+    def test_rejects_zero_workers(self, capsys):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--workers", "0"])
+
+
+class TestAsyncEngine:
+    @pytest.fixture
+    def configs(self):
+        return [Config(username=name, password="pw") for name in ("First", "Second", "Third")]
+
+    def test_plays_accounts_as_coroutines(self, configs, monkeypatch):
+        running = []
+        peak = []
+
+        async def play(config, login_only):
+            running.append(config.username)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(config.username)
+            return config.username != "Second"
+
+        monkeypatch.setattr(main_module, "run_account_async", play)
+        results = asyncio.run(main_module.run_accounts_async(configs, False, workers=2))
+        assert results == {"First": True, "Second": False, "Third": True}
+        assert max(peak) == 2
+
+    def test_contains_a_failed_login(self, configs, monkeypatch):
+        monkeypatch.setattr(main_module, "AsyncNeboBot", lambda config: AsyncFailingBot())
+        results = asyncio.run(main_module.run_accounts_async(configs[:2], False, workers=2))
+        assert results == {"First": False, "Second": False}
+
+    def test_plays_every_account_at_once_by_default(self, tmp_path, monkeypatch):
+        played = []
+
+        async def play(configs, login_only, workers):
+            played.append(workers)
+            return {config.username: True for config in configs}
+
+        monkeypatch.setattr(main_module, "run_accounts_async", play)
+        monkeypatch.setattr(main_module, "setup_logging", lambda config: None)
+        monkeypatch.setattr(main_module, "set_transport", lambda transport: None)
+        assert main_module.main(["-c", str(write(tmp_path, MULTI)), "--engine", "async"]) == 0
+        assert played == [3]
+        assert main_module.parse_args([]).workers == 1
+
+    def test_explains_a_missing_aiohttp(self, tmp_path, monkeypatch, capsys):
+        config = write(tmp_path, {"username": "Solo", "password": "pw"})
+        monkeypatch.setattr(main_module.importlib.util, "find_spec", lambda name: None)
+        assert main_module.main(["-c", str(config), "--engine", "async"]) == 1
+        assert "pip install aiohttp" in capsys.readouterr().err
+
+
+class TestListAccounts:
+    def test_shows_the_remembered_state(self, tmp_path):
+        config = Config(username="u", password="p", state_db=str(tmp_path / "state.db"))
+        StateStore(config.state_db).write(RunRecord("u", keys_left=42, quest_wait=60), ok=True)
+        line = main_module.describe_account(config)
+        assert "42 keys" in line
+        assert "next task" in line
+
+    def test_plain_without_a_store(self):
+        assert main_module.describe_account(Config(username="u", password="p")) == "u\t1 maze(s)"
+
+
+class TestDaemonArguments:
+    def test_cannot_be_only_a_login_check(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--daemon", "--login-only"])
+
+    def test_runs_on_threads(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--daemon", "--engine", "async"])
+
+
+def test_a_run_is_stamped_on_the_process_clock(virtual, monkeypatch):
+    monkeypatch.setattr(main_module, "_metrics_file", None)
+    main_module.note_run("Stamped", 2.5)
+    assert metrics.RUN_FINISHED.samples()[("Stamped",)] == virtual.time()
+
+
+def run_daemon_for(monkeypatch, config, visits):
+    """Run the daemon through ``visits`` visits to one account.
+
+    Returns:
+        Every delay the account was scheduled with, the first included.
+    """
+    monkeypatch.setattr(human_like, "_interrupted", threading.Event())
+    delays = []
+    scheduled = threading.Semaphore(0)
+
+    class Visits(Scheduler):
+        def schedule(self, entry, delay):
+            delays.append(delay)
+            scheduled.release()
+
+        def next_due(self):
+            assert scheduled.acquire(timeout=5)
+            if len(delays) > visits:
+                raise KeyboardInterrupt
+            return config
+
+    monkeypatch.setattr(main_module, "Scheduler", Visits)
+    with pytest.raises(KeyboardInterrupt):
+        main_module.run_daemon([config], workers=1)
+    return delays
+
+
+class TestDaemon:
+    def test_reschedules_an_account_whose_bot_cannot_be_built(self, monkeypatch):
+        def broken(config, quest_cache=None):
+            raise sqlite3.OperationalError("unable to open database file")
+
+        monkeypatch.setattr(main_module, "NeboBot", broken)
+        delays = run_daemon_for(monkeypatch, Config(username="Broken", password="x"), visits=1)
+        assert delays[1] == 60 * 60
+
+    def test_visits_share_one_task_page_cache(self, monkeypatch):
+        caches = []
+
+        class Recording:
+            def __init__(self, config, quest_cache=None):
+                caches.append(quest_cache)
+                self.quest_wait = None
+
+        monkeypatch.setattr(main_module, "NeboBot", Recording)
+        monkeypatch.setattr(main_module, "run_account", lambda config, login_only, bot: True)
+        run_daemon_for(monkeypatch, Config(username="Cached", password="x"), visits=2)
+        assert len(caches) == 2
+        assert caches[0] is caches[1] is not None
+
+
+class TestTimeScale:
+    def test_must_be_positive(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--time-scale", "0"])
+
+    def test_refuses_the_live_site(self, tmp_path, capsys):
+        path = write(tmp_path, MULTI)
+        assert main_module.main(["-c", str(path), "--time-scale", "100"]) == 1
+        assert "local stand-in" in capsys.readouterr().err
+
+    def test_knows_a_local_site(self):
+        assert main_module.is_local("http://127.0.0.1:8080") is True
+        assert main_module.is_local("https://nebo.mobi") is False
+
+
+class TestArchiveMode:
+    def test_record_and_replay_exclude_each_other(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--record", "a", "--replay", "b"])
+
+    def test_not_in_daemon_mode(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--replay", "b", "--daemon"])
+
+    def test_replay_runs_without_pauses_or_stored_state(self):
+        config = Config(
+            username="First", password="pw", cookie_dir="cookies", state_db="state.db"
+        )
+        replayed = main_module.archive_mode(config, None, "archives")
+        assert replayed.http_replay == "archives"
+        assert replayed.delays.max_seconds == replayed.delays.long_pause_chance == 0
+        assert replayed.cookie_dir is None and replayed.state_db is None
+
+    def test_record_starts_afresh_like_a_replay(self):
+        config = Config(username="First", password="pw", cookie_dir="cookies", state_db="s.db")
+        recorded = main_module.archive_mode(config, "archives", None)
+        assert recorded.http_record == "archives"
+        assert (recorded.cookie_dir, recorded.state_db) == (None, None)
+        assert recorded.delays == config.delays
+
+
+class TestTimings:
+    def test_each_account_is_measured_across_its_visits(self, monkeypatch):
+        monkeypatch.setattr(main_module, "_account_stats", {})
+        config = Config(username="A", password="x")
+        main_module.run_account(config, False, bot=FailingBot())
+        main_module.run_account(config, False, bot=FailingBot())
+        stats = main_module.account_stats("A")
+        assert stats.wall_seconds > 0
+        assert list(main_module._account_stats) == ["A"]
+
+    def test_are_logged_next_to_the_summary(self, monkeypatch, caplog):
+        monkeypatch.setattr(main_module, "_account_stats", {})
+        stats = main_module.account_stats("A")
+        stats.wall_seconds = 2.0
+        with caplog.at_level(logging.INFO):
+            main_module.log_timings()
+        assert "--- timings ---" in caplog.text and "2.0 s: network" in caplog.text
+
+
+class TestMetricsFile:
+    def test_is_written_after_every_account(self, monkeypatch, tmp_path):
+        path = tmp_path / "nebo.prom"
+        monkeypatch.setattr(main_module, "_metrics_file", path)
+        main_module.run_account(Config(username="Counted", password="x"), False, bot=FailingBot())
+        assert 'nebo_run_duration_seconds{account="Counted"}' in path.read_text(encoding="utf-8")
+
+    def test_port_must_be_positive(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--metrics-port", "0"])
+
+
+class TestProfileArguments:
+    def test_trace_malloc_needs_a_profile_directory(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--trace-malloc"])
+
+    def test_profiling_runs_on_threads(self):
+        with pytest.raises(SystemExit):
+            main_module.parse_args(["--profile", "profiles", "--engine", "async"])
+
+
+class AsyncFailingBot:
+    """Stands in for AsyncNeboBot with a login that always fails."""
+
+    async def start(self):
+        return False
+
+    async def stop(self):
+        pass
+
+
+class FailingBot:
+    """Stands in for NeboBot with a login that always fails."""
+
+    def start(self):
+        return False
+
+    def stop(self):
+        pass
@@ -0,0 +1,76 @@
+"""Tests for copying aiohttp responses into requests ones.
+
+aiohttp itself is optional, so these drive the conversion with stand-ins, and
+skip what needs a real client when it is missing.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+
+import pytest
+import requests
+from requests.cookies import RequestsCookieJar
+
+from src import wicket
+from src.utils.async_http import AsyncClient, to_requests
+
+
+class RawResponse:
+    """The parts of an aiohttp response the conversion reads."""
+
+    def __init__(self, status=200, url="https://nebo.mobi/doors", headers=None, reason="OK"):
+        self.status = status
+        self.url = url
+        self.reason = reason
+        self.headers = headers or {"Content-Type": "text/html;charset=UTF-8"}
+
+
+class TestToRequests:
+    def test_keeps_status_url_and_body(self):
+        response = to_requests(RawResponse(), "Комната".encode("utf-8"))
+        assert response.status_code == 200
+        assert response.url == "https://nebo.mobi/doors"
+        assert response.text == "Комната"
+
+    def test_headers_stay_case_insensitive(self):
+        response = to_requests(RawResponse(headers={"content-type": "text/html"}), b"")
+        assert response.headers["Content-Type"] == "text/html"
+
+    def test_redirects_show_up_as_history(self):
+        hop = to_requests(RawResponse(302, headers={"Location": "/welcome"}), b"")
+        response = to_requests(RawResponse(url="https://nebo.mobi/welcome"), b"", [hop])
+        assert response.history[0].is_redirect
+
+    def test_http_errors_raise_the_requests_exception(self):
+        with pytest.raises(requests.HTTPError):
+            to_requests(RawResponse(503, reason="Service Unavailable"), b"").raise_for_status()
+
+    def test_pages_read_it_like_any_response(self, doors_page):
+        page = wicket.Page(to_requests(RawResponse(), doors_page.encode("utf-8")))
+        assert page.links_containing("doorLink")
+
+
+class TestClient:
+    def test_names_the_missing_package(self, monkeypatch):
+        monkeypatch.setitem(sys.modules, "aiohttp", None)
+        with pytest.raises(ImportError, match="pip install aiohttp"):
+            AsyncClient()
+
+    def test_cookies_keep_their_domain_path_and_expiry(self):
+        pytest.importorskip("aiohttp")
+        saved = RequestsCookieJar()
+        saved.set("JSESSIONID", "abc", domain="nebo.mobi", path="/game", expires=2_000_000_000)
+
+        async def round_trip():
+            client = AsyncClient()
+            try:
+                client.import_cookies(saved, "https://nebo.mobi")
+                return client.export_cookies()
+            finally:
+                await client.close()
+
+        cookie = next(iter(asyncio.run(round_trip())))
+        assert (cookie.name, cookie.value) == ("JSESSIONID", "abc")
+        assert (cookie.domain, cookie.path, cookie.expires) == ("nebo.mobi", "/game", 2_000_000_000)
@@ -2,11 +2,14 @@
 
 from __future__ import annotations
 
+import asyncio
+
 import pytest
 import requests
+from requests.cookies import RequestsCookieJar
 
 from src.config import Config, Delays
-from src.modules.auth import Auth
+from src.modules.auth import AsyncAuth, Auth
 
 # Zero delays keep the suite fast; pacing is covered in test_human_like.
 NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
@@ -15,11 +18,29 @@ NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=
 class FakeResponse:
     """Minimal stand-in for requests.Response."""
 
-    def __init__(self, text="", url="https://nebo.mobi/", status_code=200, location=None):
+    def __init__(
+        self,
+        text="",
+        url="https://nebo.mobi/",
+        status_code=200,
+        location=None,
+        content_type="text/html;charset=UTF-8",
+        history=(),
+    ):
         self.text = text
+        self.content = text.encode("utf-8")
         self.url = url
         self.status_code = status_code
         self.headers = {"Location": location} if location else {}
+        if content_type:
+            self.headers["Content-Type"] = content_type
+        self.history = list(history)
+        self.detections = 0
+
+    @property
+    def apparent_encoding(self):
+        self.detections += 1
+        return "utf-8"
 
     @property
     def is_redirect(self):
@@ -38,6 +59,7 @@ class FakeSession:
         self.get_responses = get_responses or {}
         self.post_response = post_response
         self.headers = {}
+        self.cookies = RequestsCookieJar()
         self.gets = []
         self.posts = []
         self.closed = False
@@ -57,6 +79,19 @@ class FakeSession:
         self.closed = True
 
 
+class FakeAsyncSession(FakeSession):
+    """FakeSession behind the AsyncClient interface."""
+
+    async def get(self, url, timeout=None, allow_redirects=True):
+        return super().get(url, timeout=timeout, allow_redirects=allow_redirects)
+
+    async def post(self, url, data=None, timeout=None, allow_redirects=True):
+        return super().post(url, data=data, timeout=timeout, allow_redirects=allow_redirects)
+
+    async def close(self):
+        super().close()
+
+
 @pytest.fixture
 def config():
     return Config(username="Player", password="secret", delays=NO_DELAYS, timeout=5)
@@ -122,6 +157,14 @@ class TestLogin:
         assert make_auth(config, session).login() is False
         assert "Неверный пароль" in caplog.text
 
+    def test_needs_no_probe_when_the_form_lands_on_a_game_page(self, config, login_page, home_page):
+        session = FakeSession(
+            get_responses={"/login": FakeResponse(login_page, url="https://nebo.mobi/login")},
+            post_response=FakeResponse(home_page, url="https://nebo.mobi/home"),
+        )
+        assert make_auth(config, session).login() is True
+        assert not any("/home" in url for url in session.gets)
+
     def test_reports_changed_markup_instead_of_crashing(self, config):
         session = FakeSession(
             get_responses={"/login": FakeResponse("<html><body>redesign</body></html>")}
@@ -165,19 +208,46 @@ class TestIsAuthenticated:
 
 class TestLogout:
     def test_follows_the_sites_logout_link(self, config, home_page):
+        bounce = FakeResponse(status_code=302, location="https://nebo.mobi/welcome")
         session = FakeSession(
             get_responses={
                 "/home": [
-                    FakeResponse(status_code=200),  # is_authenticated -> yes
                     FakeResponse(home_page, url="https://nebo.mobi/home"),  # page fetch
-                    FakeResponse(home_page, url="https://nebo.mobi/home"),  # logout link GET
-                    FakeResponse(status_code=302, location="https://nebo.mobi/welcome"),
+                    FakeResponse(url="https://nebo.mobi/welcome", history=[bounce]),  # link GET
                 ]
             }
         )
         assert make_auth(config, session).logout() is True
         assert "https://nebo.mobi/home?4-1.-logoutLink" in session.gets
 
+    def test_needs_no_probes_around_the_logout(self, config, home_page):
+        # The /home fetch shows the session is live and the bounce to /welcome
+        # shows it ended, so checking either separately would be wasted.
+        bounce = FakeResponse(status_code=302, location="https://nebo.mobi/welcome")
+        session = FakeSession(
+            get_responses={
+                "/home": [
+                    FakeResponse(home_page, url="https://nebo.mobi/home"),
+                    FakeResponse(url="https://nebo.mobi/welcome", history=[bounce]),
+                ]
+            }
+        )
+        make_auth(config, session).logout()
+        assert len(session.gets) == 2
+
+    def test_probes_when_the_logout_response_is_inconclusive(self, config, home_page):
+        session = FakeSession(
+            get_responses={
+                "/home": [
+                    FakeResponse(home_page, url="https://nebo.mobi/home"),
+                    FakeResponse("<html>bye</html>", url="https://nebo.mobi/"),
+                    FakeResponse(status_code=302, location="https://nebo.mobi/welcome"),
+                ]
+            }
+        )
+        assert make_auth(config, session).logout() is True
+        assert len(session.gets) == 3
+
     def test_is_a_no_op_when_already_logged_out(self, config):
         session = FakeSession(
             get_responses={
@@ -187,13 +257,94 @@ class TestLogout:
         assert make_auth(config, session).logout() is True
         assert len(session.gets) == 1
 
-    def test_fails_when_the_link_is_missing(self, config, login_page):
+    def test_skips_the_request_when_known_to_be_logged_out(self, config):
+        session = FakeSession()
+        auth = make_auth(config, session)
+        auth.authenticated = False
+        assert auth.logout() is True
+        assert session.gets == []
+
+    def test_fails_when_the_link_is_missing(self, config):
+        redesigned = FakeResponse("<html><body>redesign</body></html>", url="https://nebo.mobi/home")
+        session = FakeSession(get_responses={"/home": redesigned})
+        assert make_auth(config, session).logout() is False
+
+
+class TestObserve:
+    def test_a_page_with_the_logout_link_means_logged_in(self, config, doors_page):
+        auth = make_auth(config, FakeSession())
+        auth.observe(FakeResponse(doors_page, url="https://nebo.mobi/doors"))
+        assert auth.authenticated is True
+
+    def test_a_bounce_to_welcome_means_logged_out(self, config):
+        auth = make_auth(config, FakeSession())
+        auth.authenticated = True
+        bounce = FakeResponse(status_code=302, location="./welcome", url="https://nebo.mobi/doors")
+        auth.observe(FakeResponse(url="https://nebo.mobi/welcome", history=[bounce]))
+        assert auth.authenticated is False
+
+    def test_the_login_form_means_logged_out(self, config, login_error_page):
+        auth = make_auth(config, FakeSession())
+        auth.observe(FakeResponse(login_error_page, url="https://nebo.mobi/login"))
+        assert auth.authenticated is False
+
+    def test_an_inconclusive_page_changes_nothing(self, config):
+        auth = make_auth(config, FakeSession())
+        auth.authenticated = True
+        auth.observe(FakeResponse("<html>partial", url="https://nebo.mobi/doors"))
+        assert auth.authenticated is True
+
+    def test_a_known_state_is_not_probed(self, config):
+        session = FakeSession()
+        auth = make_auth(config, session)
+        auth.authenticated = True
+        assert auth.is_authenticated() is True
+        assert session.gets == []
+
+    def test_probe_asks_anyway(self, config):
         session = FakeSession(
+            get_responses={
+                "/home": FakeResponse(status_code=302, location="https://nebo.mobi/welcome")
+            }
+        )
+        auth = make_auth(config, session)
+        auth.authenticated = True
+        assert auth.is_authenticated(probe=True) is False
+        assert auth.authenticated is False
+
+
+class TestAsyncAuth:
+    def test_logs_in_like_the_threaded_flow(self, config, login_page, home_page):
+        session = FakeAsyncSession(
+            get_responses={"/login": FakeResponse(login_page, url="https://nebo.mobi/login")},
+            post_response=FakeResponse(home_page, url="https://nebo.mobi/home"),
+        )
+        auth = AsyncAuth(config, session=session)
+        assert asyncio.run(auth.login()) is True
+        assert "loginForm" in session.posts[0]["url"]
+        assert auth.authenticated is True
+
+    def test_reports_the_servers_complaint(self, config, login_page, login_error_page, caplog):
+        session = FakeAsyncSession(
+            get_responses={
+                "/login": FakeResponse(login_page, url="https://nebo.mobi/login"),
+                "/home": FakeResponse(status_code=302, location="/welcome"),
+            },
+            post_response=FakeResponse(login_error_page, url="https://nebo.mobi/login"),
+        )
+        assert asyncio.run(AsyncAuth(config, session=session).login()) is False
+        assert "Login failed" in caplog.text
+
+    def test_logs_out_through_the_link(self, config, home_page):
+        session = FakeAsyncSession(
             get_responses={
                 "/home": [
-                    FakeResponse(status_code=200),
-                    FakeResponse(login_page, url="https://nebo.mobi/home"),
+                    FakeResponse(home_page, url="https://nebo.mobi/home"),
+                    FakeResponse(url="https://nebo.mobi/welcome"),
                 ]
             }
         )
-        assert make_auth(config, session).logout() is False
+        auth = AsyncAuth(config, session=session)
+        assert asyncio.run(auth.logout()) is True
+        assert "https://nebo.mobi/home?4-1.-logoutLink" in session.gets
+        assert auth.authenticated is False
@@ -0,0 +1,70 @@
+"""Tests for the process clock and its sped-up and virtual variants."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time as time_module
+from datetime import datetime
+
+import pytest
+
+from src.utils import clock as clock_module
+from src.utils.clock import ScaledClock, VirtualClock
+
+
+class TestScaledClock:
+    def test_waits_take_a_fraction_of_their_length(self):
+        clock = ScaledClock(100)
+        started = time_module.monotonic()
+        clock.sleep(2)
+        assert time_module.monotonic() - started < 0.5
+
+    def test_readings_move_faster_by_the_same_factor(self):
+        clock = ScaledClock(100)
+        before = clock.monotonic(), clock.time()
+        time_module.sleep(0.05)
+        assert clock.monotonic() - before[0] >= 4.5
+        assert clock.time() - before[1] >= 4.5
+
+    def test_starts_from_the_real_time(self):
+        assert abs(ScaledClock(1000).time() - time_module.time()) < 1
+
+    def test_refuses_a_scale_that_is_not_positive(self):
+        with pytest.raises(ValueError):
+            ScaledClock(0)
+
+    def test_an_interrupt_still_cuts_a_wait_short(self):
+        event = threading.Event()
+        event.set()
+        assert ScaledClock(10).sleep(60, event) is True
+
+
+class TestVirtualClock:
+    def test_sleeping_moves_the_clock_without_waiting(self):
+        clock = VirtualClock(start=0)
+        started = time_module.monotonic()
+        clock.sleep(3600)
+        assert time_module.monotonic() - started < 0.5
+        assert (clock.time(), clock.monotonic(), clock.slept) == (3600, 3600, 3600)
+
+    def test_async_sleeps_move_it_too(self):
+        clock = VirtualClock(start=0)
+        asyncio.run(clock.asleep(90))
+        assert clock.time() == 90
+
+    def test_local_time_follows_the_clock(self):
+        clock = VirtualClock(start=0)
+        clock.advance(86400)
+        assert clock.now() == datetime.fromtimestamp(86400)
+
+    def test_an_interrupted_sleep_does_not_move_it(self):
+        clock = VirtualClock(start=0)
+        event = threading.Event()
+        event.set()
+        assert clock.sleep(60, event) is True
+        assert clock.time() == 0
+
+
+def test_set_clock_returns_the_one_it_replaces(virtual):
+    assert clock_module.get_clock() is virtual
@@ -136,6 +136,126 @@ class TestSessionLimit:
         assert config.session_max_minutes == 25
 
 
+class TestParser:
+    def test_defaults_to_auto(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).parser == "auto"
+
+    def test_accepts_the_stdlib_parser(self, tmp_path):
+        config = config_module.load(write_config(tmp_path, {**VALID, "parser": "html.parser"}))
+        assert config.parser == "html.parser"
+
+    def test_rejects_an_unknown_parser(self, tmp_path):
+        with pytest.raises(ConfigError, match="parser"):
+            config_module.load(write_config(tmp_path, {**VALID, "parser": "regex"}))
+
+    def test_reports_a_missing_package_at_load_time(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(config_module.importlib.util, "find_spec", lambda name: None)
+        with pytest.raises(ConfigError, match="pip install lxml"):
+            config_module.load(write_config(tmp_path, {**VALID, "parser": "lxml"}))
+
+
+class TestMazeReader:
+    def test_defaults_to_the_parser(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).maze_reader == "dom"
+
+    def test_reads_the_choice(self, tmp_path):
+        config = config_module.load(write_config(tmp_path, {**VALID, "maze_reader": "verify"}))
+        assert config.maze_reader == "verify"
+
+    def test_rejects_an_unknown_reader(self, tmp_path):
+        with pytest.raises(ConfigError, match="maze_reader"):
+            config_module.load(write_config(tmp_path, {**VALID, "maze_reader": "fast"}))
+
+
+class TestMazeStream:
+    def test_off_by_default(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).maze_stream is False
+
+    def test_reads_the_flag(self, tmp_path):
+        config = config_module.load(write_config(tmp_path, {**VALID, "maze_stream": True}))
+        assert config.maze_stream is True
+
+    def test_rejects_anything_but_a_boolean(self, tmp_path):
+        with pytest.raises(ConfigError, match="maze_stream"):
+            config_module.load(write_config(tmp_path, {**VALID, "maze_stream": "yes"}))
+
+
+class TestCookieMaxAge:
+    def test_defaults_to_half_an_hour(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).cookie_max_age_minutes == 30
+
+    def test_rejects_a_negative_value(self, tmp_path):
+        with pytest.raises(ConfigError, match="cookie_max_age_minutes"):
+            config_module.load(write_config(tmp_path, {**VALID, "cookie_max_age_minutes": -5}))
+
+
+class TestStateDb:
+    def test_off_by_default(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).state_db is None
+
+    def test_reads_the_path(self, tmp_path):
+        config = config_module.load(write_config(tmp_path, {**VALID, "state_db": "data/state.db"}))
+        assert config.state_db == "data/state.db"
+
+
+class TestQuestCacheMinutes:
+    def test_defaults_to_half_an_hour(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).quest_cache_minutes == 30
+
+    def test_rejects_a_negative_value(self, tmp_path):
+        with pytest.raises(ConfigError, match="quest_cache_minutes"):
+            config_module.load(write_config(tmp_path, {**VALID, "quest_cache_minutes": -1}))
+
+
+class TestDaemonInterval:
+    def test_defaults_to_an_hour(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).daemon_interval_minutes == 60
+
+    def test_rejects_zero(self, tmp_path):
+        with pytest.raises(ConfigError, match="daemon_interval_minutes"):
+            config_module.load(write_config(tmp_path, {**VALID, "daemon_interval_minutes": 0}))
+
+
+class TestHttpPoolSize:
+    def test_defaults_to_one_per_worker(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).http_pool_size == 0
+
+    def test_rejects_a_negative_value(self, tmp_path):
+        with pytest.raises(ConfigError, match="http_pool_size"):
+            config_module.load(write_config(tmp_path, {**VALID, "http_pool_size": -1}))
+
+
+class TestHttpRetries:
+    def test_defaults_to_two(self, tmp_path):
+        assert config_module.load(write_config(tmp_path, VALID)).http_retries == 2
+
+    def test_zero_turns_retrying_off(self, tmp_path):
+        config = config_module.load(write_config(tmp_path, {**VALID, "http_retries": 0}))
+        assert config.http_retries == 0
+
+    def test_rejects_a_negative_value(self, tmp_path):
+        with pytest.raises(ConfigError, match="http_retries"):
+            config_module.load(write_config(tmp_path, {**VALID, "http_retries": -1}))
+
+
+class TestFleetLimits:
+    def test_off_by_default(self, tmp_path):
+        config = config_module.load(write_config(tmp_path, VALID))
+        assert (config.http_rate_limit, config.http_max_in_flight) == (0, 0)
+        assert config.http_rate_file is None
+
+    def test_reads_the_limits(self, tmp_path):
+        raw = {**VALID, "http_rate_limit": 2.5, "http_max_in_flight": 4, "http_rate_file": "x"}
+        config = config_module.load(write_config(tmp_path, raw))
+        assert (config.http_rate_limit, config.http_max_in_flight) == (2.5, 4)
+        assert config.http_rate_file == "x"
+
+    @pytest.mark.parametrize("key", ["http_rate_limit", "http_max_in_flight"])
+    def test_rejects_a_negative_limit(self, tmp_path, key):
+        with pytest.raises(ConfigError, match=key):
+            config_module.load(write_config(tmp_path, {**VALID, key: -1}))
+
+
 class TestDelays:
     def test_rejects_an_inverted_range(self):
         with pytest.raises(ConfigError, match="delay_min"):
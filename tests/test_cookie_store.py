@@ -0,0 +1,119 @@
+"""Tests for keeping the session between runs."""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+
+import pytest
+from requests.cookies import RequestsCookieJar
+
+from src.bot import NeboBot
+from src.config import Config, Delays
+from src.utils.cookie_store import CookieStore
+from tests.test_auth import FakeResponse, FakeSession
+
+NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
+SITE = "https://nebo.mobi"
+
+
+def jar_with(**cookies):
+    jar = RequestsCookieJar()
+    for name, value in cookies.items():
+        jar.set(name, value, domain="nebo.mobi", path="/")
+    return jar
+
+
+class TestCookieStore:
+    def test_round_trips_the_cookies(self, tmp_path):
+        store = CookieStore(tmp_path, SITE, "Первый", 30)
+        store.save(jar_with(JSESSIONID="abc"))
+        restored = RequestsCookieJar()
+        assert store.load(restored) is True
+        assert restored.get("JSESSIONID", domain="nebo.mobi") == "abc"
+
+    def test_accounts_get_separate_files(self, tmp_path):
+        assert CookieStore(tmp_path, SITE, "Первый", 30).path != CookieStore(
+            tmp_path, SITE, "Второй", 30
+        ).path
+
+    def test_sites_get_separate_files(self, tmp_path):
+        stand_in = CookieStore(tmp_path, "http://127.0.0.1:8080", "Первый", 30)
+        assert stand_in.path != CookieStore(tmp_path, SITE, "Первый", 30).path
+
+    def test_nothing_to_load_at_first(self, tmp_path):
+        assert CookieStore(tmp_path, SITE, "u", 30).load(RequestsCookieJar()) is False
+
+    def test_ignores_a_stale_file(self, tmp_path):
+        store = CookieStore(tmp_path, SITE, "u", 30)
+        store.save(jar_with(JSESSIONID="abc"))
+        saved = json.loads(store.path.read_text())
+        saved["saved_at"] -= 31 * 60
+        store.path.write_text(json.dumps(saved))
+        assert store.load(RequestsCookieJar()) is False
+
+    def test_skips_expired_cookies(self, tmp_path):
+        jar = RequestsCookieJar()
+        jar.set("old", "x", domain="nebo.mobi", path="/", expires=int(time.time()) - 10)
+        store = CookieStore(tmp_path, SITE, "u", 30)
+        store.save(jar)
+        assert store.load(RequestsCookieJar()) is False
+
+    def test_ignores_a_corrupt_file(self, tmp_path):
+        store = CookieStore(tmp_path, SITE, "u", 30)
+        store.path.write_text("{not json")
+        assert store.load(RequestsCookieJar()) is False
+
+    def test_file_is_private(self, tmp_path):
+        store = CookieStore(tmp_path, SITE, "u", 30)
+        store.save(jar_with(JSESSIONID="abc"))
+        if os.name == "posix":
+            assert store.path.stat().st_mode & 0o077 == 0
+
+    def test_leaves_no_temporary_files(self, tmp_path):
+        store = CookieStore(tmp_path, SITE, "u", 30)
+        store.save(jar_with(JSESSIONID="abc"))
+        store.save(jar_with(JSESSIONID="def"))
+        assert [p.name for p in tmp_path.iterdir()] == [store.path.name]
+
+
+class TestResume:
+    @pytest.fixture
+    def config(self, tmp_path):
+        return Config(username="u", password="p", delays=NO_DELAYS, cookie_dir=str(tmp_path))
+
+    def make_bot(self, config, session):
+        bot = NeboBot(config)
+        bot.auth.session = session
+        return bot
+
+    def test_resumes_a_live_session_without_logging_in(self, config):
+        CookieStore(config.cookie_dir, config.base_url, "u", 30).save(jar_with(JSESSIONID="abc"))
+        session = FakeSession(get_responses={"/home": FakeResponse(status_code=200)})
+        assert self.make_bot(config, session).start() is True
+        assert session.gets == ["https://nebo.mobi/home"]
+        assert session.posts == []
+
+    def test_logs_in_when_the_saved_session_has_expired(self, config, login_page, home_page):
+        store = CookieStore(config.cookie_dir, config.base_url, "u", 30)
+        store.save(jar_with(JSESSIONID="abc"))
+        session = FakeSession(
+            get_responses={
+                "/home": FakeResponse(status_code=302, location="https://nebo.mobi/welcome"),
+                "/login": FakeResponse(login_page, url="https://nebo.mobi/login"),
+            },
+            post_response=FakeResponse(home_page, url="https://nebo.mobi/home"),
+        )
+        assert self.make_bot(config, session).start() is True
+        assert len(session.posts) == 1
+        assert not store.path.exists()
+
+    def test_stop_keeps_the_session_instead_of_logging_out(self, config):
+        session = FakeSession()
+        session.cookies = jar_with(JSESSIONID="abc")
+        bot = self.make_bot(config, session)
+        bot.auth.authenticated = True
+        bot.stop()
+        assert session.gets == []
+        assert CookieStore(config.cookie_dir, config.base_url, "u", 30).path.exists()
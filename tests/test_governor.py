@@ -0,0 +1,163 @@
+"""Tests for the fleet-wide rate and concurrency limits."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.modules.auth import Auth
+from src.utils import governor, instrumentation, metrics, transport
+from src.utils.clock import VirtualClock
+from src.utils.governor import FileTokenBucket, Governor, TokenBucket
+from src.utils.instrumentation import RunStats
+from src.utils.transport import SharedTransport
+from tests.test_standin import config_for
+
+URL = "https://nebo.mobi/doors"
+
+
+@pytest.fixture
+def clock():
+    return VirtualClock(start=1_800_000_000)
+
+
+class TestTokenBucket:
+    def test_lets_a_burst_through_then_paces(self, clock):
+        bucket = TokenBucket(rate=2, clock=clock)
+        assert [bucket.take(), bucket.take()] == [0, 0]
+        assert bucket.take() == 0.5
+        clock.advance(0.5)
+        assert bucket.take() == 0
+
+    def test_refuses_a_rate_of_zero(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+    def test_a_file_shares_the_tokens_between_processes(self, clock, tmp_path):
+        path = tmp_path / "rate" / "bucket"
+        first = FileTokenBucket(path, rate=1, clock=clock)
+        second = FileTokenBucket(path, rate=1, clock=clock)
+        try:
+            assert first.take() == 0
+            assert second.take() == 1
+            clock.advance(1)
+            assert second.take() == 0
+        finally:
+            first.close()
+            second.close()
+
+
+class TestGovernor:
+    def test_holds_the_fleet_to_the_rate(self, clock):
+        limits = Governor(TokenBucket(rate=5, clock=clock), clock=clock)
+        for _ in range(10):
+            with limits.slot(URL):
+                pass
+        assert clock.monotonic() == pytest.approx(1.0)
+
+    def test_accounts_take_turns(self):
+        limits = Governor()
+        with governor.acting_for("Busy"):
+            first, second = limits._join(URL), limits._join(URL)
+        with governor.acting_for("Quiet"):
+            other = limits._join(URL)
+        with limits._condition:
+            assert limits._admit(first) == 0
+            assert limits._admit(second) > 0
+            assert limits._admit(other) == 0
+            assert limits._admit(second) == 0
+
+    def test_caps_requests_in_flight(self):
+        limits = Governor(max_in_flight=2)
+        busy = []
+        peak = []
+        lock = threading.Lock()
+
+        def request(name):
+            with governor.acting_for(name), limits.slot(URL):
+                with lock:
+                    busy.append(name)
+                    peak.append(len(busy))
+                time.sleep(0.02)
+                with lock:
+                    busy.remove(name)
+
+        threads = [threading.Thread(target=request, args=(f"A{i}",)) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+        assert len(peak) == 6
+
+    def test_counts_the_wait_against_the_account(self, clock):
+        limits = Governor(TokenBucket(rate=1, clock=clock), clock=clock)
+        before = metrics.HTTP_THROTTLED.samples().get(("Patient",), 0)
+        with governor.acting_for("Patient"):
+            for _ in range(3):
+                with limits.slot(URL):
+                    pass
+        assert metrics.HTTP_THROTTLED.samples()[("Patient",)] - before == pytest.approx(2)
+
+    def test_a_request_let_straight_through_is_not_held(self):
+        limits = Governor(max_in_flight=2)
+        with instrumentation.measuring(RunStats()) as stats, governor.acting_for("Prompt"):
+            for _ in range(3):
+                with limits.slot(URL):
+                    pass
+        assert stats.holds == 0
+
+    def test_the_async_engine_waits_on_the_loop(self, clock):
+        limits = Governor(TokenBucket(rate=4, clock=clock), clock=clock)
+
+        async def fetch():
+            async with limits.aslot(URL):
+                pass
+
+        async def main():
+            await asyncio.gather(*(fetch() for _ in range(8)))
+
+        asyncio.run(main())
+        assert clock.monotonic() == pytest.approx(1.0)
+        assert not limits._queues and not +limits._in_flight
+
+
+def test_nothing_to_govern_without_limits():
+    assert governor.from_settings(0, 0) is None
+    assert governor.from_settings(0, 3).bucket is None
+
+
+def test_requests_through_the_transport_wait_their_turn(clock, standin):
+    server = standin()
+    limits = Governor(TokenBucket(rate=2, clock=clock), max_in_flight=1, clock=clock)
+    shared = SharedTransport(pool_size=1, governor=limits)
+    previous = transport.set_transport(shared)
+    try:
+        with governor.acting_for("Player"):
+            assert Auth(config_for(server)).login() is True
+    finally:
+        transport.set_transport(previous)
+        shared.close()
+
+    # The login page, the form and the page it lands on: one of them waited.
+    assert clock.monotonic() >= 0.5
+    assert not +limits._in_flight
+
+
+def test_time_in_the_queue_is_not_counted_as_latency(standin):
+    server = standin()
+    shared = SharedTransport(pool_size=1, governor=Governor(TokenBucket(rate=4, burst=1)))
+    previous = transport.set_transport(shared)
+    try:
+        with instrumentation.measuring(RunStats()) as stats:
+            assert Auth(config_for(server)).login() is True
+    finally:
+        transport.set_transport(previous)
+        shared.close()
+
+    assert stats.held_seconds >= 0.4
+    assert "held" in stats.summary()
+    assert all(endpoint.slowest < 0.2 for endpoint in stats.endpoints.values())
@@ -0,0 +1,169 @@
+"""Tests for recording HTTP traffic and replaying it offline."""
+
+from __future__ import annotations
+
+import gzip
+import json
+import time
+from dataclasses import replace
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+import main as main_module
+from src.bot import NeboBot
+from src.config import Config, Delays
+from src.modules.auth import Auth
+from src.modules.maze import MazeBot
+from src.modules.quests import QuestBot
+from src.utils import http_archive
+from src.utils.http_archive import ArchiveError, request_key
+
+NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
+
+
+def play(config, session):
+    """Log in, read the tasks, walk the maze and log out; return what was seen."""
+    auth = Auth(config, session=session)
+    assert auth.login() is True
+    quests = QuestBot(auth, config).report()
+    maze = MazeBot(auth, config)
+    completed = maze.solve()
+    assert auth.logout() is True
+    auth.session.close()
+    return quests, completed, maze.keys_seen
+
+
+@pytest.fixture
+def recorded(tmp_path, standin):
+    """An archive of one run against the stand-in, and what that run saw."""
+    server = standin(seed=3, keys=40, pass_chance=0.7)
+    config = Config(
+        username="Player",
+        password="secret",
+        delays=NO_DELAYS,
+        base_url=server.base_url,
+        maze_rounds=0,
+        maze_max_attempts=6,
+    )
+    path = tmp_path / "run.jsonl.gz"
+    session = requests.Session()
+    http_archive.record(session, path, config.base_url)
+    seen = play(config, session)
+    return path, config, seen
+
+
+class TestRequestKey:
+    def test_ignores_the_page_version(self):
+        assert request_key("get", "https://nebo.mobi/home?4-1.-logoutLink") == request_key(
+            "GET", "https://nebo.mobi/home?9-1.-logoutLink"
+        )
+
+    def test_ignores_the_door_number_and_nonce(self):
+        assert request_key("GET", "https://nebo.mobi/doors?3-1.-doorLink1&action=1") == (
+            "GET",
+            "/doors",
+            "doorLink",
+        )
+
+    def test_ignores_the_session_in_the_path(self):
+        key = request_key("POST", "http://h/login;jsessionid=AB?0-1.-loginForm-loginForm")
+        assert key == ("POST", "/login", "loginForm-loginForm")
+
+
+class TestRecordAndReplay:
+    def test_a_replay_sees_what_the_recording_saw(self, recorded):
+        path, config, seen = recorded
+        session = requests.Session()
+        replayer = http_archive.replay(session, path)
+        offline = replace(config, base_url="https://nowhere.invalid")
+        assert play(offline, session) == seen
+        assert replayer.served > 0
+
+    def test_records_through_the_adapter_the_session_had(self, tmp_path, standin):
+        server = standin()
+
+        class Counting(HTTPAdapter):
+            sent = 0
+
+            def send(self, request, **kwargs):
+                self.sent += 1
+                return super().send(request, **kwargs)
+
+        session = requests.Session()
+        carrier = Counting()
+        session.mount("http://", carrier)
+        http_archive.record(session, tmp_path / "run.jsonl.gz", server.base_url)
+        assert session.get(server.base_url + "/").ok
+        session.close()
+        assert carrier.sent >= 1
+        replayer = http_archive.HttpReplayer(tmp_path / "run.jsonl.gz")
+        assert sum(map(len, replayer._queues.values())) == carrier.sent
+
+    def test_notes_how_long_each_exchange_took(self, tmp_path, standin):
+        server = standin()
+
+        class Slow(HTTPAdapter):
+            def send(self, request, **kwargs):
+                time.sleep(0.05)
+                return super().send(request, **kwargs)
+
+        session = requests.Session()
+        session.mount("http://", Slow())
+        http_archive.record(session, tmp_path / "run.jsonl.gz", server.base_url)
+        session.get(server.base_url + "/")
+        session.close()
+        with gzip.open(tmp_path / "run.jsonl.gz", "rt", encoding="utf-8") as archive:
+            entries = [json.loads(line) for line in archive][1:]
+        assert entries and all(entry["elapsed"] >= 0.05 for entry in entries)
+
+    def test_the_archive_holds_no_credentials_or_session(self, recorded):
+        path, _, _ = recorded
+        text = gzip.open(path, "rt", encoding="utf-8").read()
+        assert "secret" not in text
+        assert "JSESSIONID=" not in text
+
+    def test_running_past_the_archive_fails_like_the_network(self, recorded):
+        session = requests.Session()
+        http_archive.replay(session, recorded[0])
+        with pytest.raises(requests.RequestException):
+            for _ in range(100):
+                session.get("https://nebo.mobi/quests")
+
+    def test_refuses_a_file_that_is_not_an_archive(self, tmp_path):
+        path = tmp_path / "junk.jsonl.gz"
+        path.write_bytes(gzip.compress(b'{"format": 99}\n'))
+        with pytest.raises(ArchiveError):
+            http_archive.HttpReplayer(path)
+
+
+def test_a_run_with_a_kept_session_records_what_a_replay_needs(tmp_path, standin):
+    server = standin(seed=3, keys=40, pass_chance=0.7)
+    config = Config(
+        username="Player",
+        password="secret",
+        delays=NO_DELAYS,
+        base_url=server.base_url,
+        maze_rounds=0,
+        maze_max_attempts=6,
+        cookie_dir=str(tmp_path / "cookies"),
+    )
+    earlier = NeboBot(config)
+    assert earlier.start() is True
+    earlier.stop()
+
+    archives = str(tmp_path / "archives")
+    seen = []
+    for mode in ((archives, None), (None, archives)):
+        bot = NeboBot(main_module.archive_mode(config, *mode))
+        assert bot.start() is True
+        seen.append((bot.run(), bot.maze.keys_seen))
+        bot.stop()
+    assert seen[0] == seen[1]
+
+
+def test_archives_are_named_per_account(tmp_path):
+    first = http_archive.archive_path(tmp_path, "Первый")
+    assert first != http_archive.archive_path(tmp_path, "Второй")
+    assert first.parent == tmp_path and first.name.endswith(".jsonl.gz")
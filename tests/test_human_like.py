@@ -2,13 +2,25 @@
 
 from __future__ import annotations
 
+import asyncio
 import statistics
+import threading
+import time as time_module
 from datetime import datetime, time
 
 import pytest
 
-from src.config import Delays
-from src.utils.human_like import HumanBehavior, SessionBudget, within_active_hours
+from src.bot import NeboBot
+from src.config import Config, Delays
+from src.utils import human_like
+from src.utils.clock import VirtualClock
+from src.utils.human_like import (
+    HumanBehavior,
+    SessionBudget,
+    seconds_until_active,
+    within_active_hours,
+)
+from tests.test_auth import FakeResponse, FakeSession
 
 SAMPLES = 4000
 
@@ -99,6 +111,35 @@ class TestSessionBudget:
         budget.started -= 5 * 60
         assert 4.9 < budget.elapsed_minutes() < 5.1
 
+    def test_runs_on_the_clock_it_is_given(self):
+        clock = VirtualClock()
+        budget = SessionBudget(30, clock)
+        HumanBehavior(Delays(min_seconds=600, max_seconds=600), clock).pause()
+        assert budget.elapsed_minutes() == 10
+        clock.advance(20 * 60)
+        assert budget.expired() is True
+
+
+class TestProcessClock:
+    def test_pauses_wait_on_the_process_clock(self, virtual):
+        started = time_module.monotonic()
+        HumanBehavior(Delays(min_seconds=3600, max_seconds=3600, long_pause_chance=0)).pause()
+        assert time_module.monotonic() - started < 0.5
+        assert virtual.slept == 3600
+
+    def test_async_pauses_too(self, virtual):
+        behaviour = HumanBehavior(Delays(page_load_min=5, page_load_max=5))
+        asyncio.run(behaviour.apause_page_load())
+        assert virtual.slept == 5
+
+    def test_active_hours_read_the_process_clock(self, virtual):
+        window = (time(9, 0), time(10, 0))
+        opens_in = seconds_until_active(window)
+        virtual.advance(opens_in)
+        assert within_active_hours(window) is True
+        virtual.advance(3600)
+        assert within_active_hours(window) is False
+
 
 class TestActiveHours:
     def test_no_window_always_allows(self):
@@ -121,3 +162,65 @@ class TestActiveHours:
         window = (time(22, 0), time(2, 0))
         moment = datetime.strptime(f"2026-08-18 {now}", "%Y-%m-%d %H:%M")
         assert within_active_hours(window, moment) is expected
+
+
+class TestSecondsUntilActive:
+    def test_zero_inside_the_window(self):
+        now = datetime(2026, 8, 18, 12, 0)
+        assert seconds_until_active((time(9, 0), time(23, 0)), now) == 0
+
+    def test_zero_without_a_window(self):
+        assert seconds_until_active(None) == 0
+
+    def test_counts_to_this_mornings_start(self):
+        now = datetime(2026, 8, 18, 7, 30)
+        assert seconds_until_active((time(9, 0), time(23, 0)), now) == 90 * 60
+
+    def test_counts_to_tomorrows_start_after_closing(self):
+        now = datetime(2026, 8, 18, 23, 30)
+        assert seconds_until_active((time(9, 0), time(23, 0)), now) == 9.5 * 3600
+
+    def test_window_spanning_midnight(self):
+        now = datetime(2026, 8, 18, 12, 0)
+        assert seconds_until_active((time(22, 0), time(2, 0)), now) == 10 * 3600
+
+
+class TestInterrupt:
+    def test_wakes_a_pause_with_keyboard_interrupt(self, monkeypatch):
+        monkeypatch.setattr(human_like, "_interrupted", threading.Event())
+        behaviour = HumanBehavior(Delays(min_seconds=60, max_seconds=60, long_pause_chance=0.0))
+        timer = threading.Timer(0.05, human_like.interrupt)
+        timer.start()
+        started = time_module.monotonic()
+        with pytest.raises(KeyboardInterrupt):
+            behaviour.pause()
+        assert time_module.monotonic() - started < 5
+
+    def test_stop_still_logs_out(self, monkeypatch, home_page):
+        monkeypatch.setattr(human_like, "_interrupted", threading.Event())
+        session = FakeSession(
+            get_responses={
+                "/home?": FakeResponse(status_code=302, location="https://nebo.mobi/welcome"),
+                "/home": FakeResponse(home_page, url="https://nebo.mobi/home"),
+            }
+        )
+        bot = NeboBot(Config(username="u", password="p", delays=Delays(60, 60)))
+        bot.auth.session = session
+        bot.auth.authenticated = True
+        human_like.interrupt()
+        bot.stop()
+        assert any("logoutLink" in url for url in session.gets)
+
+
+class TestAsyncPauses:
+    def test_pauses_share_one_event_loop(self):
+        # A hundred 0.2 s pauses side by side take 0.2 s rather than 20,
+        # which only happens if none of them blocks the loop.
+        behaviour = HumanBehavior(Delays(min_seconds=0.2, max_seconds=0.2, long_pause_chance=0.0))
+
+        async def everyone():
+            await asyncio.gather(*(behaviour.apause() for _ in range(100)))
+
+        started = time_module.monotonic()
+        asyncio.run(everyone())
+        assert time_module.monotonic() - started < 2
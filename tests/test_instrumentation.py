@@ -0,0 +1,130 @@
+"""Tests for measuring where a run's time goes."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from src import wicket
+from src.config import Delays
+from src.modules.auth import Auth
+from src.modules.quests import QuestBot
+from src.utils import instrumentation
+from src.utils.human_like import HumanBehavior
+from src.utils.instrumentation import EndpointStats, RunStats, endpoint, measuring
+from tests.test_standin import config_for
+
+
+class TestEndpoint:
+    @pytest.mark.parametrize(
+        ("url", "expected"),
+        [
+            ("https://nebo.mobi/doors?3-1.-doorLink1&action=2", "/doors"),
+            ("http://h/login;jsessionid=AB?0-1.-loginForm-loginForm", "/login"),
+            ("https://nebo.mobi/", "/"),
+            ("https://nebo.mobi/quests/", "/quests"),
+        ],
+    )
+    def test_is_the_first_path_segment(self, url, expected):
+        assert endpoint(url) == expected
+
+
+class TestEndpointStats:
+    def test_buckets_responses_by_latency(self):
+        stats = EndpointStats()
+        for seconds in (0.01, 0.02, 0.03, 0.2, 30.0):
+            stats.add(seconds, 100, 200)
+        assert stats.count == 5
+        assert stats.buckets[0] == 2 and stats.buckets[-1] == 1
+        assert stats.quantile(0.5) == 0.05
+        assert stats.quantile(1.0) == float("inf")
+        assert (stats.bytes, stats.slowest, stats.statuses) == (500, 30.0, {200: 5})
+
+    def test_counts_uncompressed_bodies_as_sent(self):
+        stats = EndpointStats()
+        stats.add(0.01, 1000, 200)
+        stats.add(0.01, 1000, 200, wire=250)
+        assert (stats.bytes, stats.wire_bytes) == (2000, 1250)
+
+    def test_merges(self):
+        first, second = EndpointStats(), EndpointStats()
+        first.add(0.01, 10, 200)
+        second.add(0.3, 20, 302)
+        first.merge(second)
+        assert (first.count, first.bytes, first.statuses) == (2, 30, {200: 1, 302: 1})
+
+
+class TestHooks:
+    def test_do_nothing_outside_a_measurement(self):
+        instrumentation.record_response("https://nebo.mobi/home", 0.1, 10, 200)
+        instrumentation.record_parse(0.1)
+        assert instrumentation.current() is None
+
+    def test_count_parses_and_pauses(self):
+        human = HumanBehavior(Delays(min_seconds=0.01, max_seconds=0.01, long_pause_chance=0))
+        with measuring(RunStats()) as stats:
+            wicket.parse("<html><body><a href='./home'>x</a></body></html>")
+            human.pause()
+        assert stats.parses == 1 and stats.parse_seconds > 0
+        assert stats.sleeps == 1 and stats.sleep_seconds >= 0.01
+        assert stats.wall_seconds >= stats.parse_seconds + stats.sleep_seconds
+
+    def test_count_async_pauses(self):
+        human = HumanBehavior(Delays(min_seconds=0.01, max_seconds=0.01, long_pause_chance=0))
+
+        async def pause():
+            with measuring(RunStats()) as stats:
+                await human.apause()
+            return stats
+
+        assert asyncio.run(pause()).sleeps == 1
+
+    def test_threads_keep_their_own_figures(self):
+        seen = {}
+
+        def work(name, count):
+            with measuring(RunStats()) as stats:
+                for _ in range(count):
+                    instrumentation.record_parse(0.001)
+            seen[name] = stats.parses
+
+        threads = [threading.Thread(target=work, args=(n, n)) for n in (1, 2, 3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert seen == {1: 1, 2: 2, 3: 3}
+
+
+def test_times_every_response_of_a_run(standin):
+    config = config_for(standin())
+    with measuring(RunStats()) as stats:
+        auth = Auth(config)
+        assert auth.login() is True
+        QuestBot(auth, config).report()
+        assert auth.logout() is True
+
+    assert {"/login", "/home", "/quests"} <= set(stats.endpoints)
+    quests = stats.endpoints["/quests"]
+    assert quests.count == 1 and quests.bytes > 0 and quests.statuses == {200: 1}
+    assert stats.network_seconds <= stats.wall_seconds
+    assert "network" in stats.summary()
+    assert stats.endpoint_lines()[0].split()[0] in stats.endpoints
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_counts_bytes_on_the_wire_and_decoded(standin, compressed):
+    config = config_for(standin(gzip=compressed))
+    with measuring(RunStats()) as stats:
+        auth = Auth(config)
+        assert auth.login() is True
+        QuestBot(auth, config).report()
+
+    quests = stats.endpoints["/quests"]
+    if compressed:
+        assert 0 < quests.wire_bytes < quests.bytes / 2
+    else:
+        assert quests.wire_bytes == quests.bytes
+    assert "on the wire" in stats.summary()
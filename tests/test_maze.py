@@ -6,11 +6,17 @@ The doors fixture mirrors the live page: a decoy ``<span class="amount">``, the
 
 from __future__ import annotations
 
+import asyncio
+
+import pytest
+
 from src import wicket
 from src.config import Config, Delays
-from src.modules.auth import Auth
-from src.modules.maze import MazeBot
-from tests.test_auth import FakeSession
+from src.modules import maze as maze_module
+from src.modules.auth import AsyncAuth, Auth
+from src.modules.maze import AsyncMazeBot, MazeBot, MazeState
+from src.utils import flows
+from tests.test_auth import FakeAsyncSession, FakeResponse, FakeSession
 
 NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
 
@@ -110,3 +116,177 @@ class TestDoorUrls:
 
     def test_returns_empty_when_there_are_no_doors(self, home_page):
         assert make_maze().door_urls(wicket.parse(home_page), "https://nebo.mobi/home") == []
+
+
+class TestReadState:
+    URL = "https://nebo.mobi/doors"
+
+    @pytest.mark.parametrize("parser", wicket.available_parsers())
+    @pytest.mark.parametrize(
+        "fixture", ["doors_page", "dead_end_page", "victory_page", "home_page", "login_page"]
+    )
+    def test_agrees_with_the_individual_lookups(self, request, fixture, parser):
+        soup = wicket.parse(request.getfixturevalue(fixture), parser)
+        maze = make_maze()
+        state = maze.read_state(soup, self.URL)
+        assert state.level == maze.current_level(soup)
+        assert state.keys == maze.keys_left(soup)
+        assert state.solved == maze.is_solved(soup)
+        assert state.dead_end == maze.is_dead_end(soup)
+        assert list(state.reward) == maze.reward(soup)
+        assert state.doors == maze.doors_by_number(soup, self.URL)
+
+    def test_reads_a_door_page(self, doors_page):
+        state = make_maze().read_state(wicket.parse(doors_page), self.URL)
+        assert (state.level, state.keys, sorted(state.doors)) == (4, 1707, [1, 2, 3])
+        assert not state.solved and not state.dead_end
+
+    def test_reads_the_victory_screen(self, victory_page):
+        state = make_maze().read_state(wicket.parse(victory_page), self.URL)
+        assert state.solved
+        assert state.reward == ("880'000", "1'234'567")
+        assert state.keys == 1711
+
+
+class TestWalk:
+    def make(self, pages):
+        config = Config(username="u", password="p", delays=NO_DELAYS)
+        responses = [FakeResponse(page, url="https://nebo.mobi/doors") for page in pages]
+        session = FakeSession(get_responses={"/doors": responses})
+        return MazeBot(Auth(config, session=session), config), session
+
+    def test_opens_a_door_and_wins(self, doors_page, victory_page):
+        maze, session = self.make([doors_page, victory_page])
+        assert flows.run(maze._walk(10)) is True
+        assert "doorLink" in session.gets[1]
+
+    def test_stops_at_a_dead_end(self, doors_page, dead_end_page):
+        maze, _ = self.make([doors_page, dead_end_page])
+        assert flows.run(maze._walk(10)) is False
+
+
+class TestAsyncWalk:
+    def make(self, pages):
+        config = Config(username="u", password="p", delays=NO_DELAYS, maze_rounds=1)
+        responses = [FakeResponse(page, url="https://nebo.mobi/doors") for page in pages]
+        session = FakeAsyncSession(get_responses={"/doors": responses})
+        return AsyncMazeBot(AsyncAuth(config, session=session), config), session
+
+    def test_opens_a_door_and_wins(self, doors_page, victory_page):
+        maze, session = self.make([doors_page, victory_page])
+        assert asyncio.run(flows.arun(maze._walk(10))) is True
+        assert "doorLink" in session.gets[1]
+
+    def test_solve_retries_after_a_dead_end(self, doors_page, dead_end_page, victory_page):
+        maze, _ = self.make([doors_page, dead_end_page, doors_page, victory_page])
+        assert asyncio.run(maze.solve()) == 1
+
+
+class TestScanState:
+    URL = "https://nebo.mobi/doors"
+
+    @pytest.mark.parametrize("fixture", ["doors_page", "dead_end_page", "home_page"])
+    def test_agrees_with_the_parser(self, request, fixture):
+        page = request.getfixturevalue(fixture)
+        maze = make_maze()
+        assert maze.scan_state(page, self.URL) == maze.read_state(wicket.parse(page), self.URL)
+
+    def test_keeps_the_nonce_and_unescapes_the_href(self, doors_page):
+        doors = make_maze().scan_state(doors_page, self.URL).doors
+        assert doors[2] == "https://nebo.mobi/doors?3-1.-doorLink2&action=1787078108652"
+
+    def test_leaves_the_victory_screen_to_the_parser(self, victory_page):
+        assert make_maze().scan_state(victory_page, self.URL) is None
+
+    def test_leaves_a_page_without_a_counter_or_notice_to_the_parser(self, login_page):
+        assert make_maze().scan_state(login_page, self.URL) is None
+
+    def test_gives_up_on_an_unfamiliar_counter(self, doors_page):
+        page = doors_page.replace('<b class="amount">4</b>', '<b class="amount big">4</b>')
+        assert make_maze().scan_state(page, self.URL) is None
+
+    def test_gives_up_on_a_door_link_it_cannot_read(self, doors_page):
+        page = doors_page.replace('href="./doors?3-1.-doorLink3', "href='./doors?3-1.-doorLink3", 1)
+        assert make_maze().scan_state(page, self.URL) is None
+
+    def test_gives_up_on_a_split_key_line(self, victory_page):
+        page = victory_page.replace("Вы прошли лабиринт!", "")
+        assert make_maze().scan_state(page, self.URL) is None
+
+    def test_ignores_commented_out_markup(self, doors_page):
+        stale = '<!-- <a href="./doors?0-1.-doorLink9">old</a> -->'
+        page = doors_page.replace("<body", stale + "<body")
+        assert sorted(make_maze().scan_state(page, self.URL).doors) == [1, 2, 3]
+
+
+class TestStreamedPages:
+    URL = "https://nebo.mobi/doors"
+
+    def cut(self, page, chunk=64):
+        """The page as far as a streamed read would keep it, fed in chunks."""
+        body = page.encode("utf-8")
+        cut = maze_module._StreamCut()
+        for received in range(chunk, len(body) + chunk, chunk):
+            end = cut.end(body[:received])
+            if end is not None:
+                return body[:end].decode("utf-8")
+        return page
+
+    def test_a_door_page_is_cut_after_the_keys(self, doors_page):
+        assert len(self.cut(doors_page)) < len(doors_page)
+
+    @pytest.mark.parametrize("chunk", [1, 7, 1 << 20])
+    def test_markers_split_between_chunks_are_found(self, doors_page, chunk):
+        assert self.cut(doors_page, chunk) == self.cut(doors_page)
+
+    @pytest.mark.parametrize("fixture", ["dead_end_page", "victory_page"])
+    def test_other_pages_are_read_whole(self, request, fixture):
+        page = request.getfixturevalue(fixture)
+        assert self.cut(page) == page
+
+    def test_readers_see_the_same_state_in_the_cut_page(self, doors_page):
+        maze = make_maze()
+        whole = maze.read_state(wicket.parse(doors_page), self.URL)
+        assert maze.read_state(wicket.parse(self.cut(doors_page)), self.URL) == whole
+        assert maze.scan_state(self.cut(doors_page), self.URL) == whole
+
+
+class TestReader:
+    def make(self, reader, pages):
+        config = Config(username="u", password="p", delays=NO_DELAYS, maze_reader=reader)
+        responses = [FakeResponse(page, url="https://nebo.mobi/doors") for page in pages]
+        session = FakeSession(get_responses={"/doors": responses})
+        return MazeBot(Auth(config, session=session), config)
+
+    def test_scan_skips_the_parser_on_door_pages(self, doors_page, victory_page):
+        maze = self.make("scan", [doors_page, victory_page])
+        assert flows.run(maze._walk(10)) is True
+        assert maze.scan_counts == {"scanned": 1, "fallback": 1}
+
+    def test_verify_counts_agreement(self, doors_page, dead_end_page):
+        maze = self.make("verify", [doors_page, dead_end_page])
+        assert flows.run(maze._walk(10)) is False
+        assert maze.scan_counts == {"checked": 2}
+
+    def test_verify_reports_a_disagreement(self, doors_page, monkeypatch):
+        maze = self.make("verify", [doors_page])
+        monkeypatch.setattr(maze, "scan_state", lambda markup, url: MazeState(level=9))
+        maze._read(wicket.Page(FakeResponse(doors_page, url="https://nebo.mobi/doors")))
+        assert maze.scan_counts["mismatch"] == 1
+
+
+class TestDoorsProfile:
+    URL = "https://nebo.mobi/doors"
+
+    @pytest.mark.parametrize("parser", wicket.available_parsers())
+    @pytest.mark.parametrize("fixture", ["doors_page", "dead_end_page"])
+    def test_reads_the_same_state_as_the_full_page(self, request, fixture, parser):
+        page = request.getfixturevalue(fixture)
+        maze = make_maze()
+        lean = maze.read_state(wicket.parse(page, parser, "doors"), self.URL)
+        assert lean == maze.read_state(wicket.parse(page, parser), self.URL)
+
+    def test_the_victory_screen_is_read_from_the_full_page(self, victory_page):
+        page = wicket.Page(FakeResponse(victory_page, url=self.URL), profile="doors")
+        state = make_maze()._read(page)
+        assert state.solved and state.reward == ("880'000", "1'234'567")
@@ -0,0 +1,124 @@
+"""Tests for the Prometheus metrics."""
+
+from __future__ import annotations
+
+import threading
+import urllib.request
+from dataclasses import replace
+
+import pytest
+
+from src.modules.auth import Auth
+from src.modules.maze import MazeBot
+from src.utils import metrics
+from src.utils.metrics import Registry
+from tests.test_standin import config_for
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+class TestRendering:
+    def test_writes_the_text_exposition_format(self, registry):
+        counter = registry.counter("things_total", "Things seen.", ("kind",))
+        counter.inc("a")
+        counter.inc("a", amount=2)
+        counter.inc('say "hi"')
+        registry.gauge("level", "Current level.").set(1.5)
+        assert registry.render() == (
+            "# HELP things_total Things seen.\n"
+            "# TYPE things_total counter\n"
+            'things_total{kind="a"} 3\n'
+            'things_total{kind="say \\"hi\\""} 1\n'
+            "# HELP level Current level.\n"
+            "# TYPE level gauge\n"
+            "level 1.5\n"
+        )
+
+    def test_refuses_the_wrong_labels(self, registry):
+        with pytest.raises(ValueError):
+            registry.counter("x_total", "X.", ("a", "b")).inc("only one")
+
+    def test_refuses_a_name_twice(self, registry):
+        registry.gauge("x", "X.")
+        with pytest.raises(ValueError):
+            registry.counter("x", "X again.")
+
+    def test_a_metric_must_say_what_its_samples_are(self):
+        class Silent(metrics._Metric):
+            kind = "gauge"
+
+        with pytest.raises(TypeError):
+            Silent("silent", "Says nothing.")
+
+
+class TestCounter:
+    def test_sums_what_every_thread_counted(self, registry):
+        counter = registry.counter("hits_total", "Hits.", ("endpoint",))
+
+        def count():
+            for _ in range(1000):
+                counter.inc("/doors")
+
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counter.samples() == {("/doors",): 8000}
+
+    def test_a_gauge_keeps_the_latest_value(self, registry):
+        gauge = registry.gauge("keys", "Keys.", ("account",))
+        gauge.set(10, "A")
+        gauge.set(7, "A")
+        assert gauge.samples() == {("A",): 7}
+
+
+class TestPublishing:
+    def test_writes_a_textfile_in_one_step(self, registry, tmp_path):
+        registry.gauge("up", "Up.").set(1)
+        path = tmp_path / "collector" / "nebo.prom"
+        metrics.write_textfile(path, registry)
+        assert path.read_text(encoding="utf-8").endswith("up 1\n")
+        assert [p.name for p in path.parent.iterdir()] == ["nebo.prom"]
+
+    def test_a_failed_write_leaves_nothing_behind(self, registry, tmp_path, monkeypatch):
+        registry.gauge("up", "Up.").set(1)
+
+        def refuse(source, target):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(metrics.os, "replace", refuse)
+        with pytest.raises(OSError):
+            metrics.write_textfile(tmp_path / "nebo.prom", registry)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_answers_scrapes(self, registry):
+        registry.gauge("up", "Up.").set(1)
+        server = metrics.serve(0, registry=registry)
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        try:
+            with urllib.request.urlopen(url) as response:
+                assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                assert response.read().decode().endswith("up 1\n")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+def test_a_run_feeds_the_process_metrics(standin):
+    server = standin(pass_chance=0.0, keys=3)
+    config = replace(config_for(server, maze_rounds=0, maze_max_attempts=5), username="Metered")
+    doors_before = metrics.HTTP_RESPONSES.samples().get(("/doors", "200"), 0)
+    auth = Auth(config)
+    assert auth.login() is True
+    MazeBot(auth, config).solve()
+
+    assert metrics.LOGINS.samples()[("Metered", "ok")] == 1
+    assert metrics.MAZE_ATTEMPTS.samples()[("Metered",)] >= 1
+    assert metrics.KEYS_LEFT.samples()[("Metered",)] == 0
+    assert metrics.MAZE_DEAD_ENDS.samples()[("2",)] >= 1
+    assert metrics.HTTP_RESPONSES.samples()[("/doors", "200")] > doors_before
+    assert 'nebo_keys_left{account="Metered"} 0' in metrics.REGISTRY.render()
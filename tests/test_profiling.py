@@ -0,0 +1,80 @@
+"""Tests for profiling accounts' runs."""
+
+from __future__ import annotations
+
+import logging
+import pstats
+import tracemalloc
+
+import pytest
+
+import main as main_module
+from src import wicket
+from src.config import Delays
+from src.utils.human_like import HumanBehavior
+from src.utils.instrumentation import RunStats, measuring
+from src.utils import profiling
+from src.utils.profiling import AccountProfiler, profile_path
+
+
+def play():
+    """Parse a page, then pause as the bot would."""
+    wicket.parse("<html><body>" + "<p><a href='./doors'>Дверь</a></p>" * 200 + "</body></html>")
+    HumanBehavior(Delays(min_seconds=0.2, max_seconds=0.2, long_pause_chance=0)).pause()
+
+
+@pytest.fixture
+def tracing():
+    yield
+    tracemalloc.stop()
+
+
+def test_profiles_cpu_and_leaves_pauses_out(tmp_path):
+    profiler = AccountProfiler(tmp_path)
+    with measuring(RunStats()), profiler.profiling("Игрок"):
+        play()
+
+    stats = pstats.Stats(str(profile_path(tmp_path, "Игрок", ".pstats")))
+    assert stats.total_tt < 0.2
+    assert any(function == "parse" for _, _, function in stats.stats)
+
+
+def test_accumulates_an_account_across_runs(tmp_path):
+    profiler = AccountProfiler(tmp_path)
+    for _ in range(2):
+        with profiler.profiling("A"):
+            wicket.parse("<p>x</p>")
+
+    stats = pstats.Stats(str(profile_path(tmp_path, "A", ".pstats")))
+    calls = [entry[1] for key, entry in stats.stats.items() if key[2] == "parse"]
+    assert calls == [2]
+
+
+def test_reports_allocations(tmp_path, tracing):
+    profiler = AccountProfiler(tmp_path, trace_malloc=True, top=5)
+    with profiler.profiling("A"):
+        kept = [wicket.parse("<p>x</p>") for _ in range(20)]
+
+    report = profile_path(tmp_path, "A", ".malloc.txt").read_text(encoding="utf-8")
+    assert report.startswith("Allocations during the last run of A")
+    assert "Top 5 lines by growth:" in report
+    assert kept
+
+
+def test_a_profile_that_cannot_be_written_does_not_end_the_run(tmp_path, caplog):
+    profiler = AccountProfiler(tmp_path)
+    profile_path(tmp_path, "Игрок", ".pstats").mkdir()
+    with caplog.at_level(logging.WARNING), profiler.profiling("Игрок"):
+        play()
+    assert "Could not write the profile" in caplog.text
+
+
+@pytest.mark.parametrize("per_thread", [True, False])
+def test_several_workers_need_per_thread_profiles(monkeypatch, per_thread):
+    monkeypatch.setattr(profiling, "PER_THREAD", per_thread)
+    argv = ["--profile", "profiles", "--workers", "4"]
+    if per_thread:
+        assert main_module.parse_args(argv).workers == 4
+    else:
+        with pytest.raises(SystemExit):
+            main_module.parse_args(argv)
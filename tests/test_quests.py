@@ -2,11 +2,20 @@
 
 from __future__ import annotations
 
+import pytest
+
 from src import wicket
 from src.config import Config, Delays
 from src.modules.auth import Auth
-from src.modules.quests import QuestBot
-from tests.test_auth import FakeSession
+from src.modules.quests import (
+    Quest,
+    QuestBot,
+    QuestCache,
+    QuestPage,
+    QuestSnapshot,
+    snapshot_expiry,
+)
+from tests.test_auth import FakeResponse, FakeSession
 
 NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
 
@@ -106,3 +115,120 @@ class TestDescriptionParsing:
     def test_cooldown_description_comes_from_the_grey_line(self, quests_page):
         task = by_name(make_bot().parse(wicket.parse(quests_page)), "Индиана Джонс")
         assert task.description == "Пройди лабиринт 1 раз"
+
+
+class TestQuestsProfile:
+    @pytest.mark.parametrize("parser", wicket.available_parsers())
+    def test_reads_the_same_as_the_full_page(self, quests_page, parser):
+        bot = make_bot()
+        lean = wicket.parse(quests_page, parser, "quests")
+        full = wicket.parse(quests_page, parser)
+        assert bot.parse(lean) == bot.parse(full)
+        assert bot.done_today(lean) == bot.done_today(full) == (7, 7)
+        assert bot.keys_earned(lean) == bot.keys_earned(full) == 57
+
+
+class TestExtract:
+    @pytest.mark.parametrize("parser", wicket.available_parsers())
+    @pytest.mark.parametrize("profile", [None, "quests"])
+    def test_agrees_with_the_separate_readers(self, quests_page, parser, profile):
+        bot = make_bot()
+        soup = wicket.parse(quests_page, parser, profile)
+        page = bot.extract(soup)
+        assert page.quests == bot.parse(soup)
+        assert (page.completed, page.allowed) == bot.done_today(soup) == (7, 7)
+        assert page.keys_earned == bot.keys_earned(soup) == 57
+
+    @pytest.mark.parametrize(
+        "markup",
+        [
+            # No description div: the progress line must not become one.
+            '<div class="nfl"><div><b>Строитель</b></div>'
+            '<div class="minor">Прогресс: <span>3</span> из <span>5</span></div></div>',
+            # A strong title, and a countdown in minutes only.
+            '<div class="nfl"><div><strong>Легкие деньги</strong></div>'
+            '<div class="minor">Получи чаевые</div><div>До старта: 45 мин</div></div>',
+            # Thousands separators in the progress counts.
+            '<div class="nfl"><b>Инвестор</b><div class="white">Пополни счет</div>'
+            "Прогресс: 1 200 из 15'000</div>",
+            # A block with neither progress nor countdown is skipped.
+            '<div class="nfl"><b>Пусто</b></div>',
+            # No tasks and no counters at all.
+            "<html><body><p>Сервер отдыхает</p></body></html>",
+        ],
+    )
+    def test_agrees_on_unusual_blocks(self, markup):
+        bot = make_bot()
+        soup = wicket.parse(markup)
+        assert bot.extract(soup) == QuestPage(
+            bot.parse(soup), *bot.done_today(soup), bot.keys_earned(soup)
+        )
+
+
+ACTIVE = Quest("Инкассатор", "Собери выручку", done=149, total=150)
+WAITING = Quest("Индиана Джонс", "Пройди лабиринт", minutes_left=933)
+SOON = Quest("Инвестор", "Вложи", minutes_left=20)
+
+
+class TestSnapshotExpiry:
+    def test_cooling_down_pages_hold_until_the_first_countdown_ends(self):
+        assert snapshot_expiry([WAITING, SOON], 1000.0, 30) == 1000 + 20 * 60
+
+    def test_tasks_in_progress_use_the_configured_minutes(self):
+        assert snapshot_expiry([ACTIVE, WAITING], 1000.0, 30) == 1000 + 30 * 60
+
+    def test_an_empty_page_is_not_kept(self):
+        assert snapshot_expiry([], 1000.0, 30) == 1000
+
+    def test_zero_minutes_never_keeps_a_busy_page(self):
+        assert snapshot_expiry([ACTIVE], 1000.0, 0) == 1000
+
+
+class TestQuestCache:
+    def snapshot(self, expires_at):
+        return QuestSnapshot((WAITING,), 7, 7, 57, taken_at=0.0, expires_at=expires_at)
+
+    def test_serves_until_expiry(self):
+        cache = QuestCache()
+        cache.put("u", self.snapshot(100.0))
+        assert cache.get("u", now=99.0) is not None
+        assert cache.get("u", now=100.0) is None
+
+    def test_accounts_are_kept_apart(self):
+        cache = QuestCache()
+        cache.put("u", self.snapshot(100.0))
+        assert cache.get("other", now=0.0) is None
+
+    def test_countdowns_move_on_with_time(self):
+        quests = self.snapshot(10**9).current_quests(now=33 * 60 + 5)
+        assert quests[0].minutes_left == 933 - 33
+
+    def test_a_time_of_zero_is_a_time(self):
+        cache = QuestCache()
+        cache.put("u", self.snapshot(100.0))
+        assert cache.get("u", now=0.0) is not None
+        assert self.snapshot(100.0).current_quests(now=0.0)[0].minutes_left == 933
+
+
+class TestReportCache:
+    def make(self, page):
+        config = Config(username="u", password="p", delays=NO_DELAYS)
+        session = FakeSession(
+            get_responses={"/quests": FakeResponse(page, url="https://nebo.mobi/quests")}
+        )
+        bot = QuestBot(Auth(config, session=session), config)
+        bot.cache = QuestCache()
+        return bot, session
+
+    def test_a_second_report_skips_the_request(self, quests_page):
+        bot, session = self.make(quests_page)
+        first = bot.report()
+        assert bot.report() == first
+        assert len(session.gets) == 1
+
+    def test_without_a_cache_every_report_fetches(self, quests_page):
+        bot, session = self.make(quests_page)
+        bot.cache = None
+        bot.report()
+        bot.report()
+        assert len(session.gets) == 2
@@ -0,0 +1,226 @@
+"""Tests for learned timeouts, retries and the circuit breaker."""
+
+from __future__ import annotations
+
+import socket
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from src.modules.auth import Auth
+from src.utils import instrumentation, metrics, transport
+from src.utils.instrumentation import RunStats
+from src.utils.resilience import (
+    AdaptiveTimeouts,
+    CircuitBreaker,
+    CircuitOpenError,
+    Resilience,
+    RetryBudget,
+    is_idempotent,
+)
+from src.utils.transport import SharedTransport
+from tests.test_standin import config_for
+
+HOME = "https://nebo.mobi/home"
+
+
+def answer(status=200):
+    response = requests.Response()
+    response.status_code = status
+    response._content = b""
+    response._content_consumed = True
+    return response
+
+
+def scripted(*outcomes):
+    """A send function that goes through ``outcomes`` in turn."""
+    calls = []
+
+    def send(limits):
+        calls.append(limits)
+        outcome = outcomes[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return answer(outcome)
+
+    return send, calls
+
+
+@pytest.mark.parametrize(
+    ("method", "url", "expected"),
+    [
+        ("GET", HOME, True),
+        ("GET", "https://nebo.mobi/quests?4", True),
+        ("GET", "https://nebo.mobi/home?3-1.-logoutLink", False),
+        ("GET", "https://nebo.mobi/doors?3-1.-doorLink2&action=17", False),
+        ("POST", "https://nebo.mobi/quests", False),
+    ],
+)
+def test_only_page_reads_are_idempotent(method, url, expected):
+    assert is_idempotent(method, url) is expected
+
+
+class TestAdaptiveTimeouts:
+    def test_uses_the_ceiling_until_an_endpoint_is_known(self):
+        timeouts = AdaptiveTimeouts(min_samples=3)
+        timeouts.record(HOME, 0.1)
+        assert timeouts.limits(HOME, 30) == (30, 30)
+
+    def test_learns_from_the_latency_seen(self):
+        timeouts = AdaptiveTimeouts(min_samples=3, floor=0.5)
+        for seconds in (1.0, 1.0, 2.0):
+            timeouts.record(HOME, seconds)
+        assert timeouts.limits(HOME, 30) == (6.0, 6.0)
+        assert timeouts.limits(HOME, 4) == (4, 4)
+
+    def test_never_goes_below_the_floor(self):
+        timeouts = AdaptiveTimeouts(min_samples=1, floor=2.0)
+        timeouts.record(HOME, 0.01)
+        assert timeouts.limits(HOME, 30) == (2.0, 2.0)
+
+    def test_relearns_only_every_so_many_requests(self):
+        timeouts = AdaptiveTimeouts(min_samples=1, floor=0.5, relearn_after=2)
+        timeouts.record(HOME, 1.0)
+        assert timeouts.limits(HOME, 30) == (3.0, 3.0)
+        timeouts.record(HOME, 5.0)
+        assert timeouts.limits(HOME, 30) == (3.0, 3.0)
+        assert timeouts.limits(HOME, 30) == (15.0, 15.0)
+
+    def test_a_new_endpoint_connects_by_what_the_host_showed(self):
+        timeouts = AdaptiveTimeouts(min_samples=1, floor=0.5)
+        timeouts.record(HOME, 1.0)
+        assert timeouts.limits("https://nebo.mobi/quests", 30) == (3.0, 30)
+
+
+def test_the_retry_budget_is_earned_by_requests():
+    budget = RetryBudget(ratio=0.5, reserve=1)
+    assert budget.withdraw() is True
+    assert budget.withdraw() is False
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw() is True
+
+
+class TestCircuitBreaker:
+    def trip(self, breaker):
+        for _ in range(breaker.trip_after):
+            assert breaker.admit() == 0
+            breaker.record(False)
+
+    def test_opens_after_failures_in_a_row(self, virtual):
+        breaker = CircuitBreaker("nebo.mobi", trip_after=3, cooldown=5)
+        breaker.record(False)
+        breaker.record(True)
+        self.trip(breaker)
+        assert breaker.open
+        assert breaker.admit() == 5
+
+    def test_lets_one_probe_through_after_the_cooldown(self, virtual):
+        breaker = CircuitBreaker("nebo.mobi", trip_after=3, cooldown=5)
+        self.trip(breaker)
+        virtual.sleep(5)
+        assert breaker.admit() == 0
+        assert breaker.admit() > 0
+        breaker.record(True)
+        assert not breaker.open
+        assert breaker.admit() == 0
+
+    def test_a_failed_probe_doubles_the_cooldown(self, virtual):
+        breaker = CircuitBreaker("nebo.mobi", trip_after=3, cooldown=5)
+        self.trip(breaker)
+        virtual.sleep(5)
+        assert breaker.admit() == 0
+        breaker.record(False)
+        assert breaker.admit() == 10
+
+
+class TestSend:
+    def test_retries_a_page_read_that_timed_out(self, virtual):
+        send, calls = scripted(requests.ReadTimeout("slow"), 200)
+        response = Resilience(retries=2).send("GET", HOME, 30, send)
+        assert response.status_code == 200
+        assert len(calls) == 2
+        assert calls[0] == (30, 30)
+
+    def test_retries_a_server_error_until_retries_run_out(self, virtual):
+        send, calls = scripted(503, 503, 503)
+        response = Resilience(retries=2).send("GET", HOME, 30, send)
+        assert response.status_code == 503
+        assert len(calls) == 3
+
+    def test_never_sends_an_action_twice(self, virtual):
+        send, calls = scripted(requests.ConnectionError("reset"))
+        with pytest.raises(requests.ConnectionError):
+            Resilience().send("GET", "https://nebo.mobi/doors?3-1.-doorLink2", 30, send)
+        assert len(calls) == 1
+
+    def test_stops_retrying_when_the_budget_is_spent(self, virtual):
+        guard = Resilience(retries=5)
+        guard.budget = RetryBudget(ratio=0, reserve=1)
+        send, calls = scripted(503, 503, 503)
+        assert guard.send("GET", HOME, 30, send).status_code == 503
+        assert len(calls) == 2
+
+    def test_passes_an_explicit_timeout_on(self, virtual):
+        send, calls = scripted(200)
+        Resilience().send("GET", HOME, (1, 2), send)
+        assert calls == [(1, 2)]
+
+    def test_gives_up_when_the_site_stays_down(self, virtual):
+        guard = Resilience(retries=0, max_hold=60)
+        send, calls = scripted(*[requests.ConnectionError("refused")] * 50)
+        errors = []
+        while not errors or not isinstance(errors[-1], CircuitOpenError):
+            with pytest.raises(requests.ConnectionError) as caught:
+                guard.send("GET", HOME, 30, send)
+            errors.append(caught.value)
+        assert guard.breaker(HOME).open
+        # Five to trip, then one probe after each cool-down of 5, 10, 20 and
+        # 40 s; the next one, 80 s, is longer than a request waits.
+        assert len(calls) == 9
+        assert len(errors) == 10
+
+
+def test_an_outage_holds_the_fleet_instead_of_timing_out(virtual):
+    with socket.socket() as unused:
+        unused.bind(("127.0.0.1", 0))
+        port = unused.getsockname()[1]
+    shared = SharedTransport(pool_size=1, retries=0)
+    shared.resilience.max_hold = 60
+    previous = transport.set_transport(shared)
+    try:
+        auth = Auth(config_for(SimpleNamespace(base_url=f"http://127.0.0.1:{port}")))
+        results = [auth.is_authenticated(probe=True) for _ in range(10)]
+    finally:
+        transport.set_transport(previous)
+        shared.close()
+
+    assert results == [False] * 10
+    assert shared.resilience.breaker(auth.base_url).open
+    assert virtual.slept >= 60
+    assert metrics.CIRCUIT_OPEN.samples()[(f"127.0.0.1:{port}",)] == 1
+
+
+def test_a_flaky_site_is_retried(virtual, standin):
+    server = standin(seed=3, drop_rate=0.5)
+    shared = SharedTransport(pool_size=1, retries=3)
+    previous = transport.set_transport(shared)
+    retries_before = metrics.HTTP_RETRIES.samples().get(("/home",), 0)
+    try:
+        auth = Auth(config_for(server))
+        answered = [auth.is_authenticated(probe=True) for _ in range(5)]
+    finally:
+        transport.set_transport(previous)
+        shared.close()
+
+    assert answered == [False] * 5
+    assert metrics.HTTP_RETRIES.samples()[("/home",)] > retries_before
+
+
+def test_a_backoff_is_held_rather_than_paused(virtual):
+    send, _ = scripted(503, 200)
+    with instrumentation.measuring(RunStats()) as stats:
+        Resilience(retries=1).send("GET", HOME, 30, send)
+    assert stats.holds == 1
+    assert stats.sleeps == 0
@@ -0,0 +1,93 @@
+"""Tests for the daemon's wake times and timer queue."""
+
+from __future__ import annotations
+
+import threading
+import time as time_module
+from datetime import datetime, time
+
+from src.config import Config
+from src.scheduler import Scheduler, first_visit_delay, next_visit_delay
+from src.utils.clock import VirtualClock
+from src.utils.state_store import AccountState
+
+MORNING = datetime(2026, 8, 18, 9, 0)
+
+
+def config(**overrides):
+    return Config(username="u", password="p", **overrides)
+
+
+class TestNextVisitDelay:
+    def test_waits_for_the_soonest_cooldown(self):
+        delay = next_visit_delay(config(), 15 * 60 + 33, MORNING)
+        # A minute of slack: the countdown is rounded down to the minute.
+        assert delay == (15 * 60 + 34) * 60
+
+    def test_comes_back_after_the_interval_while_tasks_run(self):
+        assert next_visit_delay(config(daemon_interval_minutes=45), 0, MORNING) == 45 * 60
+
+    def test_comes_back_after_the_interval_when_the_page_said_nothing(self):
+        assert next_visit_delay(config(), None, MORNING) == 60 * 60
+
+    def test_never_wakes_inside_forbidden_hours(self):
+        # The cooldown ends at 23:01, after the window closes at 23:00, so the
+        # visit moves to 08:00 the next morning.
+        window = (time(8, 0), time(23, 0))
+        delay = next_visit_delay(config(active_hours=window), 14 * 60, MORNING)
+        assert delay == 23 * 60 * 60
+
+
+class TestFirstVisitDelay:
+    def stored(self, next_available_at):
+        return AccountState("u", 5, next_available_at, 0, None, None)
+
+    def test_visits_at_once_without_a_stored_state(self):
+        assert first_visit_delay(config(), None, MORNING) == 0
+
+    def test_waits_out_a_stored_cooldown(self):
+        unlocks = MORNING.timestamp() + 3600
+        assert first_visit_delay(config(), self.stored(unlocks), MORNING) == 3600 + 60
+
+    def test_a_cooldown_already_over_means_now(self):
+        unlocks = MORNING.timestamp() - 3600
+        assert first_visit_delay(config(), self.stored(unlocks), MORNING) == 0
+
+
+class TestScheduler:
+    def test_hands_out_entries_in_wake_order(self):
+        scheduler = Scheduler()
+        scheduler.schedule("later", 0.02)
+        scheduler.schedule("sooner", 0)
+        assert scheduler.next_due() == "sooner"
+        assert scheduler.next_due() == "later"
+        assert len(scheduler) == 0
+
+    def test_sleeps_until_the_entry_is_due(self):
+        scheduler = Scheduler()
+        scheduler.schedule("account", 0.1)
+        started = time_module.monotonic()
+        scheduler.next_due()
+        assert time_module.monotonic() - started >= 0.09
+
+    def test_an_earlier_entry_wakes_the_waiter(self):
+        scheduler = Scheduler()
+        scheduler.schedule("tomorrow", 86400)
+        threading.Timer(0.05, scheduler.schedule, ("now", 0)).start()
+        started = time_module.monotonic()
+        assert scheduler.next_due() == "now"
+        assert time_module.monotonic() - started < 5
+
+    def test_a_virtual_clock_skips_the_wait(self):
+        clock = VirtualClock()
+        scheduler = Scheduler(clock)
+        scheduler.schedule("tomorrow", 86400)
+        started = time_module.monotonic()
+        assert scheduler.next_due() == "tomorrow"
+        assert time_module.monotonic() - started < 1
+        assert clock.monotonic() >= 86400
+
+    def test_waits_for_a_run_to_return_its_account(self):
+        scheduler = Scheduler()
+        threading.Timer(0.05, scheduler.schedule, ("back", 0)).start()
+        assert scheduler.next_due() == "back"
@@ -0,0 +1,179 @@
+"""End-to-end runs against the local stand-in server."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+import requests
+
+from src.bot import AsyncNeboBot
+from src.config import Config, Delays
+from src.modules.auth import Auth
+from src.modules.maze import MazeBot
+from src.modules.quests import QuestBot, QuestCache
+from tools.standin import Options, Site
+
+NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
+
+
+def config_for(server, **overrides):
+    return Config(
+        username="Player",
+        password="secret",
+        delays=NO_DELAYS,
+        timeout=5,
+        base_url=server.base_url,
+        **overrides,
+    )
+
+
+class TestSite:
+    def test_a_new_session_gets_a_cookie_and_the_id_in_the_form(self):
+        reply = Site().handle("GET", "/login", {}, None)
+        session = reply.headers["Set-Cookie"].split(";")[0].split("=")[1]
+        assert f"./login;jsessionid={session}?1-1.-loginForm-loginForm" in reply.body
+
+    def test_logged_out_sessions_are_bounced_to_welcome(self):
+        reply = Site().handle("GET", "/doors", {}, None)
+        assert (reply.status, reply.headers["Location"]) == (302, "./welcome")
+
+    def test_stale_door_links_spend_nothing(self):
+        site = Site(Options(keys=5))
+        site.handle("POST", "/login?1-1.-loginForm-loginForm", {"login": "a", "password": "b"}, "")
+        session = next(iter(site.visits))
+        site.handle("GET", "/doors", {}, session)
+        site.handle("GET", "/doors?2-1.-doorLink1&action=0", {}, session)
+        assert site.accounts["a"].keys == 5
+
+
+class TestAgainstTheBot:
+    def test_logs_in_reads_tasks_and_logs_out(self, standin):
+        server = standin()
+        config = config_for(server)
+        auth = Auth(config)
+        assert auth.login() is True
+
+        quests = QuestBot(auth, config).report()
+        assert len(quests) == 5
+
+        assert auth.logout() is True
+        assert server.site.visits and not any(v.username for v in server.site.visits.values())
+
+    def test_rejects_unknown_credentials(self, standin):
+        server = standin(accounts={"Player": "other"})
+        assert Auth(config_for(server)).login() is False
+
+    @pytest.mark.parametrize("reader", ["dom", "scan", "verify"])
+    def test_solves_the_maze_and_counts_keys(self, standin, reader):
+        server = standin(pass_chance=1.0, keys=25)
+        config = config_for(server, maze_reader=reader, maze_rounds=2)
+        auth = Auth(config)
+        assert auth.login() is True
+
+        maze = MazeBot(auth, config)
+        assert maze.solve() == 2
+
+        account = server.site.accounts["Player"]
+        assert (account.wins, account.keys) == (2, 5)
+        assert maze.keys_seen == 5
+        assert maze.scan_counts["mismatch"] == 0
+
+    def test_stops_when_the_keys_run_out(self, standin):
+        server = standin(pass_chance=0.0, keys=3)
+        config = config_for(server, maze_rounds=0, maze_max_attempts=10)
+        auth = Auth(config)
+        auth.login()
+        assert MazeBot(auth, config).solve() == 0
+        assert server.site.accounts["Player"].keys == 0
+
+    def test_injected_errors_fail_the_request(self, standin):
+        server = standin(error_rate=1.0)
+        assert Auth(config_for(server)).login() is False
+
+
+def test_compresses_for_clients_that_accept_gzip(standin):
+    server = standin(gzip=True)
+    response = requests.get(f"{server.base_url}/login", timeout=5)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "loginForm" in response.text
+
+
+class TestStreamedMaze:
+    def solve(self, server, **overrides):
+        config = config_for(server, maze_stream=True, maze_rounds=1, **overrides)
+        auth = Auth(config)
+        assert auth.login() is True
+        maze = MazeBot(auth, config)
+        bodies = []
+        fetch = maze._get_streamed
+
+        def spy(url):
+            response = fetch(url)
+            bodies.append((len(response.content), response.headers.get("Content-Length")))
+            return response
+
+        maze._get_streamed = spy
+        assert maze.solve() == 1
+        assert server.site.accounts["Player"].wins == 1
+        return bodies
+
+    @pytest.mark.parametrize("reader", ["dom", "scan"])
+    def test_stops_reading_once_the_doors_are_in(self, standin, reader):
+        server = standin(pass_chance=1.0, keys=25, padding=8 * 1024)
+        bodies = self.solve(server, maze_reader=reader)
+        assert any(size < int(length) for size, length in bodies)
+
+    def test_drains_a_short_tail_and_keeps_the_connection(self, standin):
+        server = standin(pass_chance=1.0, keys=25, padding=8 * 1024)
+        self.solve(server)
+        assert server.connections == 1
+
+    def test_drops_the_connection_rather_than_read_a_long_tail(self, standin):
+        server = standin(pass_chance=1.0, keys=25, padding=64 * 1024)
+        self.solve(server)
+        assert server.connections > 1
+
+    def test_reads_compressed_pages_too(self, standin):
+        server = standin(pass_chance=1.0, keys=25, gzip=True, padding=64 * 1024)
+        bodies = self.solve(server)
+        assert any(size < 64 * 1024 for size, _ in bodies)
+
+
+class TestAsyncEngine:
+    @pytest.fixture(autouse=True)
+    def aiohttp(self):
+        return pytest.importorskip("aiohttp")
+
+    def test_plays_like_the_threaded_engine(self, standin):
+        server = standin(pass_chance=1.0, keys=25)
+        config = config_for(server, maze_rounds=2)
+
+        cache = QuestCache()
+
+        async def play():
+            bot = AsyncNeboBot(config, cache)
+            assert await bot.start() is True
+            assert await bot.run() is True
+            await bot.stop()
+            return bot
+
+        bot = asyncio.run(play())
+        account = server.site.accounts["Player"]
+        assert (account.wins, account.keys) == (2, 5)
+        assert bot.quest_wait is not None
+        assert cache.get("Player") is not None
+        assert not any(visit.username for visit in server.site.visits.values())
+
+    def test_a_kept_session_is_resumed(self, standin, tmp_path):
+        server = standin()
+        config = config_for(server, cookie_dir=str(tmp_path))
+
+        async def start():
+            bot = AsyncNeboBot(config)
+            assert await bot.start() is True
+            await bot.stop()
+
+        asyncio.run(start())
+        asyncio.run(start())
+        assert len(server.site.visits) == 1
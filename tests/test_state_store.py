@@ -0,0 +1,115 @@
+"""Tests for keeping account state between runs."""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+
+import pytest
+
+from src.bot import NeboBot
+from src.config import Config, Delays
+from src.models import Quest, QuestSnapshot
+from src.utils import state_store
+from src.utils.state_store import RunRecord, StateStore
+from tests.test_auth import FakeResponse, FakeSession
+
+NO_DELAYS = Delays(min_seconds=0, max_seconds=0, page_load_min=0, page_load_max=0)
+
+QUESTS = [
+    Quest("Инкассатор", "Собери выручку", done=149, total=150),
+    Quest("Индиана Джонс", "Пройди лабиринт", minutes_left=933),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StateStore(tmp_path / "state.db")
+
+
+class TestStateStore:
+    def test_nothing_is_known_at_first(self, store):
+        assert store.account("u") is None
+        assert store.quests("u") == []
+
+    def test_round_trips_a_run(self, store):
+        store.write(RunRecord("u", quests=QUESTS, quest_wait=933, keys_left=12), ok=True)
+        state = store.account("u")
+        assert state.keys_left == 12
+        assert state.last_run_ok is True
+        assert state.next_available_at == pytest.approx(time.time() + 933 * 60, abs=5)
+        assert store.quests("u") == QUESTS
+
+    def test_totals_mazes_across_runs(self, store):
+        store.write(RunRecord("u", mazes_completed=2), ok=True)
+        store.write(RunRecord("u", mazes_completed=1), ok=True)
+        assert store.account("u").mazes_completed == 3
+
+    def test_a_run_that_saw_nothing_keeps_what_was_known(self, store):
+        store.write(RunRecord("u", quests=QUESTS, quest_wait=60, keys_left=12), ok=True)
+        store.write(RunRecord("u"), ok=False)
+        state = store.account("u")
+        assert state.keys_left == 12
+        assert state.next_available_at is not None
+        assert state.last_run_ok is False
+        assert store.quests("u") == QUESTS
+
+    def test_a_fresh_task_list_replaces_the_old_one(self, store):
+        store.write(RunRecord("u", quests=QUESTS), ok=True)
+        store.write(RunRecord("u", quests=QUESTS[:1]), ok=True)
+        assert store.quests("u") == QUESTS[:1]
+
+    def test_accounts_are_kept_apart(self, store):
+        store.write(RunRecord("Первый", keys_left=1), ok=True)
+        store.write(RunRecord("Второй", keys_left=2), ok=True)
+        assert store.account("Первый").keys_left == 1
+        assert store.account("Второй").keys_left == 2
+
+    def test_keeps_the_task_page_for_the_next_run(self, store):
+        snapshot = QuestSnapshot(tuple(QUESTS), 7, 7, 57, taken_at=10.0, expires_at=20.0)
+        store.write(RunRecord("u", quests=QUESTS, quest_snapshot=snapshot), ok=True)
+        assert store.quest_snapshot("u") == snapshot
+
+    def test_every_run_is_logged(self, store):
+        store.write(RunRecord("u", mazes_completed=1), ok=True)
+        store.write(RunRecord("u"), ok=False)
+        with sqlite3.connect(store.path) as connection:
+            rows = connection.execute("SELECT ok, mazes_completed FROM runs").fetchall()
+        assert rows == [(1, 1), (0, 0)]
+
+    def test_sets_the_file_up_once(self, store, monkeypatch):
+        store.write(RunRecord("u"), ok=True)
+        monkeypatch.setattr(state_store, "_SCHEMA", "not a schema")
+        store.write(RunRecord("u"), ok=True)
+        assert store.account("u").last_run_ok is True
+
+
+class TestRunWritesThrough:
+    def test_one_run_records_tasks_keys_and_mazes(
+        self, tmp_path, quests_page, doors_page, victory_page
+    ):
+        config = Config(
+            username="u", password="p", delays=NO_DELAYS, state_db=str(tmp_path / "state.db")
+        )
+        session = FakeSession(
+            get_responses={
+                "/quests": FakeResponse(quests_page, url="https://nebo.mobi/quests"),
+                "/doors": [
+                    FakeResponse(doors_page, url="https://nebo.mobi/doors"),
+                    FakeResponse(victory_page, url="https://nebo.mobi/doors"),
+                ],
+            }
+        )
+        bot = NeboBot(config)
+        bot.auth.session = bot.maze.session = bot.quests.session = session
+        bot.auth.authenticated = True
+
+        assert bot.run() is True
+
+        state = bot.state.account("u")
+        assert state.mazes_completed == 1
+        assert state.keys_left == 1711
+        assert [quest.name for quest in bot.state.quests("u")][0] == "Инкассатор"
+
+        # The next run's bot finds the task page in the store.
+        assert NeboBot(config).quests.cache.get("u") is not None
@@ -0,0 +1,58 @@
+"""Tests for the connections shared between accounts."""
+
+from __future__ import annotations
+
+from dataclasses import replace
+
+import pytest
+
+from src.modules.auth import Auth
+from src.utils import transport
+from src.utils.transport import SharedTransport
+from tests.test_standin import config_for
+
+
+@pytest.fixture
+def shared():
+    pool = SharedTransport(pool_size=2)
+    previous = transport.set_transport(pool)
+    yield pool
+    transport.set_transport(previous)
+    pool.close()
+
+
+@pytest.fixture
+def server(standin):
+    return standin()
+
+
+def open_connections(pool):
+    return sum(p.num_connections for p in pool.adapter.poolmanager.pools._container.values())
+
+
+def test_without_a_shared_transport_sessions_are_plain():
+    assert transport.get_transport() is None
+    adapter = transport.new_session().get_adapter("https://nebo.mobi")
+    assert not isinstance(adapter, transport.SharedAdapter)
+
+
+def test_accounts_take_turns_on_one_connection(shared, server):
+    first = Auth(replace(config_for(server), username="Первый"))
+    second = Auth(replace(config_for(server), username="Второй"))
+    assert first.login() is True
+    assert second.login() is True
+
+    assert open_connections(shared) == 1
+    assert first.session.cookies.get("JSESSIONID") != second.session.cookies.get("JSESSIONID")
+    players = {visit.username for visit in server.site.visits.values()}
+    assert {"Первый", "Второй"} <= players
+
+
+def test_a_stopped_account_leaves_the_pool_open(shared, server):
+    first = Auth(config_for(server))
+    assert first.login() is True
+    first.session.close()
+
+    second = Auth(replace(config_for(server), username="Другой"))
+    assert second.login() is True
+    assert open_connections(shared) == 1
@@ -3,12 +3,20 @@
 from __future__ import annotations
 
 import pytest
+import requests
 
 from src import wicket
+from tests.test_auth import FakeResponse
 
 LOGIN_URL = "https://nebo.mobi/login"
 
 
+@pytest.fixture(params=wicket.available_parsers())
+def installed_parsers(request):
+    """Every installed tree builder; the helpers must agree across all of them."""
+    return request.param
+
+
 class TestFindForm:
     def test_finds_login_form_on_the_real_page(self, login_page):
         soup = wicket.parse(login_page)
@@ -141,3 +149,161 @@ class TestFindError:
 
     def test_none_when_the_panel_is_empty(self):
         assert wicket.find_error(wicket.parse('<li class="feedbackPanelERROR"></li>')) is None
+
+
+class TestParsers:
+    def test_stdlib_parser_is_always_available(self):
+        assert "html.parser" in wicket.available_parsers()
+
+    def test_auto_picks_the_fastest_installed(self):
+        assert wicket.resolve_parser("auto") == wicket.available_parsers()[0]
+
+    def test_rejects_an_unknown_parser(self):
+        with pytest.raises(wicket.WicketError, match="Unknown parser"):
+            wicket.resolve_parser("regex")
+
+    def test_login_form_is_identical(self, installed_parsers, login_page_with_cookie):
+        soup = wicket.parse(login_page_with_cookie, installed_parsers)
+        form = wicket.parse_form(wicket.find_form(soup, "loginForm"), LOGIN_URL)
+        assert form == wicket.WicketForm(
+            action_url="https://nebo.mobi/login?1-1.-loginForm-loginForm",
+            fields={"id3_hf_0": "token42", "login": "", "password": ""},
+            submit_name="p::submit",
+        )
+
+    def test_links_are_identical(self, installed_parsers, doors_page, home_page):
+        doors = wicket.parse(doors_page, installed_parsers)
+        home = wicket.parse(home_page, installed_parsers)
+        assert len(wicket.find_links_containing(doors, "doorLink", "https://nebo.mobi/doors")) == 3
+        assert wicket.find_link_href(home, "Выход", "https://nebo.mobi/home") == (
+            "https://nebo.mobi/home?4-1.-logoutLink"
+        )
+
+    def test_banners_are_identical(self, installed_parsers, dead_end_page, login_error_page):
+        assert wicket.find_notification(wicket.parse(dead_end_page, installed_parsers)) == (
+            "Вы попали в тупик!"
+        )
+        assert wicket.find_error(wicket.parse(login_error_page, installed_parsers)) == (
+            "Неверное имя или пароль"
+        )
+
+
+class TestProfiles:
+    def test_login_profile_keeps_the_whole_form(self, installed_parsers, login_page_with_cookie):
+        lean = wicket.parse(login_page_with_cookie, installed_parsers, "login")
+        full = wicket.parse(login_page_with_cookie, installed_parsers)
+        assert wicket.parse_form(wicket.find_form(lean, "loginForm"), LOGIN_URL) == (
+            wicket.parse_form(wicket.find_form(full, "loginForm"), LOGIN_URL)
+        )
+
+    def test_login_profile_drops_the_rest(self, login_page):
+        soup = wicket.parse(login_page, profile="login")
+        assert soup.find("a") is None and soup.find("script") is None
+
+    def test_home_profile_finds_the_logout_link(self, installed_parsers, home_page):
+        soup = wicket.parse(home_page, installed_parsers, "home")
+        assert wicket.find_link_href(soup, "Выход", "https://nebo.mobi/home") == (
+            "https://nebo.mobi/home?4-1.-logoutLink"
+        )
+
+    def test_doors_profile_keeps_links_and_banners(self, installed_parsers, dead_end_page):
+        soup = wicket.parse(dead_end_page, installed_parsers, "doors")
+        assert wicket.find_notification(soup) == "Вы попали в тупик!"
+        assert wicket.find_links_containing(soup, "doors", "https://nebo.mobi/doors")
+
+
+class TestPage:
+    def make(self, html, url="https://nebo.mobi/home", profile=None):
+        return wicket.Page(FakeResponse(html, url=url), profile=profile)
+
+    def test_parses_once_however_often_it_is_read(self, home_page, monkeypatch):
+        calls = []
+        real_parse = wicket.parse
+
+        def counting_parse(*args):
+            calls.append(args)
+            return real_parse(*args)
+
+        monkeypatch.setattr(wicket, "parse", counting_parse)
+        page = self.make(home_page)
+        page.text, page.anchors, page.forms, page.link("Выход"), wicket.page_text(page)
+        assert len(calls) == 1
+
+    def test_finds_the_logout_link(self, home_page):
+        assert self.make(home_page).link("Выход") == "https://nebo.mobi/home?4-1.-logoutLink"
+
+    def test_link_matches_find_link_href(self, login_page):
+        page = self.make(login_page, LOGIN_URL)
+        for text in ("Выход", "Забыли пароль?"):
+            assert page.link(text) == wicket.find_link_href(wicket.parse(login_page), text, LOGIN_URL)
+
+    def test_collects_door_links(self, doors_page):
+        page = self.make(doors_page, "https://nebo.mobi/doors")
+        assert page.links_containing("doorLink") == wicket.find_links_containing(
+            wicket.parse(doors_page), "doorLink", "https://nebo.mobi/doors"
+        )
+
+    def test_matches_links_on_the_href_not_the_page_url(self, doors_page):
+        # Every href here is relative, so only the resolved URLs name the host.
+        assert self.make(doors_page, "https://nebo.mobi/doors").links_containing("nebo.mobi") == []
+
+    def test_parses_the_login_form(self, login_page_with_cookie):
+        page = self.make(login_page_with_cookie, LOGIN_URL, profile="login")
+        assert page.form("loginForm").fields["id3_hf_0"] == "token42"
+
+    def test_raises_when_the_form_is_absent(self, home_page):
+        with pytest.raises(wicket.WicketError):
+            self.make(home_page).form("loginForm")
+
+    def test_text_matches_get_text(self, quests_page):
+        assert self.make(quests_page).text == wicket.parse(quests_page).get_text(" ", strip=True)
+
+
+class TestPageEncoding:
+    @pytest.fixture(autouse=True)
+    def fresh_cache(self, monkeypatch):
+        monkeypatch.setattr(wicket, "_host_encodings", {})
+
+    def test_uses_the_declared_header(self):
+        response = FakeResponse("Лабиринт", content_type="text/html; charset=windows-1251")
+        assert wicket.page_encoding(response) == "cp1251"
+        assert response.detections == 0
+
+    def test_falls_back_to_the_meta_tag(self, login_page):
+        response = FakeResponse(login_page, content_type="text/html")
+        assert wicket.page_encoding(response) == "utf-8"
+        assert response.detections == 0
+
+    @staticmethod
+    def undeclared(text, codec="utf-8"):
+        response = requests.Response()
+        response._content = text.encode(codec)
+        response.url = "https://nebo.mobi/doors"
+        return response
+
+    def test_takes_utf8_without_detecting(self, home_page):
+        response = FakeResponse(home_page, content_type=None)
+        assert wicket.page_encoding(response) == "utf-8"
+        assert response.detections == 0
+
+    def test_detects_once_per_host(self):
+        first = FakeResponse(content_type=None)
+        first.content = "Осталось ключей: 5".encode("cp1251")
+        second = FakeResponse(content_type=None)
+        wicket.page_encoding(first)
+        wicket.page_encoding(second)
+        assert (first.detections, second.detections) == (1, 0)
+
+    def test_learns_nothing_from_an_ascii_page(self):
+        text = "Осталось ключей: 5. Комната 3, выберите дверь."
+        assert wicket.page_encoding(self.undeclared("<p>Loading</p>")) == "utf-8"
+        assert wicket.Page(self.undeclared(text, "cp1251")).html == text
+
+    def test_ignores_an_unknown_charset(self, home_page):
+        response = FakeResponse(home_page, content_type="text/html; charset=klingon")
+        assert wicket.page_encoding(response) == "utf-8"
+
+    def test_page_decodes_the_bytes_it_was_given(self):
+        response = FakeResponse(content_type="text/html; charset=windows-1251")
+        response.content = "Осталось ключей: 5".encode("cp1251")
+        assert wicket.Page(response).html == "Осталось ключей: 5"
@@ -0,0 +1,468 @@
+"""A local stand-in for nebo.mobi, for load tests that must not touch the site.
+
+Serves the pages saved in ``tests/fixtures`` the way the live site does:
+Wicket-style URLs whose page version moves on with every render, a session
+cookie (with ``;jsessionid=`` in the first login form, as before the cookie
+is known), bounces to ``/welcome`` for sessions that are not logged in, and a
+maze that spends a key per door, opens the first and last rooms always and
+the rooms between with ``pass_chance``, and ends in a dead end or the victory
+screen. Keys and wins are kept per account across logins.
+
+Everything runs on the standard library, one thread per connection, with
+keep-alive so a pooled client is measured as it would be against the site.
+Latency and failures can be injected per request::
+
+    python -m tools.standin --port 8080 --latency 0.05 0.3 --error-rate 0.01
+
+``--gzip`` compresses pages for clients that accept it, to measure transfer
+sizes. Then point ``base_url`` at ``http://127.0.0.1:8080``. Any username and
+password are accepted unless ``--account NAME:PASSWORD`` restricts them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import itertools
+import logging
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+
+# The session id baked into the saved login page, and the page versions and
+# door nonce baked into the others; each is swapped for live values.
+_FIXTURE_SESSION = "0000000000000000000000000000DEAD"
+_FIXTURE_VERSION = re.compile(r"\?\d+-(\d+)\.-")
+_FIXTURE_NONCE = "1787078108652"
+
+# "3-1.-doorLink2" in a query: page version, render count, component path.
+_LISTENER = re.compile(r"^(\d+)-\d+\.-([\w-]+)")
+_DOOR = re.compile(r"doorLink(\d)")
+
+# Live values in the saved maze pages.
+_COUNTER = re.compile(r'<b class="amount">\d+</b>')
+_KEYS = re.compile(r"(Осталось ключей: (?:<img[^>]*>)?(?:<span>)?)[\d']+")
+_REVEALED = re.compile(
+    r'<div class="hr"></div>\s*<div class="m5">\s*Комната: <span>.*?</div>.*?</div>', re.S
+)
+_REVEALED_ROOM = re.compile(r"Комната: <span>\d+</span>")
+_REVEALED_DOOR = re.compile(r"door_(?:go|wall)")
+
+_SESSION_COOKIE = "JSESSIONID"
+_CONTENT_TYPE = "text/html;charset=UTF-8"
+
+_WELCOME = """<!DOCTYPE html>
+<html><head><title>Небо</title></head>
+<body><div class="main"><a href="./login">Вход</a></div></body></html>
+"""
+
+
+@dataclass(frozen=True)
+class Options:
+    """How the stand-in behaves.
+
+    Attributes:
+        latency: Bounds of the delay added to every response, in seconds.
+        error_rate: Share of requests answered with a 500.
+        drop_rate: Share of requests whose connection is closed unanswered.
+        pass_chance: Odds that a door in a middle room opens.
+        rooms: Rooms in the maze; opening a door in the last one wins.
+        keys: Keys an account starts with.
+        seed: Seed for door outcomes and injected failures.
+        accounts: Usernames mapped to passwords, or None to accept anyone.
+        gzip: Compress pages for clients that accept gzip.
+        padding: Bytes of navigation markup added to the end of every page.
+            The saved pages are trimmed; live ones carry kilobytes of menus
+            below what the bot reads.
+    """
+
+    latency: tuple[float, float] = (0.0, 0.0)
+    error_rate: float = 0.0
+    drop_rate: float = 0.0
+    pass_chance: float = 0.6
+    rooms: int = 10
+    keys: int = 1000
+    seed: int | None = None
+    accounts: dict[str, str] | None = None
+    gzip: bool = False
+    padding: int = 0
+
+
+@dataclass
+class Account:
+    """One player's game, which outlives their sessions.
+
+    Attributes:
+        keys: Keys left.
+        room: Room the current maze run stands in, 0 between runs.
+        layout: Which doors opened in the room just passed.
+        wins: Mazes completed.
+        doors_opened: Keys spent.
+    """
+
+    keys: int
+    room: int = 0
+    layout: tuple[bool, bool, bool] | None = None
+    wins: int = 0
+    doors_opened: int = 0
+
+
+@dataclass
+class Visit:
+    """One browser session, identified by its cookie.
+
+    Attributes:
+        id: The session id.
+        username: The account logged in, or None.
+        version: Page version of the last page rendered.
+        nonce: The ``action`` the current door links carry.
+    """
+
+    id: str
+    username: str | None = None
+    version: int = 0
+    nonce: str = ""
+
+
+@dataclass
+class Reply:
+    """What the site answers to one request."""
+
+    status: int = 200
+    body: str = ""
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+class Site:
+    """The game itself, independent of HTTP.
+
+    Every request is handled under one lock; the work is a few string
+    substitutions, and latency is added outside it by the server.
+    """
+
+    def __init__(self, options: Options = Options()):
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.accounts: dict[str, Account] = {}
+        self.visits: dict[str, Visit] = {}
+        self._lock = threading.Lock()
+        self._nonces = itertools.count(int(time.time() * 1000))
+        self._pages = {
+            path.stem: path.read_text(encoding="utf-8") for path in FIXTURES.glob("*.html")
+        }
+
+    def handle(
+        self, method: str, target: str, form: dict[str, str], session_id: str | None
+    ) -> Reply:
+        """Answer a request.
+
+        Args:
+            method: ``GET`` or ``POST``.
+            target: The request target, path and query.
+            form: The decoded POST body.
+            session_id: The session cookie, if the client sent one.
+        """
+        parts = urlsplit(target)
+        path, _, path_session = parts.path.partition(";jsessionid=")
+        path = path.rstrip("/") or "/"
+
+        with self._lock:
+            visit = self.visits.get(session_id or path_session or "")
+            headers: dict[str, str] = {}
+            if visit is None:
+                visit = Visit(secrets.token_hex(16).upper())
+                self.visits[visit.id] = visit
+                headers["Set-Cookie"] = f"{_SESSION_COOKIE}={visit.id}; Path=/; HttpOnly"
+
+            reply = self._route(method, path, parts.query, form, visit)
+            reply.headers.update(headers)
+            return reply
+
+    def _route(
+        self, method: str, path: str, query: str, form: dict[str, str], visit: Visit
+    ) -> Reply:
+        """Dispatch a request to its page."""
+        listener = _LISTENER.match(query)
+        component = listener.group(2) if listener else ""
+
+        if path == "/welcome":
+            return Reply(body=_WELCOME)
+        if path == "/login":
+            if method == "POST" and component.endswith("loginForm"):
+                return self._submit_login(visit, form)
+            return self._render(visit, "login" if visit.version == 0 else "login_with_cookie")
+        if path not in ("/", "/home", "/doors", "/quests"):
+            return Reply(404, "<html><body>Страница не найдена</body></html>")
+
+        if visit.username is None:
+            return _redirect("./welcome")
+        if component.endswith("logoutLink"):
+            visit.username = None
+            return _redirect("./welcome")
+        if path == "/doors":
+            return self._doors(visit, component, parse_qs(query).get("action", [""])[0])
+        if path == "/quests":
+            return self._render(visit, "quests")
+        return self._render(visit, "home")
+
+    def _submit_login(self, visit: Visit, form: dict[str, str]) -> Reply:
+        """Check the credentials and, as Wicket does, redirect after the post."""
+        username = form.get("login", "")
+        password = form.get("password", "")
+        known = self.options.accounts
+        if not username or not password or (known is not None and known.get(username) != password):
+            return self._render(visit, "login_error")
+        visit.username = username
+        self.accounts.setdefault(username, Account(self.options.keys))
+        return _redirect("./home")
+
+    def _doors(self, visit: Visit, component: str, action: str) -> Reply:
+        """Show the maze, opening a door first if a current door link was followed."""
+        account = self.accounts[visit.username]
+        door = _DOOR.fullmatch(component)
+        # A stale link, one from an older render, just shows the maze again.
+        if door is None or action != visit.nonce or account.room == 0 or account.keys == 0:
+            if account.room == 0:
+                account.room, account.layout = 1, None
+            return self._render_doors(visit, account)
+
+        account.keys -= 1
+        account.doors_opened += 1
+        room = account.room
+        if room >= self.options.rooms:
+            account.room, account.wins = 0, account.wins + 1
+            return self._render(visit, "victory", keys=account.keys)
+
+        chance = 1.0 if room == 1 else self.options.pass_chance
+        if self.random.random() >= chance:
+            account.room = 0
+            return self._render(visit, "dead_end")
+
+        opened = int(door.group(1)) - 1
+        layout = [self.random.random() < chance for _ in range(3)]
+        layout[opened] = True
+        account.room, account.layout = room + 1, tuple(layout)
+        return self._render_doors(visit, account)
+
+    def _render_doors(self, visit: Visit, account: Account) -> Reply:
+        visit.nonce = str(next(self._nonces))
+        return self._render(
+            visit, "doors", room=account.room, keys=account.keys, layout=account.layout
+        )
+
+    def _render(self, visit: Visit, page: str, **values) -> Reply:
+        """Fill a saved page with this session's live values."""
+        visit.version += 1
+        body = _FIXTURE_VERSION.sub(rf"?{visit.version}-\1.-", self._pages[page])
+        body = body.replace(_FIXTURE_SESSION, visit.id).replace(_FIXTURE_NONCE, visit.nonce)
+        if page == "doors":
+            room, layout = values["room"], values["layout"]
+            body = _COUNTER.sub(f'<b class="amount">{room}</b>', body)
+            if layout is None:
+                # Nothing is behind a run that has just started.
+                body = _REVEALED.sub("", body)
+            else:
+                body = _REVEALED_ROOM.sub(f"Комната: <span>{room - 1}</span>", body)
+                pictures = iter("door_go" if opened else "door_wall" for opened in layout)
+                body = _REVEALED_DOOR.sub(lambda _: next(pictures), body)
+        if "keys" in values:
+            body = _KEYS.sub(rf"\g<1>{values['keys']}", body)
+        if self.options.padding:
+            body = body.replace("</body>", _navigation(self.options.padding) + "</body>", 1)
+        return Reply(body=body)
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Serves a :class:`Site` over HTTP, injecting latency and failures."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], options: Options = Options()):
+        super().__init__(address, _Handler)
+        self.site = Site(options)
+        self.options = options
+        self._chaos = random.Random(options.seed)
+        # Connections accepted so far, to see whether clients keep theirs.
+        self.connections = 0
+
+    def process_request(self, request, client_address) -> None:
+        self.connections += 1
+        super().process_request(request, client_address)
+
+    def handle_error(self, request, client_address) -> None:
+        # A client hanging up mid-response is its business, not a fault here.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logger.debug("%s hung up", client_address[0])
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        """Where the stand-in answers, for ``base_url`` in the bot's config."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self) -> float:
+        """Pick the latency for one response."""
+        low, high = self.options.latency
+        return self._chaos.uniform(low, high) if high > 0 else 0.0
+
+    def failure(self) -> str | None:
+        """Decide whether a request fails: ``"drop"``, ``"error"`` or None."""
+        roll = self._chaos.random()
+        if roll < self.options.drop_rate:
+            return "drop"
+        if roll < self.options.drop_rate + self.options.error_rate:
+            return "error"
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StandinServer
+    # Keep-alive, as the live site allows, so connection reuse is measured.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK and every response gains ~40 ms.
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self._serve()
+
+    def do_POST(self) -> None:
+        self._serve()
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s " + format, self.address_string(), *args)
+
+    def _serve(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8") if length else ""
+        form = {name: values[0] for name, values in parse_qs(raw, keep_blank_values=True).items()}
+
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+        failure = self.server.failure()
+        if failure == "drop":
+            self.close_connection = True
+            return
+        if failure == "error":
+            reply = Reply(500, "<html><body>Internal error</body></html>")
+        else:
+            cookie = SimpleCookie(self.headers.get("Cookie", "")).get(_SESSION_COOKIE)
+            reply = self.server.site.handle(
+                self.command, self.path, form, cookie.value if cookie else None
+            )
+
+        body = reply.body.encode("utf-8")
+        compress = (
+            self.server.options.gzip
+            and body
+            and "gzip" in self.headers.get("Accept-Encoding", "")
+        )
+        if compress:
+            body = gzip.compress(body, compresslevel=6)
+        self.send_response(reply.status)
+        self.send_header("Content-Type", _CONTENT_TYPE)
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in reply.headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _navigation(size: int) -> str:
+    """About ``size`` bytes of menu links, like the live site's page footers."""
+    item = '<div class="nav"><a href="./city">Город</a> | <a href="./mail">Почта</a></div>\n'
+    return item * max(1, size // len(item.encode("utf-8")))
+
+
+def _redirect(location: str) -> Reply:
+    return Reply(302, headers={"Location": location})
+
+
+def _account(value: str) -> tuple[str, str]:
+    username, separator, password = value.partition(":")
+    if not separator or not username or not password:
+        raise argparse.ArgumentTypeError(f"expected NAME:PASSWORD, got {value!r}")
+    return username, password
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for nebo.mobi.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        nargs=2,
+        default=(0.0, 0.0),
+        metavar=("MIN", "MAX"),
+        help="seconds added to every response, drawn uniformly",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share answered with a 500")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of connections cut")
+    parser.add_argument("--pass-chance", type=float, default=0.6, help="odds a middle door opens")
+    parser.add_argument("--keys", type=int, default=1000, help="keys each account starts with")
+    parser.add_argument("--seed", type=int, help="seed for doors and injected failures")
+    parser.add_argument(
+        "--account",
+        type=_account,
+        action="append",
+        metavar="NAME:PASSWORD",
+        help="accept only these credentials (repeatable); default: anyone",
+    )
+    parser.add_argument("--gzip", action="store_true", help="compress pages for clients that ask")
+    parser.add_argument(
+        "--padding", type=int, default=0, help="bytes of menus added to the end of every page"
+    )
+    args = parser.parse_args(argv)
+
+    options = Options(
+        latency=tuple(args.latency),
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        pass_chance=args.pass_chance,
+        keys=args.keys,
+        seed=args.seed,
+        accounts=dict(args.account) if args.account else None,
+        gzip=args.gzip,
+        padding=args.padding,
+    )
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    server = StandinServer((args.host, args.port), options)
+    logger.info("Stand-in for nebo.mobi at %s", server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        site = server.site
+        for username, account in sorted(site.accounts.items()):
+            logger.info(
+                "%s: %d door(s) opened, %d maze(s) won, %d key(s) left",
+                username,
+                account.doors_opened,
+                account.wins,
+                account.keys,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())